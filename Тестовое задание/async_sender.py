@@ -0,0 +1,457 @@
+"""
+Модуль содержит асинхронный клиент для конкурентной отправки СМС
+на основе потоков asyncio.open_connection
+"""
+
+import asyncio
+import time
+from itertools import count, islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator
+
+from balancer import Endpoint, LoadBalancer
+from classes import HttpRequestTemplate, HttpResponseView
+from dedup import RECHECK_DELAY, IdempotencyCache, get_idempotency_key
+from http_reader import read_body_async, read_head_async
+from metrics import Metrics
+from pool import is_keep_alive
+from rate_limit import AimdController, TokenBucket
+from results import DUPLICATE, BulkReport, SendResult
+from retry import RetryPolicy, is_retryable_error
+from segments import MessageGrouper
+from settings import GatewaySettings, Settings, SettingsReloader, connect_async
+
+READ_AHEAD = 1000
+
+RETRY, FRESH, STOP = 0, 1, 2
+
+
+class AsyncSender:
+    """
+    Асинхронный отправщик СМС:
+    host, port - адрес сервера
+    auth_b64 - заголовок Authorization
+    server_url - значение заголовка Host
+    path - путь запроса на отправку СМС
+    concurrency - максимальное число одновременно выполняемых запросов
+        (и открытых соединений)
+    timeout - таймаут одного запроса в секундах
+    queue_size - размер очереди ожидающих отправки сообщений,
+        при её заполнении чтение входных данных приостанавливается
+    rate_limiter - ограничитель скорости отправки
+    controller - адаптивный ограничитель числа одновременных запросов
+        (не больше concurrency)
+    retry_policy - политика повторов при ошибках соединения, 429 и 5xx;
+        ожидающие повтора сообщения не занимают обработчики,
+        а по истечении задержки получают приоритет над новыми
+    metrics - набор метрик, в который записываются длительности этапов
+        запросов, время отправки по кодам ответа, байты и ошибки
+    balancer - балансировщик между несколькими шлюзами; если задан,
+        запросы отправляются выбранному им шлюзу (каждый обработчик держит
+        по соединению с каждым шлюзом), а host, port, auth_b64 и server_url
+        не используются
+    dedup - кэш идемпотентности: повторы недавно доставленных сообщений
+        не отправляются (результат с ошибкой DUPLICATE), копия сообщения,
+        которое ещё отправляется, ждёт его завершения, а запросы получают
+        заголовок Idempotency-Key; ключи вычисляются для каждого получателя
+        отдельно, и в кэше остаются только ключи доставленных сообщений
+    max_recipients - сколько получателей одного и того же сообщения
+        (одинаковые отправитель и текст среди READ_AHEAD подряд идущих
+        записей) объединять в один запрос; результаты всё равно выдаются
+        по каждой записи
+    reloader - перечитывание conf.toml: после изменения файла новые
+        адрес и авторизация шлюзов применяются к следующим запросам
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        auth_b64: str,
+        server_url: str,
+        path: str = "/send_sms",
+        concurrency: int = 100,
+        timeout: float = 10.0,
+        queue_size: int | None = None,
+        rate_limiter: TokenBucket | None = None,
+        controller: AimdController | None = None,
+        retry_policy: RetryPolicy | None = None,
+        metrics: Metrics | None = None,
+        balancer: LoadBalancer | None = None,
+        dedup: IdempotencyCache | None = None,
+        max_recipients: int = 1,
+        reloader: SettingsReloader | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.auth_b64 = auth_b64
+        self.server_url = server_url
+        self.path = path
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.queue_size = queue_size or 2 * concurrency
+        self.rate_limiter = rate_limiter
+        self.controller = controller
+        self.retry_policy = retry_policy
+        self.metrics = metrics
+        self.balancer = balancer
+        self.dedup = dedup
+        self.max_recipients = max_recipients
+        self.reloader = reloader
+        self.template = HttpRequestTemplate(
+            auth_b64, server_url, path, "HTTP/1.1", "application/json"
+        )
+
+    def apply_settings(self, settings: Settings) -> None:
+        """
+        Применяет перечитанные настройки: адрес и авторизацию выбранного шлюза
+        и шлюзов балансировщика (открытые соединения со старыми адресами
+        больше не используются)
+        """
+        gateway: GatewaySettings = settings.gateway
+        self.host = gateway.host
+        self.port = gateway.port
+        self.auth_b64 = gateway.auth_b64
+        self.server_url = gateway.host_header
+        self.path = gateway.send_path
+        self.template = HttpRequestTemplate(
+            self.auth_b64, self.server_url, self.path, "HTTP/1.1", "application/json"
+        )
+        if self.balancer is not None:
+            self.balancer.update(settings.gateways)
+
+    async def _exchange(
+        self,
+        conn: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None,
+        data: list[bytes],
+        host: str,
+        port: int,
+    ) -> tuple[HttpResponseView, tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+        started: float = time.perf_counter()
+        connected: bool = conn is None
+        if conn is None:
+            conn = await asyncio.open_connection(sock=await connect_async(host, port))
+        reader, writer = conn
+        sending: float = time.perf_counter()
+        try:
+            writer.writelines(data)
+            await writer.drain()
+            sent: float = time.perf_counter()
+            head: bytes = await read_head_async(reader)
+            first_byte: float = time.perf_counter()
+            raw: bytes = await read_body_async(reader, head)
+        except BaseException:
+            # в том числе отмена по таймауту wait_for посреди чтения ответа:
+            # соединение, открытое здесь, иначе не закрыл бы никто
+            writer.close()
+            raise
+        read: float = time.perf_counter()
+        response: HttpResponseView = HttpResponseView(raw)
+        if self.metrics is not None:
+            phases: dict[str, float] = {
+                "send": sent - sending,
+                "first_byte": first_byte - sent,
+                "read": read - first_byte,
+                "parse": time.perf_counter() - read,
+            }
+            if connected:
+                phases["connect"] = sending - started
+            self.metrics.observe_phases(**phases)
+            self.metrics.observe_transfer(sum(map(len, data)), len(raw))
+        return response, conn
+
+    async def _send_one(
+        self,
+        conn: tuple[asyncio.StreamReader, asyncio.StreamWriter] | None,
+        index: int,
+        record: tuple[str, str | list[str], str],
+        endpoint: Endpoint | None = None,
+        idempotency_key: str | None = None,
+    ) -> tuple[SendResult, tuple[asyncio.StreamReader, asyncio.StreamWriter] | None]:
+        sender, recipient, message = record
+        template: HttpRequestTemplate = self.template
+        host, port = self.host, self.port
+        if endpoint is not None:
+            template = endpoint.template
+            host, port = endpoint.gateway.host, endpoint.gateway.port
+        started: float = time.perf_counter()
+        try:
+            data: list[bytes] = template.to_chunks(
+                sender, recipient, message, idempotency_key
+            )
+            if self.metrics is not None:
+                self.metrics.observe_phases(serialize=time.perf_counter() - started)
+            response, conn = await asyncio.wait_for(
+                self._exchange(conn, data, host, port), self.timeout
+            )
+        except Exception as e:
+            if conn is not None:
+                conn[1].close()
+            if self.metrics is not None:
+                self.metrics.observe_error(e)
+            return (
+                SendResult(
+                    index,
+                    sender,
+                    recipient,
+                    error=str(e) or type(e).__name__,
+                    latency=time.perf_counter() - started,
+                    retryable=is_retryable_error(e),
+                ),
+                None,
+            )
+        if not is_keep_alive(response):
+            conn[1].close()
+            conn = None
+        latency: float = time.perf_counter() - started
+        if self.metrics is not None:
+            self.metrics.observe_response(response.answer_code, latency)
+        return (
+            SendResult(
+                index,
+                sender,
+                recipient,
+                answer_code=response.answer_code,
+                latency=latency,
+                body=response.body_bytes.decode(),
+            ),
+            conn,
+        )
+
+    async def _attempt(
+        self,
+        conns: dict[tuple[str, int], tuple[asyncio.StreamReader, asyncio.StreamWriter]],
+        index: int,
+        record: tuple[str, str | list[str], str],
+        attempt: int,
+        key: str | None,
+    ) -> SendResult:
+        sender, recipient, _ = record
+        # результат, с которым освобождаются ограничитель и шлюз,
+        # если попытка прервана до получения ответа
+        result: SendResult = SendResult(
+            index, sender, recipient, error="CancelledError", attempts=attempt
+        )
+        controlled: bool = False
+        endpoint: Endpoint | None = None
+        try:
+            if self.controller is not None:
+                await self.controller.acquire()
+                controlled = True
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            if self.reloader is not None:
+                settings: Settings | None = self.reloader.poll()
+                if settings is not None:
+                    self.apply_settings(settings)
+            address: tuple[str, int] = (self.host, self.port)
+            if self.balancer is not None:
+                endpoint = self.balancer.acquire()
+                address = (endpoint.gateway.host, endpoint.gateway.port)
+            result, conn = await self._send_one(
+                conns.pop(address, None), index, record, endpoint, key
+            )
+            if conn is not None:
+                conns[address] = conn
+            result = result._replace(attempts=attempt)
+        except Exception as e:
+            result = SendResult(
+                index,
+                sender,
+                recipient,
+                error=str(e) or type(e).__name__,
+                attempts=attempt,
+                retryable=is_retryable_error(e),
+            )
+        finally:
+            if endpoint is not None:
+                self.balancer.release(endpoint, result)
+            if controlled:
+                await self.controller.release(result)
+        return result
+
+    async def _process(
+        self,
+        item: tuple,
+        queue: asyncio.PriorityQueue,
+        sequence: Iterator[int],
+        conns: dict[tuple[str, int], tuple[asyncio.StreamReader, asyncio.StreamWriter]],
+    ) -> SendResult | None:
+        """
+        Обрабатывает запрос из очереди: проверяет кэш идемпотентности,
+        отправляет запрос и при необходимости планирует повтор
+        :param item: номер, запрос, попытка, время первой попытки
+            и ключи кэша идемпотентности (None - запрос ещё не проверен)
+        :return: результат или None, если запрос снова поставлен в очередь
+        """
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        index, record, attempt, first_started, keys = item
+        if self.dedup is not None and keys is None:
+            reserved = self.dedup.reserve(record)
+            if reserved is None:
+                # копия ждёт, пока оригинал будет доставлен или не доставлен
+                loop.call_later(
+                    RECHECK_DELAY, queue.put_nowait, (RETRY, next(sequence), item)
+                )
+                return None
+            record, keys = reserved
+            first_started = time.monotonic()
+            if not keys:
+                return SendResult(index, record[0], record[1], error=DUPLICATE)
+        try:
+            key: str | None = None
+            if keys:
+                key = get_idempotency_key(HttpRequestTemplate.body_bytes(*record))
+            result: SendResult = await self._attempt(conns, index, record, attempt, key)
+            delay: float | None = None
+            if self.retry_policy is not None:
+                delay = self.retry_policy.next_delay(result, first_started)
+        except BaseException:
+            # зарезервированные ключи не должны навсегда остаться "в отправке"
+            if keys:
+                self.dedup.finish(keys, False)
+            raise
+        if delay is not None:
+            retry = (index, record, attempt + 1, first_started, keys)
+            loop.call_later(delay, queue.put_nowait, (RETRY, next(sequence), retry))
+            return None
+        if keys:
+            self.dedup.finish(keys, result.ok)
+        return result
+
+    async def _worker(
+        self,
+        queue: asyncio.PriorityQueue,
+        results: asyncio.Queue,
+        slots: asyncio.Semaphore,
+        sequence: Iterator[int],
+    ) -> None:
+        # соединения обработчика по адресам шлюзов
+        conns: dict[
+            tuple[str, int], tuple[asyncio.StreamReader, asyncio.StreamWriter]
+        ] = {}
+        try:
+            while True:
+                item: tuple | None = (await queue.get())[2]
+                if item is None:
+                    break
+                result: SendResult | None = None
+                requeued: bool = False
+                try:
+                    result = await self._process(item, queue, sequence, conns)
+                    requeued = result is None
+                except Exception as e:
+                    # ошибка обработки одного запроса не должна останавливать
+                    # обработчик: запрос получает результат с ошибкой
+                    index, (sender, recipient, _), attempt = item[:3]
+                    result = SendResult(
+                        index,
+                        sender,
+                        recipient,
+                        error=str(e) or type(e).__name__,
+                        attempts=attempt,
+                    )
+                finally:
+                    if not requeued:
+                        if result is not None:
+                            await results.put(result)
+                        slots.release()
+        finally:
+            for conn in conns.values():
+                conn[1].close()
+
+    async def _produce(
+        self,
+        records: Iterable[tuple[str, str, str]] | AsyncIterable[tuple[str, str, str]],
+        queue: asyncio.PriorityQueue,
+        slots: asyncio.Semaphore,
+        sequence: Iterator[int],
+    ) -> None:
+        index: int = 0
+
+        async def put(record: tuple[str, str, str]) -> None:
+            await slots.acquire()
+            queue.put_nowait(
+                (FRESH, next(sequence), (index, record, 1, time.monotonic(), None))
+            )
+
+        if isinstance(records, AsyncIterable):
+            async for record in records:
+                await put(record)
+                index += 1
+            return
+        iterator: Iterator[tuple[str, str, str]] = iter(records)
+        while True:
+            # чтение входных данных (файл, stdin) не должно блокировать цикл событий
+            part: list[tuple[str, str, str]] = await asyncio.to_thread(
+                list, islice(iterator, READ_AHEAD)
+            )
+            if not part:
+                return
+            for record in part:
+                await put(record)
+                index += 1
+
+    async def stream(
+        self,
+        records: Iterable[tuple[str, str, str]] | AsyncIterable[tuple[str, str, str]],
+    ) -> AsyncIterator[SendResult]:
+        """
+        Отправляет записи, удерживая в работе не более concurrency запросов,
+        и выдаёт результаты по мере их получения (не в порядке входных данных).
+        Входные данные читаются по мере отправки (не более queue_size
+        необработанных сообщений, включая ожидающие повтора),
+        поэтому потребление памяти не зависит от размера пакета
+        :param records: записи (отправитель, получатель, сообщение)
+        :return: асинхронный итератор результатов
+        """
+        grouper: MessageGrouper = MessageGrouper(self.max_recipients, READ_AHEAD)
+        if isinstance(records, AsyncIterable):
+            records = grouper.group_async(records)
+        else:
+            records = grouper.group(records)
+        queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        results: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        slots: asyncio.Semaphore = asyncio.Semaphore(self.queue_size)
+        sequence: Iterator[int] = count()
+        if self.controller is not None:
+            self.controller.reset()
+        workers: list[asyncio.Task] = [
+            asyncio.create_task(self._worker(queue, results, slots, sequence))
+            for _ in range(self.concurrency)
+        ]
+
+        async def finish() -> None:
+            try:
+                await self._produce(records, queue, slots, sequence)
+                for _ in range(self.queue_size):
+                    await slots.acquire()
+                for _ in workers:
+                    queue.put_nowait((STOP, next(sequence), None))
+                await asyncio.gather(*workers)
+            finally:
+                await results.put(None)
+
+        finisher: asyncio.Task = asyncio.create_task(finish())
+        try:
+            while (result := await results.get()) is not None:
+                for message_result in grouper.expand(result):
+                    yield message_result
+            await finisher
+        finally:
+            finisher.cancel()
+            for worker in workers:
+                worker.cancel()
+
+    async def send(
+        self,
+        records: Iterable[tuple[str, str, str]] | AsyncIterable[tuple[str, str, str]],
+    ) -> BulkReport:
+        """
+        Отправляет все записи, удерживая в работе не более concurrency запросов
+        :param records: записи (отправитель, получатель, сообщение)
+        :return: отчёт с результатами в порядке входных данных
+        """
+        started: float = time.perf_counter()
+        results: list[SendResult] = [result async for result in self.stream(records)]
+        results.sort(key=lambda result: result.index)
+        return BulkReport(results, time.perf_counter() - started)
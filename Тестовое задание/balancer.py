@@ -0,0 +1,202 @@
+"""
+Модуль содержит распределение отправки между несколькими шлюзами:
+выбор шлюза с наименьшим числом выполняемых запросов (с учётом веса)
+или с наименьшей ожидаемой задержкой, исключение шлюзов после серии
+ошибок соединения, 429 и 5xx и возврат их после паузы или проверки доступности
+"""
+
+import threading
+import time
+
+from classes import HttpRequestTemplate
+from rate_limit import is_overload
+from results import SendResult
+from settings import GatewaySettings, connect
+
+STRATEGIES = ("least_outstanding", "latency")
+
+
+class Endpoint:
+    """
+    Шлюз в составе балансировщика:
+    gateway - настройки шлюза (вес берётся из gateway.weight)
+    template - шаблон запроса с заголовками этого шлюза
+    outstanding - число выполняемых запросов
+    latency - сглаженная задержка успешных ответов в секундах
+    failures - число ошибок подряд
+    ejected_until - до какого момента (time.monotonic) шлюз исключён
+    """
+
+    def __init__(self, gateway: GatewaySettings):
+        self.name = gateway.name
+        self.set_gateway(gateway)
+        self.outstanding = 0
+        self.latency: float | None = None
+        self.failures = 0
+        self.ejected_until = 0.0
+
+    def set_gateway(self, gateway: GatewaySettings) -> None:
+        """
+        Задаёт настройки шлюза (адрес, авторизацию и вес)
+        """
+        self.gateway = gateway
+        self.weight = gateway.weight
+        self.template = HttpRequestTemplate(
+            gateway.auth_b64,
+            gateway.host_header,
+            gateway.send_path,
+            "HTTP/1.1",
+            "application/json",
+        )
+
+    def is_ejected(self, now: float) -> bool:
+        """
+        Проверяет, исключён ли шлюз в момент now
+        """
+        return self.ejected_until > now
+
+
+class LoadBalancer:
+    """
+    Балансировщик отправки между шлюзами, безопасный для использования
+    из нескольких потоков:
+    gateways - настройки шлюзов
+    strategy - "least_outstanding" (меньше всего выполняемых запросов
+        на единицу веса) или "latency" (меньше всего сглаженная задержка,
+        умноженная на число выполняемых запросов, на единицу веса)
+    eject_after - после скольких ошибок подряд (ошибка соединения, 429, 5xx)
+        шлюз исключается
+    eject_time - на сколько секунд шлюз исключается; после паузы
+        он снова получает запросы, но исключается уже после первой ошибки
+    Если исключены все шлюзы, запросы получает тот, что исключён раньше всех
+    """
+
+    def __init__(
+        self,
+        gateways: list[GatewaySettings],
+        strategy: str = "least_outstanding",
+        eject_after: int = 5,
+        eject_time: float = 30.0,
+    ):
+        if not gateways:
+            raise ValueError("Load balancer needs at least one gateway")
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown load balancing strategy {strategy!r}")
+        self.endpoints: list[Endpoint] = [Endpoint(gateway) for gateway in gateways]
+        self.strategy = strategy
+        self.eject_after = eject_after
+        self.eject_time = eject_time
+        self._turn = 0
+        self._lock = threading.Lock()
+        self._stopped: threading.Event | None = None
+
+    def __getstate__(self) -> dict:
+        state: dict = self.__dict__.copy()
+        del state["_lock"]
+        state["_stopped"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _score(self, endpoint: Endpoint) -> float:
+        load: float = (endpoint.outstanding + 1) / endpoint.weight
+        if self.strategy == "latency":
+            # шлюзы без замеров получают запросы первыми
+            return load * (endpoint.latency or 0.0)
+        return load
+
+    def acquire(self) -> Endpoint:
+        """
+        Выбирает шлюз для очередного запроса и учитывает запрос как выполняемый
+        """
+        with self._lock:
+            now: float = time.monotonic()
+            # обход начинается с разных шлюзов, чтобы при равной оценке
+            # запросы распределялись по кругу
+            self._turn = (self._turn + 1) % len(self.endpoints)
+            ordered: list[Endpoint] = (
+                self.endpoints[self._turn :] + self.endpoints[: self._turn]
+            )
+            healthy: list[Endpoint] = [
+                endpoint for endpoint in ordered if not endpoint.is_ejected(now)
+            ]
+            if healthy:
+                chosen: Endpoint = min(healthy, key=self._score)
+            else:
+                chosen = min(ordered, key=lambda endpoint: endpoint.ejected_until)
+            chosen.outstanding += 1
+            return chosen
+
+    def release(self, endpoint: Endpoint, result: SendResult) -> None:
+        """
+        Завершает запрос к шлюзу и обновляет его состояние по результату
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if not is_overload(result):
+                endpoint.failures = 0
+                if endpoint.latency is None:
+                    endpoint.latency = result.latency
+                else:
+                    endpoint.latency += (result.latency - endpoint.latency) * 0.2
+                return
+            endpoint.failures += 1
+            now: float = time.monotonic()
+            if endpoint.failures >= self.eject_after and not endpoint.is_ejected(now):
+                endpoint.ejected_until = now + self.eject_time
+                # после паузы шлюз исключается снова уже после первой ошибки
+                endpoint.failures = self.eject_after - 1
+
+    def update(self, gateways: dict[str, GatewaySettings]) -> None:
+        """
+        Применяет перечитанные настройки шлюзов (по именам);
+        состояние шлюзов (ошибки, задержка, исключение) сохраняется
+        """
+        with self._lock:
+            for endpoint in self.endpoints:
+                gateway: GatewaySettings | None = gateways.get(endpoint.name)
+                if gateway is not None and gateway != endpoint.gateway:
+                    endpoint.set_gateway(gateway)
+
+    def check_health(self, timeout: float = 1.0) -> None:
+        """
+        Проверяет доступность исключённых шлюзов (TCP подключение)
+        и возвращает доступные, не дожидаясь окончания паузы
+        """
+        now: float = time.monotonic()
+        with self._lock:
+            ejected: list[Endpoint] = [
+                endpoint for endpoint in self.endpoints if endpoint.is_ejected(now)
+            ]
+        for endpoint in ejected:
+            try:
+                connect(endpoint.gateway.host, endpoint.gateway.port, timeout).close()
+            except OSError:
+                continue
+            with self._lock:
+                endpoint.ejected_until = 0.0
+
+    def start_health_checks(self, interval: float = 5.0) -> None:
+        """
+        Запускает периодическую проверку исключённых шлюзов в отдельном потоке
+        """
+        if self._stopped is not None:
+            return
+        stopped: threading.Event = threading.Event()
+        self._stopped = stopped
+
+        def run() -> None:
+            while not stopped.wait(interval):
+                self.check_health()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop_health_checks(self) -> None:
+        """
+        Останавливает периодическую проверку шлюзов
+        """
+        if self._stopped is not None:
+            self._stopped.set()
+            self._stopped = None
@@ -0,0 +1,93 @@
+"""
+Модуль содержит компактный колоночный контейнер для больших пакетов СМС:
+отправители, получатели и тексты хранятся в непрерывных буферах байт
+со смещениями в array, а не отдельными объектами на каждое сообщение
+"""
+
+import json
+from array import array
+from json.encoder import encode_basestring
+from typing import Iterable, Iterator
+
+from classes import HttpRequestTemplate
+
+
+class StringColumn:
+    """
+    Колонка строк: данные всех значений подряд в одном bytearray
+    и границы значений в массиве смещений
+    """
+
+    __slots__ = ("data", "offsets")
+
+    def __init__(self):
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+
+    def append(self, value: bytes) -> None:
+        """
+        Добавляет значение в конец колонки
+        """
+        self.data += value
+        self.offsets.append(len(self.data))
+
+    def __getitem__(self, index: int) -> bytes:
+        return bytes(self.data[self.offsets[index] : self.offsets[index + 1]])
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+
+class MessageBatch:
+    """
+    Колоночный пакет сообщений (отправитель, получатель, текст).
+    Значения хранятся уже закодированными в JSON, поэтому тело запроса
+    собирается из колонок простым склеиванием байт, без json.dumps
+    """
+
+    __slots__ = ("senders", "recipients", "messages")
+
+    def __init__(self, records: Iterable[tuple[str, str, str]] = ()):
+        self.senders = StringColumn()
+        self.recipients = StringColumn()
+        self.messages = StringColumn()
+        for sender, recipient, message in records:
+            self.append(sender, recipient, message)
+
+    def append(self, sender: str, recipient: str, message: str) -> None:
+        """
+        Добавляет сообщение в пакет
+        """
+        self.senders.append(encode_basestring(sender).encode())
+        self.recipients.append(encode_basestring(recipient).encode())
+        self.messages.append(encode_basestring(message).encode())
+
+    def __len__(self) -> int:
+        return len(self.senders)
+
+    def __getitem__(self, index: int) -> tuple[str, str, str]:
+        return (
+            json.loads(self.senders[index]),
+            json.loads(self.recipients[index]),
+            json.loads(self.messages[index]),
+        )
+
+    def __iter__(self) -> Iterator[tuple[str, str, str]]:
+        for index in range(len(self)):
+            yield self[index]
+
+    def body_bytes(self, index: int) -> bytes:
+        """
+        Формирует тело запроса для сообщения с номером index
+        """
+        return HttpRequestTemplate.join_body(
+            self.senders[index], self.recipients[index], self.messages[index]
+        )
+
+    def iter_requests(self, template: HttpRequestTemplate) -> Iterator[list[bytes]]:
+        """
+        Последовательно формирует запросы для всех сообщений пакета
+        в виде списков частей (см. HttpRequestTemplate.to_chunks)
+        """
+        for index in range(len(self)):
+            yield template.body_chunks(self.body_bytes(index))
@@ -0,0 +1,653 @@
+"""
+Модуль содержит бенчмарки клиента отправки СМС: формирование и разбор
+сообщений, память, логирование, сквозная пропускная способность
+через локальный тестовый сервер и время запуска командной строки.
+Запуск: python bench.py [--output results.json] [--baseline baseline.json]
+Отчёт о времени импорта модулей: python bench.py --importtime
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Callable, NamedTuple
+
+from batch import MessageBatch
+from classes import HttpRequest, HttpRequestTemplate, HttpResponse, HttpResponseView
+from log_setup import TEXT_FORMAT, setup_logging, stop_logging
+from main import send_bulk, send_bulk_async
+from mock_server import MockGateway
+from results import BulkReport
+from segments import get_segment_info
+
+AUTH_B64 = "YWRtaW46YWRtaW4="
+HOST = "http://localhost:4010"
+
+RESPONSE_BYTES = (
+    b"HTTP/1.1 200 OK\r\n"
+    b"Access-Control-Allow-Origin: *\r\n"
+    b"Access-Control-Allow-Headers: *\r\n"
+    b"Access-Control-Allow-Credentials: true\r\n"
+    b"Access-Control-Expose-Headers: *\r\n"
+    b"Content-Type: application/json\r\n"
+    b"Content-Length: 46\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Keep-Alive: timeout=5\r\n"
+    b"\r\n"
+    b'{"status": "success", "message_id": "0000001"}'
+)
+
+
+MANY_HEADERS = {f"X-Custom-Header-{index}": "value" * 4 for index in range(100)}
+
+# ~64 КБ в UTF-8: 9 кириллических символов по 2 байта и пробел на повтор
+LARGE_TEXT = "Сообщение " * 3449
+
+HIGHER_IS_BETTER = ("msg/s", "ops/s")
+
+SUITES = ["serialization", "parsing", "memory", "logging", "end_to_end", "startup"]
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_COMMANDS = {
+    "interpreter": ["-c", "pass"],
+    "import main": ["-c", "import main"],
+    "single --help": ["main.py", "--help"],
+    "bulk --help": ["main.py", "--input", "-", "--help"],
+}
+
+
+class BenchResult(NamedTuple):
+    """
+    Результат одного замера:
+    suite - группа бенчмарков
+    case - название замера
+    value - значение
+    unit - единица измерения
+    """
+
+    suite: str
+    case: str
+    value: float
+    unit: str
+
+    @property
+    def higher_is_better(self) -> bool:
+        """
+        Признак того, что большее значение лучше (скорость, а не время и память)
+        """
+        return self.unit in HIGHER_IS_BETTER
+
+
+def make_response_bytes(extra_headers: dict[str, str], body: str) -> bytes:
+    """
+    Формирует байты ответа сервера с заданными заголовками и телом
+    """
+    return HttpResponse(
+        "HTTP/1.1",
+        "200 OK",
+        "*",
+        "*",
+        "true",
+        "*",
+        "application/json",
+        "keep-alive",
+        "timeout=5",
+        body,
+        extra_headers,
+    ).to_bytes()
+
+
+class LegacyHttpRequest:
+    """
+    Копия HttpRequest до введения __slots__ и sys.intern (только хранение
+    данных) - база для сравнения памяти: у экземпляров есть __dict__,
+    строки заголовков не разделяются, пустые extra_headers не общие
+    """
+
+    def __init__(
+        self,
+        auth_b64: str,
+        host: str,
+        sender: str,
+        recipient: str,
+        message: str,
+        path: str,
+        protocol: str,
+        content_type: str,
+        extra_headers: dict[str, str] | None = None,
+    ):
+        self.path = path
+        self.protocol = protocol
+        self.body_bytes = json.dumps(
+            {"sender": sender, "recipient": recipient, "message": message}
+        ).encode()
+        self.auth_b64 = auth_b64
+        self.host = host
+        self.content_type = content_type
+        self.extra_headers = extra_headers or {}
+
+
+class LegacyHttpResponse:
+    """
+    Копия HttpResponse до введения __slots__ и sys.intern
+    (разбор ответа тот же, что у HttpResponse.from_bytes)
+    """
+
+    KNOWN_HEADERS = HttpResponse.KNOWN_HEADERS
+
+    def __init__(
+        self,
+        protocol: str,
+        answer_code: str,
+        acc_control_allow_origin: str,
+        acc_control_allow_headers: str,
+        acc_control_allow_cred: str,
+        acc_control_expose_headers: str,
+        content_type: str,
+        connection: str,
+        keep_alive: str,
+        body: str,
+        extra_headers: dict[str, str] | None = None,
+    ):
+        self.protocol = protocol
+        self.answer_code = answer_code
+        self.acc_control_allow_origin = acc_control_allow_origin
+        self.acc_control_allow_headers = acc_control_allow_headers
+        self.acc_control_allow_cred = acc_control_allow_cred
+        self.acc_control_expose_headers = acc_control_expose_headers
+        self.content_type = content_type
+        self.connection = connection
+        self.keep_alive = keep_alive
+        self.body_bytes = body.encode()
+        self.extra_headers = extra_headers or {}
+
+    from_bytes = classmethod(HttpResponse.from_bytes.__func__)
+
+
+def bench_serialization(number: int = 100_000) -> dict[str, float]:
+    """
+    Сравнивает скорость формирования запросов:
+    HttpRequest(...).to_bytes() и шаблон HttpRequestTemplate,
+    а также подсчёта сегментов SMS (без кэша)
+    :param number: количество формируемых запросов
+    :return: словарь {способ: сообщений в секунду}
+    """
+    template: HttpRequestTemplate = HttpRequestTemplate(
+        AUTH_B64, HOST, "/send_sms", "HTTP/1.1", "application/json"
+    )
+    buffer: bytearray = bytearray()
+    recipients: list[str] = [f"7911111{i:04}" for i in range(10)]
+
+    def write_into() -> None:
+        buffer.clear()
+        template.write_into(buffer, "79000000000", "79111111111", "Hello")
+
+    cases: dict = {
+        "HttpRequest.to_bytes": lambda: HttpRequest(
+            AUTH_B64,
+            HOST,
+            "79000000000",
+            "79111111111",
+            "Hello",
+            "/send_sms",
+            "HTTP/1.1",
+            "application/json",
+        ).to_bytes(),
+        "HttpRequestTemplate.to_bytes": lambda: template.to_bytes(
+            "79000000000", "79111111111", "Hello"
+        ),
+        "HttpRequestTemplate.to_chunks": lambda: template.to_chunks(
+            "79000000000", "79111111111", "Hello"
+        ),
+        "HttpRequestTemplate.write_into": write_into,
+        "HttpRequestTemplate.to_bytes (10 recipients)": lambda: template.to_bytes(
+            "79000000000", recipients, "Hello"
+        ),
+        "get_segment_info": lambda: get_segment_info.__wrapped__(
+            "Привет, мир! Ваш код подтверждения: 1234"
+        ),
+    }
+    return {
+        name: number / min(timeit.repeat(case, number=number, repeat=3))
+        for name, case in cases.items()
+    }
+
+
+def bench_parsing(number: int = 20_000) -> dict[str, float]:
+    """
+    Измеряет скорость создания запросов и разбора запросов и ответов
+    на типичных сообщениях и на неудобных для разбора:
+    со 100 дополнительными заголовками и с телом ~64 КБ
+    (для них выполняется в 20 раз меньше повторов)
+    :param number: количество операций для типичных сообщений
+    :return: словарь {замер: операций в секунду}
+    """
+
+    def request(message: str, extra_headers: dict[str, str] | None = None) -> bytes:
+        return HttpRequest(
+            AUTH_B64,
+            HOST,
+            "79000000000",
+            "79111111111",
+            message,
+            "/send_sms",
+            "HTTP/1.1",
+            "application/json",
+            extra_headers,
+        ).to_bytes()
+
+    typical_response: bytes = make_response_bytes(
+        {}, '{"status": "success", "message_id": "0000001"}'
+    )
+    many_headers_response: bytes = make_response_bytes(
+        MANY_HEADERS, '{"status": "success", "message_id": "0000001"}'
+    )
+    large_body_response: bytes = make_response_bytes(
+        {}, json.dumps({"error": LARGE_TEXT}, ensure_ascii=False)
+    )
+    typical_request: bytes = request("Hello")
+
+    many_headers_request: bytes = request("Hello", MANY_HEADERS)
+    large_body_request: bytes = request(LARGE_TEXT)
+
+    def view_fields() -> tuple[str, str | None]:
+        view: HttpResponseView = HttpResponseView(typical_response)
+        return view.connection, view.message_id
+
+    cases: dict[str, tuple[Callable[[], object], int]] = {
+        "HttpRequest.__init__": (
+            lambda: HttpRequest(
+                AUTH_B64,
+                HOST,
+                "79000000000",
+                "79111111111",
+                "Hello",
+                "/send_sms",
+                "HTTP/1.1",
+                "application/json",
+            ),
+            number,
+        ),
+        "HttpRequest.from_bytes": (
+            lambda: HttpRequest.from_bytes(typical_request),
+            number,
+        ),
+        "HttpRequest.from_bytes, 100 headers": (
+            lambda: HttpRequest.from_bytes(many_headers_request),
+            number // 20,
+        ),
+        "HttpRequest.from_bytes, 64 KB body": (
+            lambda: HttpRequest.from_bytes(large_body_request),
+            number // 20,
+        ),
+        "HttpResponse.from_bytes": (
+            lambda: HttpResponse.from_bytes(typical_response),
+            number,
+        ),
+        "HttpResponse.from_bytes, 100 headers": (
+            lambda: HttpResponse.from_bytes(many_headers_response),
+            number // 20,
+        ),
+        "HttpResponse.from_bytes, 64 KB body": (
+            lambda: HttpResponse.from_bytes(large_body_response),
+            number // 20,
+        ),
+        "HttpResponseView": (
+            lambda: HttpResponseView(typical_response),
+            number,
+        ),
+        "HttpResponseView, 100 headers": (
+            lambda: HttpResponseView(many_headers_response),
+            number // 20,
+        ),
+        "HttpResponseView, 64 KB body": (
+            lambda: HttpResponseView(large_body_response),
+            number // 20,
+        ),
+        "HttpResponseView + Connection + message_id": (view_fields, number),
+    }
+    return {
+        name: repeats / min(timeit.repeat(case, number=repeats, repeat=3))
+        for name, (case, repeats) in cases.items()
+    }
+
+
+def bench_end_to_end(number: int = 5_000) -> dict[str, BulkReport]:
+    """
+    Измеряет сквозную отправку через тестовый сервер (mock_server.py),
+    запущенный в этом же процессе в отдельном потоке:
+    последовательно по одному соединению, пулом из 10 потоков
+    и асинхронным клиентом со 100 одновременными запросами.
+    Сервер и клиент делят один GIL, поэтому абсолютные значения ниже,
+    чем при отдельном сервере, но подходят для сравнения между версиями
+    :param number: количество сообщений в каждом режиме
+    :return: словарь {режим: отчёт об отправке}
+    """
+    records: list[tuple[str, str, str]] = [
+        ("79000000000", f"79{index:09}", f"Message number {index}")
+        for index in range(number)
+    ]
+    gateway: MockGateway = MockGateway().start_in_thread()
+    config: dict[str, dict[str, str]] = {
+        "test_sms_sender": {
+            "server_url": f"http://127.0.0.1:{gateway.port}",
+            "user": "admin",
+            "password": "admin",
+        }
+    }
+    try:
+        return {
+            "sequential": send_bulk(records, config, pool_size=1),
+            "pooled": send_bulk(records, config, pool_size=10),
+            "concurrent": send_bulk_async(records, config, concurrency=100),
+        }
+    finally:
+        gateway.stop_thread()
+
+
+def measure_memory(build: Callable[[], object]) -> int:
+    """
+    Измеряет объём памяти, занятой результатом build()
+    :return: размер в байтах
+    """
+    gc.collect()
+    tracemalloc.start()
+    result: object = build()
+    size: int = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return size
+
+
+def bench_memory(number: int = 100_000) -> dict[str, float]:
+    """
+    Сравнивает память на одно сообщение при хранении пакета:
+    запросы и ответы с __dict__ и со __slots__, колоночный MessageBatch
+    :param number: количество сообщений в пакете
+    :return: словарь {способ: байт на сообщение}
+    """
+    records: list[tuple[str, str, str]] = [
+        ("79000000000", f"79{index:09}", f"Message number {index}")
+        for index in range(number)
+    ]
+
+    def requests(request_cls: type) -> Callable[[], object]:
+        return lambda: [
+            request_cls(
+                AUTH_B64,
+                HOST,
+                sender,
+                recipient,
+                message,
+                "/send_sms",
+                "HTTP/1.1",
+                "application/json",
+            )
+            for sender, recipient, message in records
+        ]
+
+    def responses(response_cls: type) -> Callable[[], object]:
+        return lambda: [response_cls.from_bytes(RESPONSE_BYTES) for _ in records]
+
+    cases: dict[str, Callable[[], object]] = {
+        "HttpRequest (__dict__)": requests(LegacyHttpRequest),
+        "HttpRequest (__slots__)": requests(HttpRequest),
+        "MessageBatch": lambda: MessageBatch(records),
+        "HttpResponse (__dict__)": responses(LegacyHttpResponse),
+        "HttpResponse (__slots__)": responses(HttpResponse),
+    }
+    return {name: measure_memory(case) / number for name, case in cases.items()}
+
+
+def bench_logging(number: int = 50_000) -> dict[str, float]:
+    """
+    Сравнивает время, которое занимает вызов logging.info в потоке отправки:
+    синхронная запись в файл (как logging.basicConfig) и запись через очередь,
+    в том числе с выборкой 1% записей об успешной отправке
+    :param number: количество записей
+    :return: словарь {способ: микросекунд на запись}
+    """
+    root: logging.Logger = logging.getLogger()
+    saved_handlers: list[logging.Handler] = root.handlers[:]
+    root.handlers.clear()
+    root.setLevel(logging.INFO)
+
+    def log_messages() -> float:
+        started: float = timeit.default_timer()
+        for index in range(number):
+            logging.info(
+                "Sender: %s, Recipient: %s, Message: %s",
+                "79000000000",
+                index,
+                "Hello",
+                extra={"success": True},
+            )
+        return (timeit.default_timer() - started) / number * 1_000_000
+
+    timings: dict[str, float] = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            handler: logging.Handler = logging.FileHandler(
+                os.path.join(tmp, "sync.log")
+            )
+            handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+            root.addHandler(handler)
+            timings["FileHandler (basicConfig)"] = log_messages()
+            root.removeHandler(handler)
+            handler.close()
+            for name, rate in (
+                ("QueueHandler", 1.0),
+                ("QueueHandler, 1% sample", 0.01),
+            ):
+                # как в main.start_logging: приложение владеет процессом
+                listener = setup_logging(
+                    os.path.join(tmp, f"queue{rate}.log"),
+                    success_sample_rate=rate,
+                    lean_records=True,
+                )
+                timings[name] = log_messages()
+                stop_logging(listener)
+    finally:
+        root.handlers[:] = saved_handlers
+    return timings
+
+
+def bench_startup(number: int = 20) -> dict[str, float]:
+    """
+    Измеряет время запуска командной строки в новом процессе интерпретатора
+    (лучшее из number запусков, чтобы исключить влияние других процессов).
+    Разница с "interpreter" - время импорта модулей клиента
+    :param number: количество запусков каждой команды
+    :return: словарь {команда: время в миллисекундах}
+    """
+    timings: dict[str, float] = {}
+    for case, command in STARTUP_COMMANDS.items():
+        best: float = float("inf")
+        for _ in range(number):
+            started: float = time.perf_counter()
+            subprocess.run(
+                [sys.executable, *command],
+                cwd=SCRIPT_DIR,
+                stdout=subprocess.DEVNULL,
+                check=True,
+            )
+            best = min(best, time.perf_counter() - started)
+        timings[case] = best * 1000
+    return timings
+
+
+def import_time_report(
+    module: str = "main", top: int = 15
+) -> list[tuple[str, int, int]]:
+    """
+    Запускает python -X importtime и возвращает самые долгие импорты
+    :param module: импортируемый модуль
+    :param top: сколько импортов вернуть
+    :return: список (модуль, собственное время, время с вложенными импортами)
+        в микросекундах, по убыванию собственного времени
+    """
+    completed: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imports: list[tuple[str, int, int]] = []
+    for line in completed.stderr.splitlines():
+        own, _, rest = line.removeprefix("import time:").partition("|")
+        cumulative, _, name = rest.partition("|")
+        try:
+            imports.append((name.strip(), int(own), int(cumulative)))
+        except ValueError:
+            continue  # строка заголовка
+    imports.sort(key=lambda item: item[1], reverse=True)
+    return imports[:top]
+
+
+def run_benchmarks(suites: list[str], scale: float = 1.0) -> list[BenchResult]:
+    """
+    Выполняет выбранные группы бенчмарков
+    :param suites: названия групп: serialization, parsing, memory,
+        logging, end_to_end, startup
+    :param scale: множитель количества повторов (например, 0.1 для быстрой проверки)
+    :return: список результатов
+    """
+    simple: dict[str, tuple[Callable[[int], dict[str, float]], int, str]] = {
+        "serialization": (bench_serialization, 100_000, "msg/s"),
+        "parsing": (bench_parsing, 20_000, "ops/s"),
+        "memory": (bench_memory, 100_000, "B/msg"),
+        "logging": (bench_logging, 50_000, "us/record"),
+    }
+    results: list[BenchResult] = []
+    for suite in suites:
+        if suite == "end_to_end":
+            reports: dict[str, BulkReport] = bench_end_to_end(
+                max(100, int(5_000 * scale))
+            )
+            for mode, report in reports.items():
+                results.append(BenchResult(suite, mode, report.throughput, "msg/s"))
+                for percent in (50, 95, 99):
+                    results.append(
+                        BenchResult(
+                            suite,
+                            f"{mode} p{percent}",
+                            report.latency_percentile(percent) * 1000,
+                            "ms",
+                        )
+                    )
+            continue
+        if suite == "startup":
+            for case, value in bench_startup(max(3, int(20 * scale))).items():
+                results.append(BenchResult(suite, case, value, "ms"))
+            continue
+        bench, number, unit = simple[suite]
+        for case, value in bench(max(100, int(number * scale))).items():
+            results.append(BenchResult(suite, case, value, unit))
+    return results
+
+
+def save_results(results: list[BenchResult], path: str) -> None:
+    """
+    Записывает результаты в JSON вместе со сведениями об окружении
+    """
+    data: dict = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": [result._asdict() for result in results],
+    }
+    with open(path, "w", encoding="utf-8") as file:
+        json.dump(data, file, ensure_ascii=False, indent=2)
+
+
+def load_results(path: str) -> list[BenchResult]:
+    """
+    Читает результаты, записанные save_results
+    """
+    with open(path, encoding="utf-8") as file:
+        return [BenchResult(**result) for result in json.load(file)["results"]]
+
+
+def compare_with_baseline(
+    results: list[BenchResult], baseline: list[BenchResult], tolerance: float = 0.1
+) -> list[str]:
+    """
+    Сравнивает результаты с сохранёнными ранее
+    :param results: текущие результаты
+    :param baseline: базовые результаты
+    :param tolerance: допустимое относительное ухудшение (0.1 - 10%)
+    :return: описания замеров, ухудшившихся больше допустимого
+    """
+    base_values: dict[tuple[str, str], float] = {
+        (result.suite, result.case): result.value for result in baseline
+    }
+    regressions: list[str] = []
+    for result in results:
+        base: float | None = base_values.get((result.suite, result.case))
+        if not base:
+            continue
+        change: float = result.value / base - 1
+        if result.higher_is_better:
+            change = -change
+        if change > tolerance:
+            regressions.append(
+                f"{result.suite}/{result.case}: {base:,.2f} -> "
+                f"{result.value:,.2f} {result.unit} ({change:+.0%} worse)"
+            )
+    return regressions
+
+
+def get_bench_args() -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки бенчмарков
+    """
+    parser = argparse.ArgumentParser(description="Бенчмарки клиента отправки смс")
+    parser.add_argument(
+        "--suite",
+        action="append",
+        choices=SUITES,
+        help="группа бенчмарков (можно указать несколько раз), по умолчанию все",
+    )
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("-o", "--output", help="файл JSON для результатов")
+    parser.add_argument("-b", "--baseline", help="файл JSON с базовыми результатами")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument(
+        "--importtime",
+        action="store_true",
+        help="вывести самые долгие импорты main.py и завершить работу",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args: argparse.Namespace = get_bench_args()
+    if args.importtime:
+        print(f"{'module':<40} {'self, us':>10} {'cumulative, us':>15}")
+        for name, own, cumulative in import_time_report():
+            print(f"{name:<40} {own:>10} {cumulative:>15}")
+        sys.exit(0)
+    bench_results: list[BenchResult] = run_benchmarks(args.suite or SUITES, args.scale)
+    for bench_result in bench_results:
+        print(
+            f"{bench_result.suite + '/' + bench_result.case:<50} "
+            f"{bench_result.value:>14,.2f} {bench_result.unit}"
+        )
+    if args.output:
+        save_results(bench_results, args.output)
+    if args.baseline:
+        found: list[str] = compare_with_baseline(
+            bench_results, load_results(args.baseline), args.tolerance
+        )
+        for line in found:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
@@ -8,7 +8,92 @@
 """
 
 import json
-from typing import Self
+import sys
+from json.encoder import encode_basestring
+from types import MappingProxyType
+from typing import Mapping, Self
+
+NO_HEADERS: Mapping[str, str] = MappingProxyType({})
+
+
+def encode_recipient(recipient: str | list[str]) -> str:
+    """
+    Кодирует в JSON получателя или список получателей (запрос сразу
+    на несколько номеров) так же, как json.dumps с ensure_ascii=False
+    """
+    if isinstance(recipient, str):
+        return encode_basestring(recipient)
+    return "[" + ", ".join(map(encode_basestring, recipient)) + "]"
+
+
+def parse_http_message(
+    binary_data: bytes,
+) -> tuple[list[str], dict[str, tuple[str, str]], bytes]:
+    """
+    Разбирает HTTP сообщение за один проход:
+    стартовая строка разбивается на части,
+    заголовки собираются в словарь по имени в нижнем регистре
+    (повторяющиеся заголовки объединяются через запятую),
+    тело возвращается без декодирования
+    :param binary_data: байты HTTP сообщения
+    :return: части стартовой строки,
+        словарь {имя в нижнем регистре: (исходное имя, значение)}, тело
+    """
+    head, separator, body = binary_data.partition(b"\r\n\r\n")
+    if not separator:
+        raise ValueError("Malformed HTTP message: no end of headers")
+    lines: list[bytes] = head.split(b"\r\n")
+    start_line: list[str] = lines[0].decode().split(" ", 2)
+    if len(start_line) < 2 or not all(start_line[:2]):
+        raise ValueError(f"Malformed HTTP start line: {lines[0]!r}")
+    headers: dict[str, tuple[str, str]] = {}
+    for line in lines[1:]:
+        name, colon, value = line.partition(b":")
+        if not colon or not name or name != name.strip():
+            raise ValueError(f"Malformed HTTP header line: {line!r}")
+        name_str: str = name.decode()
+        key: str = name_str.lower()
+        value_str: str = value.strip().decode()
+        if key in headers:
+            value_str = f"{headers[key][1]}, {value_str}"
+        headers[key] = (name_str, value_str)
+    if "content-length" in headers:
+        length: str = headers["content-length"][1]
+        if not length.isdigit():
+            raise ValueError(f"Malformed Content-Length: {length!r}")
+        if len(body) < int(length):
+            raise ValueError(
+                f"Truncated HTTP body: expected {length} bytes, got {len(body)}"
+            )
+    return start_line, headers, body
+
+
+def get_extra_headers(
+    headers: dict[str, tuple[str, str]], known: tuple[str, ...]
+) -> dict[str, str]:
+    """
+    Возвращает заголовки, не описанные атрибутами класса, с исходными именами
+    :param headers: заголовки, полученные из parse_http_message
+    :param known: имена известных заголовков в нижнем регистре
+    :return: словарь {исходное имя: значение}
+    """
+    return {name: value for key, (name, value) in headers.items() if key not in known}
+
+
+def format_extra_headers(extra_headers: Mapping[str, str]) -> str:
+    """
+    Формирует строки дополнительных заголовков для HTTP сообщения
+    """
+    return "".join(f"{name}: {value}\r\n" for name, value in extra_headers.items())
+
+
+def format_idempotency_key(idempotency_key: str | None) -> str:
+    """
+    Формирует строку заголовка Idempotency-Key (пустую, если ключа нет)
+    """
+    if idempotency_key is None:
+        return ""
+    return f"Idempotency-Key: {idempotency_key}\r\n"
 
 
 class HttpRequest:
@@ -22,34 +107,56 @@ class HttpRequest:
     content_type - тип данных тела запроса
     тело запроса:
     sender - отправительб
-    recipient - получатель,
+    recipient - получатель или список получателей,
     message - сообщение
+    extra_headers - прочие заголовки запроса
+    Экземпляры не имеют __dict__, а повторяющиеся у всех запросов значения
+    заголовков интернируются, что уменьшает память при хранении больших пакетов
     """
 
+    __slots__ = (
+        "path",
+        "protocol",
+        "body_bytes",
+        "auth_b64",
+        "host",
+        "content_type",
+        "extra_headers",
+    )
+
+    KNOWN_HEADERS = ("host", "authorization", "content-type", "content-length")
+
     def __init__(
         self,
         auth_b64: str,
         host: str,
         sender: str,
-        recipient: str,
+        recipient: str | list[str],
         message: str,
         path: str,
         protocol: str,
         content_type: str,
+        extra_headers: Mapping[str, str] | None = None,
     ):
-        self.path = path
-        self.protocol = protocol
+        self.path = sys.intern(path)
+        self.protocol = sys.intern(protocol)
+        # тело в UTF-8 без экранирования \uXXXX: кириллица занимает
+        # 2 байта на символ вместо 6
         self.body_bytes = json.dumps(
-            {"sender": sender, "recipient": recipient, "message": message}
+            {"sender": sender, "recipient": recipient, "message": message},
+            ensure_ascii=False,
         ).encode()
-        self.auth_b64 = auth_b64
-        self.host = host
-        self.content_type = content_type
+        self.auth_b64 = sys.intern(auth_b64)
+        self.host = sys.intern(host)
+        self.content_type = sys.intern(content_type)
+        self.extra_headers = extra_headers or NO_HEADERS
 
-    def to_bytes(self) -> bytes:
+    def to_bytes(self, idempotency_key: str | None = None) -> bytes:
         """
         Создает HTTP запрос из данных,
         сохранённых в экземпляре класса
+        :param idempotency_key: значение заголовка Idempotency-Key
+            (см. dedup.get_idempotency_key) или None
         """
         headers: list[str] = [
             f"POST {self.path} {self.protocol}\r\n"
@@ -57,6 +164,8 @@ class HttpRequest:
             f"Authorization: Basic {self.auth_b64}\r\n"
             f"Content-Type: {self.content_type}\r\n"
             f"Content-Length: {len(self.body_bytes)}\r\n"
+            f"{format_idempotency_key(idempotency_key)}"
+            f"{format_extra_headers(self.extra_headers)}"
             "\r\n"
         ]
         return ("".join(headers)).encode() + self.body_bytes
@@ -66,39 +175,156 @@ class HttpRequest:
         """
         Преобразует последовательность байт в объект HTTP-запроса
         """
-        http_parts: list[str] = binary_data.decode().split("\r\n")
-        headers: dict[str, str] = {
-            "post": "",
-            "host": "",
-            "authorization": "",
-            "content-type": "",
-        }
-        http_parts_low: list[str] = list(map(lambda x: x.lower(), http_parts))
-        body: dict[str, str] = {}
-        path: str = ""
-        protocol: str = ""
-        for header in headers:
-            for i, part in enumerate(http_parts_low):
-                if header in part and header != "post":
-                    headers[header] = http_parts[i].split(" ")[-1]
-                elif header in part and header == "post":
-                    start_str: list[str] = http_parts[i].split(" ")
-                    path = start_str[1]
-                    protocol = start_str[2]
-                elif part == "":
-                    body = json.loads(http_parts[i + 1])
-                    break
+        start_line, headers, body_bytes = parse_http_message(binary_data)
+        if len(start_line) != 3:
+            raise ValueError(f"Malformed HTTP request line: {' '.join(start_line)!r}")
+        try:
+            body: dict[str, str] = json.loads(body_bytes)
+            sender, recipient, message = (
+                body["sender"],
+                body["recipient"],
+                body["message"],
+            )
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Malformed HTTP request body: {e}") from e
+        authorization: str = headers.get("authorization", ("", ""))[1]
         return cls(
-            auth_b64=headers["authorization"],
-            host=headers["host"],
-            sender=body["sender"],
-            recipient=body["recipient"],
-            message=body["message"],
-            path=path,
-            protocol=protocol,
-            content_type=headers["content-type"],
+            auth_b64=authorization.split(" ")[-1],
+            host=headers.get("host", ("", ""))[1],
+            sender=sender,
+            recipient=recipient,
+            message=message,
+            path=start_line[1],
+            protocol=start_line[2],
+            content_type=headers.get("content-type", ("", ""))[1],
+            extra_headers=get_extra_headers(headers, cls.KNOWN_HEADERS),
+        )
+
+
+class HttpRequestTemplate:
+    """
+    Шаблон HTTP запроса для пакетной отправки: стартовая строка и заголовки,
+    одинаковые для всех сообщений (Host, Authorization, Content-Type),
+    кодируются в байты один раз при создании шаблона,
+    для каждого сообщения формируются только тело и Content-Length.
+    Результат совпадает с HttpRequest.to_bytes для тех же данных
+    """
+
+    def __init__(
+        self,
+        auth_b64: str,
+        host: str,
+        path: str,
+        protocol: str,
+        content_type: str,
+        extra_headers: Mapping[str, str] | None = None,
+    ):
+        self.prefix: bytes = (
+            f"POST {path} {protocol}\r\n"
+            f"Host: {host}\r\n"
+            f"Authorization: Basic {auth_b64}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            "Content-Length: "
+        ).encode()
+        self.suffix: bytes = (
+            f"\r\n{format_extra_headers(extra_headers or {})}\r\n"
+        ).encode()
+
+    @staticmethod
+    def join_body(
+        sender_json: bytes, recipient_json: bytes, message_json: bytes
+    ) -> bytes:
+        """
+        Формирует тело запроса из уже закодированных JSON строк полей
+        """
+        return b"".join(
+            (
+                b'{"sender": ',
+                sender_json,
+                b', "recipient": ',
+                recipient_json,
+                b', "message": ',
+                message_json,
+                b"}",
+            )
+        )
+
+    @staticmethod
+    def body_bytes(sender: str, recipient: str | list[str], message: str) -> bytes:
+        """
+        Формирует тело запроса, совпадающее с результатом json.dumps
+        (ensure_ascii=False, UTF-8)
+        """
+        return (
+            '{"sender": '
+            + encode_basestring(sender)
+            + ', "recipient": '
+            + encode_recipient(recipient)
+            + ', "message": '
+            + encode_basestring(message)
+            + "}"
+        ).encode()
+
+    def to_chunks(
+        self,
+        sender: str,
+        recipient: str | list[str],
+        message: str,
+        idempotency_key: str | None = None,
+    ) -> list[bytes]:
+        """
+        Формирует запрос в виде списка частей для writev/sendmsg/writelines
+        без склеивания в одну строку
+        """
+        return self.body_chunks(
+            self.body_bytes(sender, recipient, message), idempotency_key
         )
 
+    def body_chunks(
+        self, body: bytes, idempotency_key: str | None = None
+    ) -> list[bytes]:
+        """
+        Формирует запрос в виде списка частей для уже готового тела
+        :param body: тело запроса
+        :param idempotency_key: значение заголовка Idempotency-Key или None
+        """
+        if idempotency_key is None:
+            return [self.prefix, b"%d" % len(body), self.suffix, body]
+        return [
+            self.prefix,
+            b"%d\r\nIdempotency-Key: %s" % (len(body), idempotency_key.encode()),
+            self.suffix,
+            body,
+        ]
+
+    def to_bytes(
+        self,
+        sender: str,
+        recipient: str | list[str],
+        message: str,
+        idempotency_key: str | None = None,
+    ) -> bytes:
+        """
+        Формирует байты HTTP запроса для одного сообщения
+        """
+        return b"".join(self.to_chunks(sender, recipient, message, idempotency_key))
+
+    def write_into(
+        self,
+        buffer: bytearray,
+        sender: str,
+        recipient: str | list[str],
+        message: str,
+    ) -> int:
+        """
+        Дописывает HTTP запрос в конец буфера вызывающей стороны
+        :return: количество записанных байт
+        """
+        size: int = len(buffer)
+        for chunk in self.to_chunks(sender, recipient, message):
+            buffer += chunk
+        return len(buffer) - size
+
 
 class HttpResponse:
     """
@@ -121,8 +347,36 @@ class HttpResponse:
     status, message_id
     при неуспешном выполнении:
     error
+    extra_headers - прочие заголовки ответа
+    Экземпляры не имеют __dict__, а значения заголовков (CORS, Keep-Alive и др.),
+    одинаковые почти у всех ответов, интернируются и хранятся в одном экземпляре
     """
 
+    __slots__ = (
+        "protocol",
+        "answer_code",
+        "acc_control_allow_origin",
+        "acc_control_allow_headers",
+        "acc_control_allow_cred",
+        "acc_control_expose_headers",
+        "content_type",
+        "connection",
+        "keep_alive",
+        "body_bytes",
+        "extra_headers",
+    )
+
+    KNOWN_HEADERS = (
+        "access-control-allow-origin",
+        "access-control-allow-headers",
+        "access-control-allow-credentials",
+        "access-control-expose-headers",
+        "content-type",
+        "content-length",
+        "connection",
+        "keep-alive",
+    )
+
     def __init__(
         self,
         protocol: str,
@@ -135,17 +389,19 @@ class HttpResponse:
         connection: str,
         keep_alive: str,
         body: str,
+        extra_headers: Mapping[str, str] | None = None,
     ):
-        self.protocol = protocol
-        self.answer_code = answer_code
-        self.acc_control_allow_origin = acc_control_allow_origin
-        self.acc_control_allow_headers = acc_control_allow_headers
-        self.acc_control_allow_cred = acc_control_allow_cred
-        self.acc_control_expose_headers = acc_control_expose_headers
-        self.content_type = content_type
-        self.connection = connection
-        self.keep_alive = keep_alive
+        self.protocol = sys.intern(protocol)
+        self.answer_code = sys.intern(answer_code)
+        self.acc_control_allow_origin = sys.intern(acc_control_allow_origin)
+        self.acc_control_allow_headers = sys.intern(acc_control_allow_headers)
+        self.acc_control_allow_cred = sys.intern(acc_control_allow_cred)
+        self.acc_control_expose_headers = sys.intern(acc_control_expose_headers)
+        self.content_type = sys.intern(content_type)
+        self.connection = sys.intern(connection)
+        self.keep_alive = sys.intern(keep_alive)
         self.body_bytes = body.encode()
+        self.extra_headers = extra_headers or NO_HEADERS
 
     def to_bytes(self) -> bytes:
         """
@@ -162,6 +418,7 @@ class HttpResponse:
             f"Content-Length: {len(self.body_bytes)}\r\n"
             f"Connection: {self.connection}\r\n"
             f"Keep-Alive: {self.keep_alive}\r\n"
+            f"{format_extra_headers(self.extra_headers)}"
             f"\r\n"
         ]
         return ("".join(headers)).encode() + self.body_bytes
@@ -171,41 +428,199 @@ class HttpResponse:
         """
         Преобразует последовательность байт в объект HTTP-ответа
         """
-        http_parts: list[str] = binary_data.decode().split("\r\n")
-        headers: dict[str, str] = {
-            "access-control-allow-origin": "",
-            "access-control-allow-headers": "",
-            "access-control-allow-credentials": "",
-            "access-control-expose-headers": "",
-            "content-type": "",
-            "content-length": "",
-            "connection": "",
-            "keep-alive": "",
-        }
-        http_parts_low: list[str] = list(map(lambda x: x.lower(), http_parts))
-        body: str = ""
-        answer_code: str = ""
-        protocol: str = ""
-        for header in headers:
-            for i, part in enumerate(http_parts_low):
-                if header in part and i != 0:
-                    headers[header] = http_parts[i].split(":")[-1][1:]
-                elif i == 0:
-                    start_str: list[str] = http_parts[i].split()
-                    answer_code = start_str[1] + " " + start_str[2]
-                    protocol = start_str[0]
-                elif part == "":
-                    body = http_parts[i + 1]
-                    break
+        start_line, headers, body = parse_http_message(binary_data)
+        if not start_line[0].startswith("HTTP/"):
+            raise ValueError(f"Malformed HTTP status line: {' '.join(start_line)!r}")
+        try:
+            body_str: str = body.decode()
+        except UnicodeDecodeError as e:
+            raise ValueError(f"Malformed HTTP response body: {e}") from e
+
+        def header(name: str) -> str:
+            return headers.get(name, ("", ""))[1]
+
         return cls(
-            protocol=protocol,
-            answer_code=answer_code,
-            acc_control_allow_origin=headers["access-control-allow-origin"],
-            acc_control_allow_headers=headers["access-control-allow-headers"],
-            acc_control_allow_cred=headers["access-control-allow-credentials"],
-            acc_control_expose_headers=headers["access-control-expose-headers"],
-            content_type=headers["content-type"],
-            connection=headers["connection"],
-            keep_alive=headers["keep-alive"],
-            body=body,
+            protocol=start_line[0],
+            answer_code=" ".join(start_line[1:]),
+            acc_control_allow_origin=header("access-control-allow-origin"),
+            acc_control_allow_headers=header("access-control-allow-headers"),
+            acc_control_allow_cred=header("access-control-allow-credentials"),
+            acc_control_expose_headers=header("access-control-expose-headers"),
+            content_type=header("content-type"),
+            connection=header("connection"),
+            keep_alive=header("keep-alive"),
+            body=body_str,
+            extra_headers=get_extra_headers(headers, cls.KNOWN_HEADERS),
+        )
+
+
+def get_head_prefix(data: memoryview) -> bytes:
+    """
+    Копирует начало ответа, в котором есть конец заголовков
+    (или весь ответ, если конца заголовков нет), не копируя тело целиком
+    """
+    size: int = 1024
+    while True:
+        prefix: bytes = data[:size].tobytes()
+        if b"\r\n\r\n" in prefix or size >= data.nbytes:
+            return prefix
+        size *= 4
+
+
+class HttpResponseView:
+    """
+    Ленивое представление HTTP ответа поверх полученных байт
+    для пакетной отправки, где обычно нужен только код ответа:
+    при создании разбирается только строка статуса,
+    а заголовки и поля JSON тела (status, message_id, error) декодируются
+    при первом обращении и запоминаются в экземпляре.
+    Заголовки, кроме строки статуса, не проверяются; полный разбор
+    с проверкой выполняет to_response
+    data - байты ответа: bytes, bytearray или memoryview
+        (см. http_reader.ResponseReader.read_response); представление
+        хранит сам объект, а копирует только нужные части: заголовки
+        при первом обращении и тело в body_bytes (body_view - без копирования)
+    """
+
+    __slots__ = (
+        "data",
+        "protocol",
+        "answer_code",
+        "_head",
+        "_head_end",
+        "_head_lower",
+        "_headers",
+        "_body",
+        "_json",
+    )
+
+    def __init__(self, data: bytes | bytearray | memoryview):
+        if isinstance(data, memoryview):
+            data = data.cast("B")
+        # у memoryview нет find: поиск идёт по копии начала ответа
+        head: bytes | bytearray = (
+            get_head_prefix(data) if isinstance(data, memoryview) else data
         )
+        head_end: int = head.find(b"\r\n\r\n")
+        if head_end < 0:
+            raise ValueError("Malformed HTTP message: no end of headers")
+        status_line: bytes = bytes(head[: head.find(b"\r\n")])
+        protocol, _, answer_code = status_line.partition(b" ")
+        if not protocol.startswith(b"HTTP/") or not answer_code:
+            raise ValueError(f"Malformed HTTP status line: {status_line!r}")
+        self.data = data
+        self.protocol = sys.intern(protocol.decode())
+        self.answer_code = sys.intern(answer_code.decode())
+        self._head = head
+        self._head_end = head_end
+        self._head_lower: bytes | None = None
+        self._headers: dict[str, str] | None = None
+        self._body: bytes | None = None
+        self._json: dict | None = None
+
+    @classmethod
+    def from_bytes(cls, binary_data: bytes | bytearray | memoryview) -> Self:
+        """
+        Создаёт представление ответа по его байтам
+        """
+        return cls(binary_data)
+
+    def header(self, name: str) -> str:
+        """
+        Возвращает значение заголовка (повторяющиеся заголовки объединяются
+        через запятую, отсутствующий - пустая строка)
+        :param name: имя заголовка в любом регистре
+        """
+        key: str = name.lower()
+        if self._headers is None:
+            self._headers = {}
+        elif key in self._headers:
+            return self._headers[key]
+        if self._head_lower is None:
+            # строка статуса и заголовки вместе с последним \r\n
+            self._head_lower = bytes(self._head[: self._head_end + 2]).lower()
+        pattern: bytes = b"\r\n" + key.encode() + b":"
+        values: list[str] = []
+        pos: int = self._head_lower.find(pattern)
+        while pos >= 0:
+            start: int = pos + len(pattern)
+            end: int = self._head_lower.find(b"\r\n", start)
+            values.append(bytes(self._head[start:end]).strip().decode())
+            pos = self._head_lower.find(pattern, end)
+        value: str = sys.intern(", ".join(values))
+        self._headers[key] = value
+        return value
+
+    @property
+    def content_type(self) -> str:
+        """
+        Заголовок Content-Type
+        """
+        return self.header("content-type")
+
+    @property
+    def connection(self) -> str:
+        """
+        Заголовок Connection
+        """
+        return self.header("connection")
+
+    @property
+    def keep_alive(self) -> str:
+        """
+        Заголовок Keep-Alive
+        """
+        return self.header("keep-alive")
+
+    @property
+    def body_view(self) -> memoryview:
+        """
+        Тело ответа без копирования байт
+        """
+        return memoryview(self.data)[self._head_end + 4 :]
+
+    @property
+    def body_bytes(self) -> bytes:
+        """
+        Тело ответа (копируется при первом обращении)
+        """
+        if self._body is None:
+            self._body = bytes(self.body_view)
+        return self._body
+
+    def _field(self, name: str) -> str | None:
+        if self._json is None:
+            try:
+                body = json.loads(self.body_bytes)
+            except ValueError:
+                body = None
+            self._json = body if isinstance(body, dict) else {}
+        value = self._json.get(name)
+        return None if value is None else str(value)
+
+    @property
+    def status(self) -> str | None:
+        """
+        Поле status JSON тела ответа (None, если его нет)
+        """
+        return self._field("status")
+
+    @property
+    def message_id(self) -> str | None:
+        """
+        Поле message_id JSON тела ответа (None, если его нет)
+        """
+        return self._field("message_id")
+
+    @property
+    def error(self) -> str | None:
+        """
+        Поле error JSON тела ответа (None, если его нет)
+        """
+        return self._field("error")
+
+    def to_response(self) -> HttpResponse:
+        """
+        Выполняет полный разбор ответа с проверкой всех заголовков
+        """
+        return HttpResponse.from_bytes(bytes(self.data))
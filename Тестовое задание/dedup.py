@@ -0,0 +1,245 @@
+"""
+Модуль содержит кэш идемпотентности для подавления повторной отправки
+одинаковых сообщений: ключом служит хэш тела запроса, ключи хранятся
+ограниченное время (окно) и в ограниченном количестве, а при заданном файле
+сохраняются на диск и переживают перезапуск клиента
+"""
+
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+from classes import HttpRequestTemplate
+
+# запись файла кэша: 16 байт ключа и время (time.time), до которого он хранится
+RECORD = struct.Struct("<16sd")
+
+# состояния ключа, возвращаемые IdempotencyCache.check
+NEW, IN_FLIGHT, DELIVERED = "new", "in_flight", "delivered"
+
+# через сколько секунд снова проверять копию сообщения,
+# оригинал которого ещё отправляется
+RECHECK_DELAY = 0.05
+
+
+def get_idempotency_key(body: bytes) -> str:
+    """
+    Вычисляет ключ идемпотентности (заголовок Idempotency-Key) по телу запроса
+    :param body: тело HTTP запроса
+    :return: 32 шестнадцатеричных символа (BLAKE2b, 128 бит)
+    """
+    return hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+class IdempotencyCache:
+    """
+    Кэш ключей недавно отправленных сообщений:
+    window - сколько секунд после доставки повтор сообщения подавляется
+    max_size - сколько ключей хранить (при превышении вытесняются старые)
+    path - файл для сохранения ключей между запусками или None;
+        ключи дописываются в конец файла по 24 байта, а при открытии
+        файл переписывается без устаревших записей
+    Ключи отправляемых сообщений хранятся отдельно (только в памяти)
+    и становятся ключами доставленных после confirm, поэтому подавляются
+    только повторы доставленных сообщений, а копию сообщения, которое ещё
+    отправляется, нужно проверить снова после его завершения.
+    Счётчики: hits - подавленные повторы, misses - новые сообщения.
+    Методы безопасны для вызова из разных потоков
+    """
+
+    def __init__(
+        self, window: float = 60.0, max_size: int = 100_000, path: str | None = None
+    ):
+        self.window = window
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        # ключ доставленного сообщения -> время истечения;
+        # порядок совпадает с порядком истечения
+        self._expires: OrderedDict[str, float] = OrderedDict()
+        # ключи сообщений, которые сейчас отправляются
+        self._in_flight: set[str] = set()
+        self._lock = threading.Lock()
+        self._file = None
+        if path is not None:
+            self._load(path)
+
+    def __getstate__(self) -> dict:
+        # копия для другого процесса не пишет в файл (см. detach)
+        state: dict = self.__dict__.copy()
+        del state["_lock"]
+        state["_file"] = None
+        state["path"] = None
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _load(self, path: str) -> None:
+        now: float = time.time()
+        try:
+            with open(path, "rb") as file:
+                data: bytes = file.read()
+        except FileNotFoundError:
+            data = b""
+        usable: int = len(data) - len(data) % RECORD.size
+        for digest, expires in RECORD.iter_unpack(data[:usable]):
+            key: str = digest.hex()
+            self._expires.pop(key, None)
+            if expires > now:
+                self._expires[key] = expires
+        while len(self._expires) > self.max_size:
+            self._expires.popitem(last=False)
+        tmp_path: str = f"{path}.tmp"
+        with open(tmp_path, "wb") as file:
+            file.write(
+                b"".join(
+                    RECORD.pack(bytes.fromhex(key), expires)
+                    for key, expires in self._expires.items()
+                )
+            )
+        os.replace(tmp_path, path)
+        self._file = open(path, "ab", buffering=0)
+
+    def _append(self, key: str, expires: float) -> None:
+        if self._file is not None:
+            self._file.write(RECORD.pack(bytes.fromhex(key), expires))
+
+    def _evict(self, now: float) -> None:
+        while self._expires:
+            key, expires = next(iter(self._expires.items()))
+            if expires > now and len(self._expires) <= self.max_size:
+                return
+            del self._expires[key]
+
+    def check(self, key: str) -> str:
+        """
+        Проверяет, доставлялось ли сообщение с таким ключом в пределах окна
+        или отправляется ли оно сейчас; новый ключ отмечается как отправляемый
+        и после отправки передаётся в confirm или forget
+        :param key: ключ идемпотентности (get_idempotency_key)
+        :return: DELIVERED - повтор, который не нужно отправлять,
+            IN_FLIGHT - оригинал ещё отправляется, NEW - сообщение новое
+        """
+        now: float = time.time()
+        with self._lock:
+            if self._expires.get(key, 0.0) > now:
+                self.hits += 1
+                return DELIVERED
+            if key in self._in_flight:
+                return IN_FLIGHT
+            self.misses += 1
+            self._in_flight.add(key)
+            return NEW
+
+    def reserve(
+        self, record: tuple[str, str | list[str], str]
+    ) -> tuple[tuple[str, str | list[str], str], list[str]] | None:
+        """
+        Проверяет сообщения запроса (см. check) по ключам, вычисленным
+        для каждого получателя отдельно, поэтому повторы подавляются
+        независимо от объединения получателей в запросы (segments.MessageGrouper).
+        Если хотя бы одна копия ещё отправляется, ни один ключ не отмечается
+        :param record: запрос (отправитель, получатель или список получателей,
+            сообщение)
+        :return: None, если запрос нужно проверить позже, иначе запрос
+            только с новыми получателями и их ключи (пустой список ключей -
+            все сообщения запроса уже доставлены); ключи после отправки
+            передаются в finish
+        """
+        sender, recipient, message = record
+        recipients: list[str] = [recipient] if isinstance(recipient, str) else recipient
+        keys: list[str] = [
+            get_idempotency_key(HttpRequestTemplate.body_bytes(sender, name, message))
+            for name in recipients
+        ]
+        now: float = time.time()
+        with self._lock:
+            if not self._in_flight.isdisjoint(keys):
+                return None
+            fresh: list[tuple[str, str]] = [
+                (name, key)
+                for name, key in zip(recipients, keys)
+                if self._expires.get(key, 0.0) <= now
+            ]
+            self.hits += len(keys) - len(fresh)
+            self.misses += len(fresh)
+            self._in_flight.update(key for _, key in fresh)
+        if not fresh or len(fresh) == len(keys):
+            return record, [key for _, key in fresh]
+        names: list[str] = [name for name, _ in fresh]
+        return (
+            (sender, names[0] if len(names) == 1 else names, message),
+            [key for _, key in fresh],
+        )
+
+    def finish(self, keys: list[str], delivered: bool) -> None:
+        """
+        Завершает отправку сообщений с ключами, полученными от reserve
+        :param keys: ключи сообщений запроса
+        :param delivered: признак доставки (ответ 2xx)
+        """
+        for key in keys:
+            if delivered:
+                self.confirm(key)
+            else:
+                self.forget(key)
+
+    def confirm(self, key: str) -> None:
+        """
+        Запоминает ключ доставленного сообщения (и сохраняет его в файл)
+        """
+        now: float = time.time()
+        with self._lock:
+            self._in_flight.discard(key)
+            self._expires[key] = now + self.window
+            self._expires.move_to_end(key)
+            self._append(key, now + self.window)
+            self._evict(now)
+
+    def forget(self, key: str) -> None:
+        """
+        Удаляет ключ (например, если отправка не удалась
+        и сообщение можно будет отправить снова)
+        """
+        with self._lock:
+            self._in_flight.discard(key)
+            if self._expires.pop(key, None) is not None:
+                self._append(key, 0.0)
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict(time.time())
+            return len(self._expires)
+
+    def close(self) -> None:
+        """
+        Закрывает файл кэша
+        """
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def detach(self) -> None:
+        """
+        Переводит кэш в режим работы только в памяти, не трогая файл:
+        вызывается в дочернем процессе, который получил копию кэша вместе
+        с открытым файлом (fork), чтобы процессы не дописывали в файл
+        одновременно. Блокировка создаётся заново, так как при fork она могла
+        быть захвачена другим потоком родительского процесса
+        """
+        self._lock = threading.Lock()
+        self._file = None
+        self.path = None
+
+    def __enter__(self) -> "IdempotencyCache":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
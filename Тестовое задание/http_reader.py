@@ -0,0 +1,225 @@
+"""
+Модуль содержит потоковое чтение HTTP ответов из сокета и из потоков asyncio:
+заголовки считываются до пустой строки, тело - ровно по Content-Length
+или по частям при Transfer-Encoding: chunked.
+asyncio импортируется только асинхронными функциями, чтобы синхронный
+клиент не тратил время на его загрузку при запуске
+"""
+
+from __future__ import annotations
+
+import socket
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import asyncio
+
+MAX_HEADER_SIZE = 64 * 1024
+
+NO_BODY_CODES = (b"1", b"204", b"304")
+
+
+def get_body_framing(head: bytes) -> tuple[str, int]:
+    """
+    Определяет, как ограничено тело ответа, по его заголовкам
+    :param head: стартовая строка и заголовки ответа
+    :return: способ ("length", "chunked" или "eof") и длина тела
+    """
+    lines: list[bytes] = head.split(b"\r\n")
+    status: list[bytes] = lines[0].split(b" ", 2)
+    if len(status) < 2 or not status[0].startswith(b"HTTP/"):
+        raise ValueError(f"Malformed HTTP status line: {lines[0]!r}")
+    if status[1].startswith(NO_BODY_CODES):
+        return "length", 0
+    length: int | None = None
+    for line in lines[1:]:
+        name, _, value = line.partition(b":")
+        name = name.strip().lower()
+        if name == b"transfer-encoding" and b"chunked" in value.lower():
+            return "chunked", 0
+        if name == b"content-length":
+            if not value.strip().isdigit():
+                raise ValueError(f"Malformed Content-Length: {value!r}")
+            length = int(value)
+    if length is None:
+        return "eof", 0
+    return "length", length
+
+
+def dechunk_head(head: bytes, body_length: int) -> bytes:
+    """
+    Заменяет в заголовках Transfer-Encoding: chunked
+    на Content-Length собранного тела
+    """
+    lines: list[bytes] = [
+        line
+        for line in head.split(b"\r\n")
+        if line and not line.lower().startswith(b"transfer-encoding:")
+    ]
+    lines.append(b"Content-Length: %d" % body_length)
+    return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+def parse_chunk_size(line: bytes) -> int:
+    """
+    Разбирает строку с размером части (в шестнадцатеричном виде)
+    """
+    try:
+        return int(line.split(b";", 1)[0].strip(), 16)
+    except ValueError:
+        raise ValueError(f"Malformed chunk size: {line!r}") from None
+
+
+class ResponseReader:
+    """
+    Читает HTTP ответы из сокета в заранее выделенный буфер (recv_into),
+    не создавая новых объектов на каждое чтение.
+    Данные, пришедшие после конца ответа, сохраняются для следующего ответа,
+    поэтому один читатель используется на всё время жизни соединения:
+    sock - сокет соединения с сервером
+    buffer_size - начальный размер буфера, при необходимости он увеличивается
+    eof - признак того, что сервер закрыл соединение
+    """
+
+    def __init__(self, sock: socket.socket, buffer_size: int = 16 * 1024):
+        self.sock = sock
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+        self.eof = False
+
+    def _fill(self) -> None:
+        if self._end == len(self._buffer):
+            pending: int = self._end - self._start
+            if self._start > 0:
+                self._buffer[:pending] = bytes(self._view[self._start : self._end])
+            else:
+                buffer: bytearray = bytearray(2 * len(self._buffer))
+                buffer[:pending] = self._view[:pending]
+                self._view.release()
+                self._buffer = buffer
+                self._view = memoryview(self._buffer)
+            self._start, self._end = 0, pending
+        received: int = self.sock.recv_into(self._view[self._end :])
+        if not received:
+            self.eof = True
+            raise ConnectionError("Server closed the connection")
+        self._end += received
+
+    def _take(self, size: int) -> bytes:
+        data: bytes = bytes(self._view[self._start : self._start + size])
+        self._start += size
+        if self._start == self._end:
+            self._start = self._end = 0
+        return data
+
+    def _read_until(self, delimiter: bytes, limit: int = MAX_HEADER_SIZE) -> bytes:
+        checked: int = 0
+        while True:
+            pos: int = self._buffer.find(delimiter, self._start + checked, self._end)
+            if pos != -1:
+                return self._take(pos + len(delimiter) - self._start)
+            if self._end - self._start > limit:
+                raise ValueError("HTTP header section is too large")
+            checked = max(0, self._end - self._start - len(delimiter) + 1)
+            self._fill()
+
+    def _read_exact(self, size: int) -> bytes:
+        while self._end - self._start < size:
+            self._fill()
+        return self._take(size)
+
+    def _read_to_eof(self) -> bytes:
+        while True:
+            try:
+                self._fill()
+            except ConnectionError:
+                return self._take(self._end - self._start)
+
+    def read_head(self) -> bytes:
+        """
+        Считывает стартовую строку и заголовки ответа
+        :return: байты заголовков вместе с завершающей пустой строкой
+        """
+        return self._read_until(b"\r\n\r\n")
+
+    def read_body(self, head: bytes) -> bytes:
+        """
+        Считывает тело ответа, ограниченное согласно заголовкам
+        :param head: заголовки ответа, полученные read_head
+        :return: байты ответа, тело chunked ответа возвращается собранным
+        """
+        framing, length = get_body_framing(head)
+        if framing == "length":
+            return head + self._read_exact(length)
+        if framing == "eof":
+            return head + self._read_to_eof()
+        chunks: list[bytes] = []
+        while True:
+            size: int = parse_chunk_size(self._read_until(b"\r\n"))
+            if size == 0:
+                while self._read_until(b"\r\n") != b"\r\n":
+                    pass
+                break
+            chunks.append(self._read_exact(size))
+            self._read_exact(2)
+        body: bytes = b"".join(chunks)
+        return dechunk_head(head, len(body)) + body
+
+    def read_response(self) -> bytes:
+        """
+        Считывает один HTTP ответ целиком
+        :return: байты ответа, тело chunked ответа возвращается собранным
+        """
+        return self.read_body(self.read_head())
+
+
+async def read_head_async(reader: asyncio.StreamReader) -> bytes:
+    """
+    Считывает стартовую строку и заголовки ответа из потока asyncio
+    :param reader: поток чтения соединения с сервером
+    :return: байты заголовков вместе с завершающей пустой строкой
+    """
+    import asyncio
+
+    try:
+        return await reader.readuntil(b"\r\n\r\n")
+    except asyncio.IncompleteReadError as e:
+        raise ConnectionError("Server closed the connection") from e
+    except asyncio.LimitOverrunError as e:
+        raise ValueError("HTTP header section is too large") from e
+
+
+async def read_body_async(reader: asyncio.StreamReader, head: bytes) -> bytes:
+    """
+    Считывает тело ответа из потока asyncio согласно заголовкам
+    :param reader: поток чтения соединения с сервером
+    :param head: заголовки ответа, полученные read_head_async
+    :return: байты ответа, тело chunked ответа возвращается собранным
+    """
+    framing, length = get_body_framing(head)
+    if framing == "length":
+        return head + await reader.readexactly(length)
+    if framing == "eof":
+        return head + await reader.read()
+    chunks: list[bytes] = []
+    while True:
+        size: int = parse_chunk_size(await reader.readuntil(b"\r\n"))
+        if size == 0:
+            while await reader.readuntil(b"\r\n") != b"\r\n":
+                pass
+            break
+        chunks.append(await reader.readexactly(size))
+        await reader.readexactly(2)
+    body: bytes = b"".join(chunks)
+    return dechunk_head(head, len(body)) + body
+
+
+async def read_response_async(reader: asyncio.StreamReader) -> bytes:
+    """
+    Считывает один HTTP ответ целиком из потока asyncio
+    :param reader: поток чтения соединения с сервером
+    :return: байты ответа, тело chunked ответа возвращается собранным
+    """
+    return await read_body_async(reader, await read_head_async(reader))
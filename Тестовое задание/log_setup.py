@@ -0,0 +1,240 @@
+"""
+Модуль содержит неблокирующую настройку логирования:
+записи передаются через очередь (QueueHandler) в отдельный поток
+(QueueListener), который форматирует их и пишет в файл с ротацией,
+сбрасывая буфер на диск пачками
+"""
+
+import json
+import logging
+import queue
+import random
+import time
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+
+# глобальные флаги logging, которые отключает setup_logging(lean_records=True)
+LEAN_FLAGS = ("logThreads", "logProcesses", "logMultiprocessing")
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Обработчик, помещающий запись в очередь без форматирования:
+    подстановка аргументов и форматирование выполняются в потоке записи,
+    а не в потоке отправки сообщений (поэтому в аргументах логирования
+    не следует передавать объекты, которые изменяются после вызова)
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class SuccessSampler(logging.Filter):
+    """
+    Фильтр, пропускающий только долю записей об успешной отправке
+    (записи с extra={"success": True}), остальные записи пропускаются всегда:
+    rate - доля сохраняемых записей от 0 до 1
+    """
+
+    def __init__(self, rate: float = 1.0):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "success", False) or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует записи в JSONL: время, уровень, сообщение
+    и поля, переданные через extra
+    """
+
+    RESERVED = frozenset(vars(logging.makeLogRecord({})))
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in self.RESERVED and name not in data:
+                data[name] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BatchFlushMixin:
+    """
+    Сбрасывает буфер файла на диск не после каждой записи,
+    а после flush_records записей или раз в flush_interval секунд
+    """
+
+    flush_records = 100
+    flush_interval = 1.0
+
+    def __init__(self, *args, **kwargs):
+        self._pending = 0
+        self._last_flush = 0.0
+        super().__init__(*args, **kwargs)
+
+    def flush(self) -> None:
+        now: float = time.monotonic()
+        self._pending += 1
+        if (
+            self._pending < self.flush_records
+            and now - self._last_flush < self.flush_interval
+        ):
+            return
+        self._pending = 0
+        self._last_flush = now
+        super().flush()
+
+    def flush_pending(self) -> None:
+        """
+        Сбрасывает на диск записи, ожидающие в буфере (вызывается
+        по таймеру, когда новых записей нет)
+        """
+        self.acquire()
+        try:
+            if self._pending:
+                self._pending = 0
+                self._last_flush = time.monotonic()
+                super().flush()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self._pending = self.flush_records
+        super().close()
+
+
+class BatchRotatingFileHandler(BatchFlushMixin, RotatingFileHandler):
+    """
+    Файл с ротацией по размеру и пакетным сбросом буфера
+    """
+
+
+class BatchTimedRotatingFileHandler(BatchFlushMixin, TimedRotatingFileHandler):
+    """
+    Файл с ротацией по времени и пакетным сбросом буфера
+    """
+
+
+class BatchQueueListener(QueueListener):
+    """
+    QueueListener, который, пока новых записей нет, раз в flush_interval
+    обработчиков с пакетным сбросом (BatchFlushMixin) сбрасывает их буфер:
+    последние записи попадают на диск, даже если следующая запись
+    не приходит долго
+    """
+
+    def __init__(self, log_queue: queue.SimpleQueue, *handlers: logging.Handler):
+        super().__init__(log_queue, *handlers)
+        self.batch_handlers: list[BatchFlushMixin] = [
+            handler for handler in handlers if isinstance(handler, BatchFlushMixin)
+        ]
+        self.flush_interval: float | None = min(
+            (handler.flush_interval for handler in self.batch_handlers), default=None
+        )
+        # значения глобальных флагов logging до setup_logging(lean_records=True)
+        self.saved_flags: dict[str, bool] = {}
+
+    def dequeue(self, block: bool) -> logging.LogRecord:
+        while True:
+            try:
+                return self.queue.get(block, self.flush_interval)
+            except queue.Empty:
+                if not block or self.flush_interval is None:
+                    raise
+                for handler in self.batch_handlers:
+                    handler.flush_pending()
+
+
+def setup_logging(
+    filename: str = "server.log",
+    level: int = logging.INFO,
+    fmt: str = "text",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    rotate_when: str | None = None,
+    success_sample_rate: float = 1.0,
+    lean_records: bool = False,
+) -> QueueListener | None:
+    """
+    Настраивает корневой логгер на запись через очередь в отдельном потоке.
+    Как и logging.basicConfig, ничего не делает,
+    если у корневого логгера уже есть обработчики
+    :param filename: файл лога
+    :param level: уровень логирования
+    :param fmt: формат записей: "text" или "jsonl"
+    :param max_bytes: размер файла, после которого выполняется ротация
+    :param backup_count: сколько старых файлов хранить
+    :param rotate_when: интервал ротации по времени (например, "midnight"),
+        если задан, ротация по размеру не выполняется
+    :param success_sample_rate: доля сохраняемых записей об успешной отправке
+    :param lean_records: не собирать в записях имена потока и процесса
+        (logging.logThreads, logProcesses, logMultiprocessing) - формат их
+        не использует, а сбор замедляет каждый вызов логирования (см. раздел
+        Optimization в Logging HOWTO); флаги общие для всего процесса,
+        поэтому включать это стоит только в приложении, которое владеет
+        процессом, прежние значения восстанавливает stop_logging
+    :return: запущенный QueueListener, который нужно остановить (stop_logging)
+        при завершении, или None, если логирование уже настроено
+    """
+    root: logging.Logger = logging.getLogger()
+    if root.handlers:
+        return None
+    handler: logging.Handler
+    if rotate_when:
+        handler = BatchTimedRotatingFileHandler(
+            filename, when=rotate_when, backupCount=backup_count, encoding="utf-8"
+        )
+    else:
+        handler = BatchRotatingFileHandler(
+            filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+        )
+    handler.setFormatter(
+        JsonFormatter() if fmt == "jsonl" else logging.Formatter(TEXT_FORMAT)
+    )
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler: DeferredQueueHandler = DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(SuccessSampler(success_sample_rate))
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    listener: BatchQueueListener = BatchQueueListener(log_queue, handler)
+    if lean_records:
+        for name in LEAN_FLAGS:
+            listener.saved_flags[name] = getattr(logging, name)
+            setattr(logging, name, False)
+    listener.start()
+    return listener
+
+
+def stop_logging(listener: QueueListener | None) -> None:
+    """
+    Дописывает оставшиеся в очереди записи, закрывает файл
+    и отключает обработчик очереди от корневого логгера
+    """
+    if listener is None:
+        return
+    listener.stop()
+    if isinstance(listener, BatchQueueListener):
+        for name, value in listener.saved_flags.items():
+            setattr(logging, name, value)
+    root: logging.Logger = logging.getLogger()
+    for handler in root.handlers[:]:
+        if getattr(handler, "queue", None) is listener.queue:
+            root.removeHandler(handler)
+    for handler in listener.handlers:
+        handler.close()
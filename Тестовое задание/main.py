@@ -1,67 +1,845 @@
 """
 Этот модуль содержит функцию по отправке запроса
-к серверу и ее вызов, включая логирование результатов
+к серверу и ее вызов, включая логирование результатов.
+Модули, нужные только для пакетной отправки (asyncio, пулы соединений,
+процессы, журнал отправки), импортируются внутри функций пакетного режима,
+чтобы разовая отправка из cron или цикла оболочки запускалась быстро
 """
 
+from __future__ import annotations
+
 import argparse
 import socket
-import base64
 import logging
+import os
+import sys
+import time
+from typing import TYPE_CHECKING, Iterable, Iterator
 import classes as cls
 import take_config as conf
-from classes import HttpResponse, HttpRequest
+from classes import HttpResponseView, HttpRequest, HttpRequestTemplate
+from http_reader import ResponseReader
+from settings import GatewaySettings, Settings, get_settings, load_settings
+from settings import SettingsReloader, connect
+from results import DUPLICATE, BulkReport, SendResult
+from retry import RetryPolicy, is_retryable_code, is_retryable_error
+
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
+
+    from async_sender import AsyncSender
+    from balancer import Endpoint, LoadBalancer
+    from dedup import IdempotencyCache
+    from metrics import Metrics, MetricsReporter
+    from outbox import Outbox
+    from rate_limit import AimdController, TokenBucket
+    from records import ResultWriter
+    from sharded import ShardedSender
+
+SHARD_CHUNKS = 20
+
+Config = dict[str, dict[str, str]] | Settings
+
+
+def get_gateway(config: Config) -> GatewaySettings:
+    """
+    Возвращает настройки выбранного шлюза: адрес, заголовок Host,
+    путь запроса и закодированную авторизацию
+    :param config: конфигурация из conf.toml или настройки
+    :return: настройки шлюза
+    """
+    return get_settings(config).gateway
+
+
+def get_rate_limiter(config: Config) -> TokenBucket | None:
+    """
+    Создаёт ограничитель скорости по параметрам rate_limit (сообщений в секунду)
+    и burst из конфигурации
+    :param config: конфигурация из conf.toml
+    :return: ограничитель или None, если rate_limit не задан
+    """
+    section: dict = get_settings(config).section()
+    if not section.get("rate_limit"):
+        return None
+    from rate_limit import TokenBucket
+
+    return TokenBucket(float(section["rate_limit"]), int(section.get("burst", 1)))
+
+
+def get_retry_policy(config: Config) -> RetryPolicy:
+    """
+    Создаёт политику повторов по параметрам retry_attempts, retry_base_delay,
+    retry_max_delay и retry_deadline из конфигурации
+    :param config: конфигурация из conf.toml
+    :return: политика повторов
+    """
+    section: dict = get_settings(config).section()
+    return RetryPolicy(
+        max_attempts=int(section.get("retry_attempts", 3)),
+        base_delay=float(section.get("retry_base_delay", 0.1)),
+        max_delay=float(section.get("retry_max_delay", 10.0)),
+        deadline=float(section.get("retry_deadline", 60.0)),
+    )
+
+
+def get_balancer(config: Config) -> LoadBalancer | None:
+    """
+    Создаёт балансировщик между шлюзами, перечисленными в параметре balance
+    секции [test_sms_sender] (balance_strategy, eject_after, eject_time)
+    :param config: конфигурация из conf.toml
+    :return: балансировщик или None, если balance не задан
+    """
+    settings: Settings = get_settings(config)
+    section: dict = settings.section()
+    names: list[str] = section.get("balance") or []
+    if not names:
+        return None
+    unknown: list[str] = [name for name in names if name not in settings.gateways]
+    if unknown:
+        raise ValueError(f"Unknown gateways in balance: {', '.join(unknown)}")
+    from balancer import LoadBalancer
+
+    return LoadBalancer(
+        [settings.gateways[name] for name in names],
+        strategy=section.get("balance_strategy", "least_outstanding"),
+        eject_after=int(section.get("eject_after", 5)),
+        eject_time=float(section.get("eject_time", 30.0)),
+    )
+
+
+def start_health_checks(balancer: LoadBalancer, config: Config) -> None:
+    """
+    Запускает проверку исключённых шлюзов раз в health_check_interval секунд
+    (параметр секции [test_sms_sender], по умолчанию 5)
+    """
+    section: dict = get_settings(config).section()
+    balancer.start_health_checks(float(section.get("health_check_interval", 5.0)))
+
+
+def get_dedup_cache(config: Config) -> IdempotencyCache | None:
+    """
+    Создаёт кэш идемпотентности по секции [dedup] конфигурации
+    (window - окно подавления повторов в секундах, max_size - сколько ключей
+    хранить, file - файл для сохранения ключей между запусками)
+    :param config: конфигурация из conf.toml
+    :return: кэш, который нужно закрыть при завершении,
+        или None, если секция не задана
+    """
+    section: dict = get_settings(config).section("dedup")
+    if not section:
+        return None
+    from dedup import IdempotencyCache
+
+    return IdempotencyCache(
+        float(section.get("window", 60.0)),
+        int(section.get("max_size", 100_000)),
+        section.get("file"),
+    )
+
+
+def get_max_recipients(config: Config) -> int:
+    """
+    Возвращает, сколько получателей одного сообщения объединять в один запрос
+    (параметр max_recipients секции [test_sms_sender], по умолчанию 1 -
+    шлюз принимает только одного получателя)
+    """
+    max_recipients = get_settings(config).section().get("max_recipients", 1)
+    if not isinstance(max_recipients, int) or max_recipients < 1:
+        raise ValueError("max_recipients must be a positive integer")
+    return max_recipients
+
+
+def get_concurrency_controller(
+    config: Config, concurrency: int
+) -> AimdController | None:
+    """
+    Создаёт адаптивный ограничитель числа одновременных запросов,
+    если в конфигурации задан параметр adaptive_concurrency
+    :param config: конфигурация из conf.toml
+    :param concurrency: верхняя граница числа одновременных запросов
+    :return: ограничитель или None
+    """
+    if not get_settings(config).section().get("adaptive_concurrency"):
+        return None
+    from rate_limit import AimdController
+
+    return AimdController(max_limit=concurrency)
+
+
+def get_settings_reloader(config: Config) -> SettingsReloader | None:
+    """
+    Создаёт перечитывание conf.toml для долго работающих отправщиков
+    (параметр reload_interval секции [test_sms_sender] - не чаще чем раз
+    в сколько секунд проверять файл, по умолчанию 1, 0 - не перечитывать)
+    :param config: конфигурация из conf.toml
+    :return: перечитывание или None, если настройки загружены не из файла
+    """
+    settings: Settings = get_settings(config)
+    interval: float = float(settings.section().get("reload_interval", 1.0))
+    if settings.path is None or interval <= 0:
+        return None
+    return SettingsReloader(settings.path, settings.gateway.name, interval)
+
+
+def start_logging(config: Config) -> QueueListener | None:
+    """
+    Запускает неблокирующее логирование по секции [logging] конфигурации
+    (file, format, max_bytes, backup_count, rotate_when, success_sample_rate).
+    С enabled = false логирование не настраивается: информационные записи
+    не сохраняются, предупреждения и ошибки выводятся в stderr
+    :param config: конфигурация из conf.toml
+    :return: QueueListener для stop_logging или None
+    """
+    section: dict = get_settings(config).section("logging")
+    if not section.get("enabled", True):
+        return None
+    from log_setup import setup_logging
+
+    return setup_logging(
+        filename=section.get("file", "server.log"),
+        fmt=section.get("format", "text"),
+        max_bytes=int(section.get("max_bytes", 10 * 1024 * 1024)),
+        backup_count=int(section.get("backup_count", 5)),
+        rotate_when=section.get("rotate_when"),
+        success_sample_rate=float(section.get("success_sample_rate", 1.0)),
+        lean_records=True,
+    )
+
+
+def start_metrics(config: Config) -> MetricsReporter | None:
+    """
+    Запускает периодическую выгрузку метрик по секции [metrics] конфигурации
+    (interval - период в секундах, prometheus_file - файл в формате Prometheus)
+    :param config: конфигурация из conf.toml
+    :return: MetricsReporter, который нужно остановить при завершении,
+        или None, если секция не задана
+    """
+    section: dict = get_settings(config).section("metrics")
+    if not section:
+        return None
+    from metrics import Metrics, MetricsReporter
+
+    return MetricsReporter(
+        Metrics(),
+        float(section.get("interval", 10.0)),
+        section.get("prometheus_file"),
+    ).start()
+
+
+def log_result(result: SendResult) -> None:
+    """
+    Логирует результат отправки: успешные - с пометкой success для выборки,
+    неуспешные - всегда
+    """
+    if result.ok:
+        logging.info(
+            "Recipient: %s, Server response: %s",
+            result.recipient,
+            result.answer_code,
+            extra={"success": True},
+        )
+    else:
+        logging.error(
+            "Recipient: %s, Server response: %s, Error: %s",
+            result.recipient,
+            result.answer_code,
+            result.error,
+        )
+
+
+def get_request_template(config: Config) -> HttpRequestTemplate:
+    """
+    Создаёт шаблон запроса на отправку СМС с заголовками из конфигурации
+    :param config: конфигурация из conf.toml
+    :return: шаблон запроса
+    """
+    gateway: GatewaySettings = get_gateway(config)
+    return HttpRequestTemplate(
+        gateway.auth_b64,
+        gateway.host_header,
+        gateway.send_path,
+        "HTTP/1.1",
+        "application/json",
+    )
+
+
+def send_bulk(
+    records: Iterable[tuple[str, str, str]],
+    config: Config,
+    pool_size: int = 10,
+    metrics: Metrics | None = None,
+) -> BulkReport:
+    """
+    Выполняет пакетную отправку СМС через ограниченный пул
+    постоянных (keep-alive) соединений с сервером
+    (при балансировке - через свой пул для каждого шлюза; после изменения
+    conf.toml новые адрес и авторизация применяются к следующим запросам).
+    Сообщения, ожидающие повтора, не занимают потоки пула: они ждут
+    в очереди с задержкой и по её истечении отправляются раньше новых.
+    При заданной секции [dedup] повторы недавно отправленных сообщений
+    не отправляются, а при max_recipients больше 1 одинаковые сообщения
+    разным получателям объединяются в один запрос, см. AsyncSender.
+    С adaptive_concurrency число одновременных запросов (не больше
+    pool_size) подбирает AimdController
+    :param records: записи (отправитель, получатель, сообщение)
+    :param config: конфигурация из conf.toml
+    :param pool_size: максимальное число одновременных соединений
+    :param metrics: набор метрик для записи длительностей, байт и ошибок
+    :return: отчёт с результатами по каждому сообщению и пропускной способностью
+    """
+    import heapq
+    import threading
+    from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+    from contextlib import ExitStack
+    from itertools import count
+
+    from dedup import RECHECK_DELAY, get_idempotency_key
+    from pool import ConnectionPool
+    from segments import MessageGrouper
+
+    rate_limiter: TokenBucket | None = get_rate_limiter(config)
+    controller: AimdController | None = get_concurrency_controller(config, pool_size)
+    retry_policy: RetryPolicy = get_retry_policy(config)
+    balancer: LoadBalancer | None = get_balancer(config)
+    grouper: MessageGrouper = MessageGrouper(get_max_recipients(config))
+    reloader: SettingsReloader | None = get_settings_reloader(config)
+    # выбранный шлюз и шаблон запроса (меняются вместе при перечитывании)
+    target: tuple[GatewaySettings, HttpRequestTemplate] = (
+        get_gateway(config),
+        get_request_template(config),
+    )
+
+    def send_attempt(
+        index: int,
+        record: tuple[str, str | list[str], str],
+        template: HttpRequestTemplate,
+        pool: ConnectionPool,
+        idempotency_key: str | None,
+    ) -> SendResult:
+        sender, recipient, message = record
+        if rate_limiter is not None:
+            rate_limiter.wait()
+        started: float = time.perf_counter()
+        try:
+            data: bytes = template.to_bytes(sender, recipient, message, idempotency_key)
+            if metrics is not None:
+                metrics.observe_phases(serialize=time.perf_counter() - started)
+            https_resp: HttpResponseView = pool.request(data)
+        except Exception as e:
+            if metrics is not None:
+                metrics.observe_error(e)
+            return SendResult(
+                index,
+                sender,
+                recipient,
+                error=str(e) or type(e).__name__,
+                latency=time.perf_counter() - started,
+                retryable=is_retryable_error(e),
+            )
+        latency: float = time.perf_counter() - started
+        if metrics is not None:
+            metrics.observe_response(https_resp.answer_code, latency)
+        return SendResult(
+            index,
+            sender,
+            recipient,
+            answer_code=https_resp.answer_code,
+            latency=latency,
+            body=https_resp.body_bytes.decode(),
+        )
+
+    def get_pool(gateway: GatewaySettings) -> ConnectionPool:
+        # пулы по адресам шлюзов, в том числе появившимся после перечитывания
+        address: tuple[str, int] = (gateway.host, gateway.port)
+        with pools_lock:
+            if address not in pools:
+                pools[address] = stack.enter_context(
+                    ConnectionPool(
+                        gateway.host, gateway.port, max_size=pool_size, metrics=metrics
+                    )
+                )
+            return pools[address]
+
+    def send_once(
+        index: int, record: tuple[str, str | list[str], str], key: str | None
+    ) -> SendResult:
+        if balancer is None:
+            gateway, template = target
+            return send_attempt(index, record, template, get_pool(gateway), key)
+        endpoint: Endpoint = balancer.acquire()
+        result: SendResult = send_attempt(
+            index, record, endpoint.template, get_pool(endpoint.gateway), key
+        )
+        balancer.release(endpoint, result)
+        return result
+
+    def reload() -> None:
+        nonlocal target
+        settings: Settings | None = reloader.poll()
+        if settings is None:
+            return
+        target = (settings.gateway, get_request_template(settings))
+        if balancer is not None:
+            balancer.update(settings.gateways)
+
+    def get_limit() -> int:
+        # при adaptive_concurrency в работе не больше запросов, чем лимит AIMD
+        if controller is None:
+            return pool_size
+        return min(pool_size, int(controller.limit))
+
+    def run(executor: ThreadPoolExecutor) -> Iterator[SendResult]:
+        # повторы ждут своей очереди здесь, а не в потоках пула,
+        # и по истечении задержки отправляются раньше новых сообщений
+        requests: Iterator[tuple[int, tuple[str, str | list[str], str]]] = enumerate(
+            grouper.group(records)
+        )
+        running: dict[Future, tuple] = {}
+        delayed: list[tuple[float, int, tuple]] = []
+        sequence: Iterator[int] = count()
+
+        def start(item: tuple) -> SendResult | None:
+            # item: номер, запрос, ключи кэша идемпотентности
+            # (None - запрос ещё не проверен), попытка, время первой попытки
+            index, record, keys, attempt, first_started = item
+            if dedup is not None and keys is None:
+                reserved = dedup.reserve(record)
+                if reserved is None:
+                    # копия ждёт, пока оригинал будет доставлен или не доставлен
+                    heapq.heappush(
+                        delayed,
+                        (time.monotonic() + RECHECK_DELAY, next(sequence), item),
+                    )
+                    return None
+                record, keys = reserved
+                if not keys:
+                    return SendResult(index, record[0], record[1], error=DUPLICATE)
+                item = (index, record, keys, attempt, time.monotonic())
+            key: str | None = None
+            if keys:
+                key = get_idempotency_key(HttpRequestTemplate.body_bytes(*record))
+            running[executor.submit(send_once, index, record, key)] = item
+            return None
+
+        exhausted: bool = False
+        while True:
+            if reloader is not None:
+                reload()
+            now: float = time.monotonic()
+            while delayed and delayed[0][0] <= now and len(running) < get_limit():
+                if (duplicate := start(heapq.heappop(delayed)[2])) is not None:
+                    yield duplicate
+            while not exhausted and len(running) < get_limit():
+                request = next(requests, None)
+                if request is None:
+                    exhausted = True
+                    break
+                index, record = request
+                if (duplicate := start((index, record, None, 1, now))) is not None:
+                    yield duplicate
+            if not running:
+                if not delayed:
+                    return
+                time.sleep(max(0.0, delayed[0][0] - time.monotonic()))
+                continue
+            timeout: float | None = None
+            if delayed:
+                timeout = max(0.0, delayed[0][0] - time.monotonic())
+            done, _ = wait(running, timeout, FIRST_COMPLETED)
+            for future in done:
+                item: tuple = running.pop(future)
+                index, record, keys, attempt, first_started = item
+                result: SendResult = future.result()._replace(attempts=attempt)
+                if controller is not None:
+                    controller.on_result(result)
+                delay: float | None = retry_policy.next_delay(result, first_started)
+                if delay is not None:
+                    retry: tuple = (index, record, keys, attempt + 1, first_started)
+                    heapq.heappush(
+                        delayed, (time.monotonic() + delay, next(sequence), retry)
+                    )
+                    continue
+                if keys:
+                    dedup.finish(keys, result.ok)
+                yield result
+
+    started: float = time.perf_counter()
+    pools: dict[tuple[str, int], ConnectionPool] = {}
+    pools_lock: threading.Lock = threading.Lock()
+    with ExitStack() as stack:
+        if balancer is not None:
+            start_health_checks(balancer, config)
+            stack.callback(balancer.stop_health_checks)
+        dedup: IdempotencyCache | None = get_dedup_cache(config)
+        if dedup is not None:
+            stack.enter_context(dedup)
+        with ThreadPoolExecutor(max_workers=pool_size) as executor:
+            results: list[SendResult] = [
+                message_result
+                for result in run(executor)
+                for message_result in grouper.expand(result)
+            ]
+    results.sort(key=lambda result: result.index)
+    return BulkReport(results, time.perf_counter() - started)
+
+
+def make_async_sender(
+    config: Config,
+    concurrency: int = 100,
+    timeout: float = 10.0,
+    metrics: Metrics | None = None,
+) -> AsyncSender:
+    """
+    Создаёт асинхронный отправщик СМС по конфигурации
+    (ограничение скорости и адаптивная конкурентность
+    включаются параметрами rate_limit, burst и adaptive_concurrency,
+    подавление повторов - секцией [dedup]; кэш sender.dedup нужно закрыть)
+    :param config: конфигурация из conf.toml
+    :param concurrency: максимальное число одновременных запросов
+    :param timeout: таймаут одного запроса в секундах
+    :param metrics: набор метрик для записи длительностей, байт и ошибок
+    :return: отправщик
+    """
+    from async_sender import AsyncSender
+
+    gateway: GatewaySettings = get_gateway(config)
+    return AsyncSender(
+        gateway.host,
+        gateway.port,
+        gateway.auth_b64,
+        gateway.host_header,
+        path=gateway.send_path,
+        concurrency=concurrency,
+        timeout=timeout,
+        rate_limiter=get_rate_limiter(config),
+        controller=get_concurrency_controller(config, concurrency),
+        retry_policy=get_retry_policy(config),
+        metrics=metrics,
+        balancer=get_balancer(config),
+        dedup=get_dedup_cache(config),
+        max_recipients=get_max_recipients(config),
+        reloader=get_settings_reloader(config),
+    )
+
+
+def send_bulk_async(
+    records: Iterable[tuple[str, str, str]],
+    config: Config,
+    concurrency: int = 100,
+    timeout: float = 10.0,
+    metrics: Metrics | None = None,
+) -> BulkReport:
+    """
+    Выполняет конкурентную пакетную отправку СМС асинхронным клиентом
+    :param records: записи (отправитель, получатель, сообщение)
+    :param config: конфигурация из conf.toml
+    :param concurrency: максимальное число одновременных запросов
+    :param timeout: таймаут одного запроса в секундах
+    :param metrics: набор метрик для записи длительностей, байт и ошибок
+    :return: отчёт с результатами по каждому сообщению и пропускной способностью
+    """
+    import asyncio
+
+    sender: AsyncSender = make_async_sender(config, concurrency, timeout, metrics)
+    if sender.balancer is not None:
+        start_health_checks(sender.balancer, config)
+    try:
+        return asyncio.run(sender.send(records))
+    finally:
+        if sender.balancer is not None:
+            sender.balancer.stop_health_checks()
+        if sender.dedup is not None:
+            sender.dedup.close()
+
+
+async def stream_to_writer(
+    sender: AsyncSender,
+    records: Iterable[tuple[str, str, str]],
+    writer: ResultWriter,
+    outbox: Outbox | None = None,
+) -> None:
+    """
+    Отправляет записи и построчно записывает (и логирует) результаты
+    по мере получения; при заданном журнале отправляются только
+    незавершённые записи, а результаты сохраняются в журнал
+    """
+    if outbox is not None:
+        records = outbox.pending(records)
+    async for result in sender.stream(records):
+        if outbox is not None:
+            result = outbox.record(result)
+        writer.write(result)
+        log_result(result)
+
+
+def send_sharded(
+    records: list[tuple[str, str, str]],
+    config: Config,
+    processes: int,
+    concurrency: int = 100,
+    timeout: float = 10.0,
+    metrics: Metrics | None = None,
+) -> BulkReport:
+    """
+    Выполняет пакетную отправку СМС в нескольких процессах,
+    каждый со своими соединениями с сервером
+    (и своей копией кэша идемпотентности в памяти, поэтому повторы
+    подавляются только в пределах части пакета одного процесса)
+    :param records: записи (отправитель, получатель, сообщение)
+    :param config: конфигурация из conf.toml
+    :param processes: число процессов
+    :param concurrency: максимальное число одновременных запросов на процесс
+    :param timeout: таймаут одного запроса в секундах
+    :param metrics: набор метрик, в который собираются метрики всех процессов
+    :return: отчёт с результатами в порядке входных данных
+    """
+    from sharded import ShardedSender
+
+    sender: AsyncSender = make_async_sender(config, concurrency, timeout, metrics)
+    try:
+        with ShardedSender(sender, processes) as sharded:
+            return sharded.send(records)
+    finally:
+        if sender.dedup is not None:
+            sender.dedup.close()
+
+
+def stream_sharded_to_writer(
+    sharded: ShardedSender,
+    records: Iterable[tuple[str, str, str]],
+    writer: ResultWriter,
+    chunk_size: int,
+    outbox: Outbox | None = None,
+) -> None:
+    """
+    Отправляет записи частями по chunk_size в нескольких процессах
+    и записывает результаты в порядке входных данных
+    (при заданном журнале - см. stream_to_writer)
+    """
+    from itertools import islice
+
+    iterator = iter(records if outbox is None else outbox.pending(records))
+    offset: int = 0
+    while chunk := list(islice(iterator, chunk_size)):
+        for result in sharded.send(chunk, offset).results:
+            if outbox is not None:
+                result = outbox.record(result)
+            writer.write(result)
+            log_result(result)
+        offset += len(chunk)
+
+
+def run_bulk() -> None:
+    """
+    Пакетная отправка СМС из CSV/JSONL файла или stdin одним процессом:
+    записи читаются потоково, результаты пишутся в JSONL по мере получения,
+    поэтому память не зависит от размера рассылки.
+    С параметром --outbox состояние рассылки сохраняется в журнал,
+    и повторный запуск продолжает прерванную рассылку
+    :return: None
+    """
+    import asyncio
+    import sqlite3
+
+    from log_setup import stop_logging
+    from outbox import Outbox
+    from records import RecordFile, ResultWriter
+    from sharded import ShardedSender
+
+    args: argparse.Namespace = conf.get_bulk_args(
+        "Сервис по пакетной отправке смс сообщений"
+    )
+    listener: QueueListener | None = None
+    reporter: MetricsReporter | None = None
+    sender: AsyncSender | None = None
+    outbox: Outbox | None = None
+    try:
+        # ошибки настройки (conf.toml, логирование, метрики) выводятся так же,
+        # как ошибки отправки, а уже запущенные потоки останавливаются
+        settings: Settings = load_settings(
+            "conf.toml", args.gateway or os.environ.get("SMS_GATEWAY")
+        )
+        listener = start_logging(settings)
+        reporter = start_metrics(settings)
+        sender = make_async_sender(
+            settings,
+            args.concurrency,
+            args.timeout,
+            reporter.metrics if reporter is not None else None,
+        )
+        if sender.balancer is not None:
+            start_health_checks(sender.balancer, settings)
+        started: float = time.perf_counter()
+        if args.outbox:
+            outbox = Outbox(args.outbox, args.input)
+        resumed: bool = outbox is not None and outbox.resumed
+        with ResultWriter(args.output, append=resumed) as writer:
+            records: RecordFile = RecordFile(args.input, args.format)
+            if args.processes > 1:
+                with ShardedSender(sender, args.processes) as sharded:
+                    stream_sharded_to_writer(
+                        sharded,
+                        records,
+                        writer,
+                        args.processes * args.concurrency * SHARD_CHUNKS,
+                        outbox,
+                    )
+            else:
+                asyncio.run(stream_to_writer(sender, records, writer, outbox))
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Найдена ошибка: {e}", file=sys.stderr)
+        return
+    finally:
+        if sender is not None and sender.balancer is not None:
+            sender.balancer.stop_health_checks()
+        if sender is not None and sender.dedup is not None:
+            sender.dedup.close()
+        if outbox is not None:
+            outbox.close()
+        if reporter is not None:
+            reporter.stop()
+        stop_logging(listener)
+    elapsed: float = time.perf_counter() - started
+    total: int = writer.sent + writer.failed + writer.duplicates
+    print(
+        f"Sent: {writer.sent}, failed: {writer.failed}, "
+        f"duplicates: {writer.duplicates}, "
+        f"throughput: {total / elapsed if elapsed > 0 else 0.0:.1f} msg/s",
+        file=sys.stderr,
+    )
+
+
+def exchange_once(
+    server_name: str, port: int, res: bytes, metrics: Metrics | None = None
+) -> HttpResponseView:
+    """
+    Выполняет одну попытку: подключение, отправку запроса и чтение ответа
+    :param server_name: хост сервера
+    :param port: порт сервера
+    :param res: байты HTTP запроса
+    :param metrics: набор метрик для записи длительностей этапов и байт
+    :return: ленивое представление ответа сервера
+    """
+    started: float = time.perf_counter()
+    sock: socket.socket = connect(server_name, port)
+    try:
+        connected: float = time.perf_counter()
+        sock.sendall(res)
+        sent: float = time.perf_counter()
+        reader: ResponseReader = ResponseReader(sock)
+        head: bytes = reader.read_head()
+        first_byte: float = time.perf_counter()
+        data: bytes = reader.read_body(head)
+        read: float = time.perf_counter()
+    finally:
+        sock.close()
+    response: HttpResponseView = HttpResponseView(data)
+    if metrics is not None:
+        metrics.observe_phases(
+            connect=connected - started,
+            send=sent - connected,
+            first_byte=first_byte - sent,
+            read=read - first_byte,
+            parse=time.perf_counter() - read,
+        )
+        metrics.observe_transfer(len(res), len(data))
+    return response
 
 
 def make_request_to_serv() -> None:
     """
     Функция выполняет подключение, запрос к серверу, а также логирует резултат
+    При отказе соединения, таймауте или ответе 429/5xx запрос повторяется
+    согласно политике повторов из конфигурации
+    При заданной секции [dedup] повтор сообщения, уже отправленного
+    в пределах окна (в том числе предыдущим запуском), не отправляется
     В конце функкции выводится код ответа и текста ответа сервера
     :param server_name:
     :param port:
     :return: None
     """
+    listener = None
+    reporter: MetricsReporter | None = None
+    dedup: IdempotencyCache | None = None
+    # ключ этого запуска (запоминается, только если сообщение доставлено)
+    idempotency_key: str | None = None
+    delivered: bool = False
     try:
-        logging.basicConfig(
-            level=logging.INFO,
-            filename="server.log",
-            format="%(asctime)s %(levelname)s %(message)s",
-        )
-        config: dict[str, dict[str, str]] = conf.read_conf("conf.toml")
-
         args: argparse.Namespace = conf.get_script_args(
             ["sender", "recipient", "message"],
             ["Номер отправителя СМС", "Номер получателя СМС", "Текст СМС"],
             "Сервис по отправке смс сообщений",
         )
+        settings: Settings = load_settings("conf.toml", os.environ.get("SMS_GATEWAY"))
+        listener = start_logging(settings)
+        reporter = start_metrics(settings)
+        metrics: Metrics | None = reporter.metrics if reporter is not None else None
+
         logging.info(
             "Sender: %s, Recipient: %s, Message: %s",
             args.sender,
             args.recipient,
             args.message,
         )
-        auth_str: str = (
-            f"{config['test_sms_sender']['user']}:{config['test_sms_sender']['password']}"
-        )
-        auth_b64: str = base64.b64encode(auth_str.encode()).decode()
+        gateway: GatewaySettings = settings.gateway
         http_req: HttpRequest = cls.HttpRequest(
-            auth_b64,
-            config["test_sms_sender"]["server_url"],
+            gateway.auth_b64,
+            gateway.host_header,
             args.sender,
             args.recipient,
             args.message,
-            "/send_sms",
+            gateway.send_path,
             "HTTP/1.1",
             "application/json",
         )
-        server_name: str = config["test_sms_sender"]["server_url"].split(':')[1][2:]
-        port: int = int(config["test_sms_sender"]["server_url"].split(':')[2])
-        res: bytes = http_req.to_bytes()
-        sock = socket.socket()
-        sock.connect((server_name, port))
-        sock.send(res)
-        data: bytes = sock.recv(1024)
-        sock.close()
-        https_resp: HttpResponse = HttpResponse.from_bytes(data)
+        dedup = get_dedup_cache(settings)
+        if dedup is not None:
+            from dedup import DELIVERED, get_idempotency_key
+
+            key: str = get_idempotency_key(http_req.body_bytes)
+            if dedup.check(key) == DELIVERED:
+                logging.warning("Duplicate message suppressed: %s", key)
+                print(DUPLICATE)
+                return
+            idempotency_key = key
+        serialize_started: float = time.perf_counter()
+        res: bytes = http_req.to_bytes(idempotency_key)
+        if metrics is not None:
+            metrics.observe_phases(serialize=time.perf_counter() - serialize_started)
+        retry_policy: RetryPolicy = get_retry_policy(settings)
+        first_started: float = time.monotonic()
+        attempt: int = 1
+        while True:
+            started: float = time.perf_counter()
+            try:
+                https_resp: HttpResponseView = exchange_once(
+                    gateway.host, gateway.port, res, metrics
+                )
+            except Exception as e:
+                if metrics is not None:
+                    metrics.observe_error(e)
+                delay: float | None = retry_policy.delay_for(
+                    attempt, is_retryable_error(e), first_started
+                )
+                if delay is None:
+                    raise
+                logging.warning("Attempt %d failed: %s", attempt, e)
+            else:
+                if metrics is not None:
+                    metrics.observe_response(
+                        https_resp.answer_code, time.perf_counter() - started
+                    )
+                delay = retry_policy.delay_for(
+                    attempt, is_retryable_code(https_resp.answer_code), first_started
+                )
+                if delay is None:
+                    break
+                logging.warning(
+                    "Attempt %d failed: %s", attempt, https_resp.answer_code
+                )
+            time.sleep(delay)
+            attempt += 1
+        delivered = https_resp.answer_code.startswith("2")
         logging.info("Server response: %s", https_resp.answer_code)
         print(https_resp.answer_code)
     except ConnectionRefusedError:
@@ -73,7 +851,21 @@ def make_request_to_serv() -> None:
         )
     except Exception as e:
         print(f"Найдена ошибка: {e}")
+    finally:
+        if dedup is not None:
+            if idempotency_key is not None and delivered:
+                dedup.confirm(idempotency_key)
+            dedup.close()
+        if reporter is not None:
+            reporter.stop()
+        if listener is not None:
+            from log_setup import stop_logging
+
+            stop_logging(listener)
 
 
 if __name__ == "__main__":
-    make_request_to_serv()
+    if conf.is_bulk_mode():
+        run_bulk()
+    else:
+        make_request_to_serv()
@@ -0,0 +1,260 @@
+"""
+Модуль содержит метрики отправки СМС: гистограммы длительности этапов
+запроса (подключение, отправка, ожидание первого байта, чтение, разбор,
+формирование запроса) и полного времени по кодам ответа, счётчики байт
+и ошибок, а также их выгрузку строкой итогов и в текстовом формате Prometheus
+"""
+
+import logging
+import os
+import threading
+from bisect import bisect_left
+
+# границы корзин: от 0.1 мс до ~52 с, каждая вдвое больше предыдущей
+BUCKETS = tuple(round(0.0001 * 2**power, 7) for power in range(20))
+
+PHASES = ("serialize", "connect", "send", "first_byte", "read", "parse")
+
+
+class Histogram:
+    """
+    Гистограмма длительностей с фиксированными границами корзин (в секундах)
+    """
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        """
+        Добавляет значение в гистограмму
+        """
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other: "Histogram") -> None:
+        """
+        Добавляет значения другой гистограммы
+        """
+        self.counts = [own + added for own, added in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.count += other.count
+
+    def percentile(self, percent: float) -> float:
+        """
+        Оценивает перцентиль линейной интерполяцией внутри корзины,
+        в которую он попадает (границы соседних корзин отличаются вдвое,
+        поэтому оценка по верхней границе могла ошибаться до двух раз;
+        интерполяция ошибается не больше чем на ширину корзины)
+        :param percent: перцентиль от 0 до 100
+        :return: значение в секундах (inf - больше последней границы)
+        """
+        if not self.count:
+            return 0.0
+        rank: float = percent / 100 * self.count
+        seen: int = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                if index == len(BUCKETS):
+                    return float("inf")
+                lower: float = BUCKETS[index - 1] if index else 0.0
+                share: float = (rank - (seen - bucket_count)) / bucket_count
+                return lower + (BUCKETS[index] - lower) * share
+        return float("inf")
+
+
+class Metrics:
+    """
+    Потокобезопасный набор метрик клиента:
+    phases - гистограммы по этапам запроса
+    responses - гистограммы полного времени отправки по кодам ответа
+    bytes_sent, bytes_received - счётчики переданных байт
+    errors - счётчики ошибок по типу исключения
+    """
+
+    def __init__(self):
+        self.phases: dict[str, Histogram] = {phase: Histogram() for phase in PHASES}
+        self.responses: dict[str, Histogram] = {}
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.errors: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state: dict = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def merge(self, other: "Metrics") -> None:
+        """
+        Добавляет метрики другого набора (например, полученного из процесса)
+        """
+        with self._lock:
+            for own, histograms in (
+                (self.phases, other.phases),
+                (self.responses, other.responses),
+            ):
+                for key, histogram in histograms.items():
+                    own.setdefault(key, Histogram()).merge(histogram)
+            self.bytes_sent += other.bytes_sent
+            self.bytes_received += other.bytes_received
+            for error, error_count in other.errors.items():
+                self.errors[error] = self.errors.get(error, 0) + error_count
+
+    def observe_phases(self, **durations: float) -> None:
+        """
+        Добавляет длительности этапов запроса, например connect=0.01, send=0.001
+        """
+        with self._lock:
+            for phase, duration in durations.items():
+                self.phases[phase].observe(duration)
+
+    def observe_transfer(self, sent: int, received: int) -> None:
+        """
+        Учитывает размер запроса и ответа в байтах
+        """
+        with self._lock:
+            self.bytes_sent += sent
+            self.bytes_received += received
+
+    def observe_response(self, answer_code: str, latency: float) -> None:
+        """
+        Учитывает полученный ответ
+        :param answer_code: код ответа сервера
+        :param latency: полное время отправки в секундах
+        """
+        code: str = answer_code.split(" ", 1)[0]
+        with self._lock:
+            if code not in self.responses:
+                self.responses[code] = Histogram()
+            self.responses[code].observe(latency)
+
+    def observe_error(self, error: BaseException) -> None:
+        """
+        Учитывает ошибку отправки
+        """
+        name: str = type(error).__name__
+        with self._lock:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary_line(self) -> str:
+        """
+        Формирует строку итогов: число ответов по кодам с p50/p95/p99,
+        байты и ошибки
+        """
+        with self._lock:
+            parts: list[str] = [
+                f"{code}: {histogram.count} "
+                f"p50/p95/p99={histogram.percentile(50) * 1000:.1f}/"
+                f"{histogram.percentile(95) * 1000:.1f}/"
+                f"{histogram.percentile(99) * 1000:.1f} ms"
+                for code, histogram in sorted(self.responses.items())
+            ]
+            parts.append(f"sent {self.bytes_sent} B, received {self.bytes_received} B")
+            parts.append(f"errors {sum(self.errors.values())}")
+        return "; ".join(parts)
+
+    def to_prometheus(self) -> str:
+        """
+        Выгружает метрики в текстовом формате Prometheus
+        """
+        lines: list[str] = []
+
+        def histogram_lines(name: str, label: str, histogram: Histogram) -> None:
+            cumulative: int = 0
+            for bound, bucket_count in zip(BUCKETS, histogram.counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f"{name}_sum{{{label}}} {histogram.total}")
+            lines.append(f"{name}_count{{{label}}} {histogram.count}")
+
+        with self._lock:
+            lines.append("# TYPE sms_phase_seconds histogram")
+            for phase, histogram in self.phases.items():
+                histogram_lines("sms_phase_seconds", f'phase="{phase}"', histogram)
+            lines.append("# TYPE sms_request_seconds histogram")
+            for code, histogram in sorted(self.responses.items()):
+                histogram_lines("sms_request_seconds", f'code="{code}"', histogram)
+            lines.append("# TYPE sms_bytes_sent_total counter")
+            lines.append(f"sms_bytes_sent_total {self.bytes_sent}")
+            lines.append("# TYPE sms_bytes_received_total counter")
+            lines.append(f"sms_bytes_received_total {self.bytes_received}")
+            lines.append("# TYPE sms_errors_total counter")
+            for name, error_count in sorted(self.errors.items()):
+                lines.append(f'sms_errors_total{{type="{name}"}} {error_count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """
+        Атомарно записывает метрики в файл (для node_exporter textfile collector)
+        """
+        tmp_path: str = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+
+class MetricsReporter:
+    """
+    Периодически (раз в interval секунд) логирует строку итогов
+    и записывает файл метрик Prometheus в отдельном потоке:
+    metrics - набор метрик
+    interval - период выгрузки в секундах
+    prometheus_file - путь к файлу метрик или None
+    """
+
+    def __init__(
+        self,
+        metrics: Metrics,
+        interval: float = 10.0,
+        prometheus_file: str | None = None,
+    ):
+        self.metrics = metrics
+        self.interval = interval
+        self.prometheus_file = prometheus_file
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def report(self) -> None:
+        """
+        Выполняет одну выгрузку метрик (ошибка записи файла Prometheus
+        логируется как предупреждение)
+        """
+        logging.info("Metrics: %s", self.metrics.summary_line())
+        if self.prometheus_file:
+            # ошибка записи файла не должна останавливать выгрузку
+            # и подменять исключение при остановке в блоке finally
+            try:
+                self.metrics.write_prometheus(self.prometheus_file)
+            except OSError as e:
+                logging.warning("Metrics: cannot write %s: %s", self.prometheus_file, e)
+
+    def _run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.report()
+
+    def start(self) -> "MetricsReporter":
+        """
+        Запускает периодическую выгрузку
+        """
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Останавливает выгрузку и выполняет последнюю
+        """
+        self._stopped.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        self.report()
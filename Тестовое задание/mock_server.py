@@ -0,0 +1,352 @@
+"""
+Модуль содержит асинхронный тестовый сервер отправки СМС (замена Prism
+для нагрузочного и регрессионного тестирования): эндпоинт POST /send_sms,
+постоянные соединения, настраиваемые задержки ответов, доля ошибок 500,
+ответов 429 и разрывов соединения
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import threading
+
+from classes import HttpRequest, HttpResponse
+
+MAX_HEADER_SIZE = 64 * 1024
+
+REASONS = {
+    "200": "OK",
+    "400": "Bad Request",
+    "401": "Unauthorized",
+    "404": "Not Found",
+    "429": "Too Many Requests",
+    "500": "Internal Server Error",
+}
+
+
+class Latency:
+    """
+    Распределение задержки ответа сервера:
+    kind - вид распределения: "constant", "uniform" (mean ± spread),
+        "exponential" (со средним mean) или "lognormal"
+        (со средним mean и параметром формы spread)
+    mean - средняя задержка в секундах
+    spread - разброс (см. kind)
+    """
+
+    KINDS = ("constant", "uniform", "exponential", "lognormal")
+
+    def __init__(self, kind: str = "constant", mean: float = 0.0, spread: float = 0.0):
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown latency distribution: {kind!r}")
+        self.kind = kind
+        self.mean = mean
+        self.spread = spread
+
+    @classmethod
+    def parse(cls, value: str) -> "Latency":
+        """
+        Создаёт распределение из строки вида "kind:mean[:spread]",
+        например "exponential:0.01" или "lognormal:0.02:0.5"
+        """
+        kind, _, params = value.partition(":")
+        numbers: list[float] = [float(number) for number in params.split(":") if number]
+        return cls(kind, *numbers)
+
+    def sample(self, rng: random.Random) -> float:
+        """
+        Возвращает случайную задержку в секундах
+        """
+        if self.mean <= 0:
+            return 0.0
+        if self.kind == "uniform":
+            delay: float = rng.uniform(self.mean - self.spread, self.mean + self.spread)
+            return max(0.0, delay)
+        if self.kind == "exponential":
+            return rng.expovariate(1 / self.mean)
+        if self.kind == "lognormal":
+            mu: float = math.log(self.mean) - self.spread**2 / 2
+            return rng.lognormvariate(mu, self.spread)
+        return self.mean
+
+
+def wants_close(request: HttpRequest) -> bool:
+    """
+    Проверяет, просит ли клиент закрыть соединение после ответа
+    """
+    for name, value in request.extra_headers.items():
+        if name.lower() == "connection":
+            return value.strip().lower() == "close"
+    return request.protocol.upper() == "HTTP/1.0"
+
+
+class MockGateway:
+    """
+    Тестовый сервер отправки СМС:
+    host, port - адрес (port=0 - любой свободный порт, см. атрибут port)
+    auth_b64 - ожидаемое значение Basic авторизации (None - не проверяется)
+    latency - распределение задержки ответа
+    error_rate - доля ответов 500
+    throttle_rate - доля ответов 429
+    drop_rate - доля запросов, после которых соединение закрывается без ответа
+    keep_alive_timeout - сколько секунд ждать следующего запроса в соединении
+    keep_alive_max - сколько запросов обслуживать в одном соединении
+    seed - начальное значение генератора случайных чисел
+    Счётчики: connections, requests, dropped и responses (по кодам ответа)
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        auth_b64: str | None = None,
+        latency: Latency | None = None,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        drop_rate: float = 0.0,
+        keep_alive_timeout: int = 5,
+        keep_alive_max: int = 1000,
+        seed: int | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.auth_b64 = auth_b64
+        self.latency = latency or Latency()
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.drop_rate = drop_rate
+        self.keep_alive_timeout = keep_alive_timeout
+        self.keep_alive_max = keep_alive_max
+        self.connections = 0
+        self.requests = 0
+        self.dropped = 0
+        self.responses: dict[str, int] = {}
+        self._rng = random.Random(seed)
+        self._message_ids = 0
+        self._server: asyncio.AbstractServer | None = None
+        self._handlers: set[asyncio.Task] = set()
+        self._thread: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def _choose_code(self, request: HttpRequest) -> str:
+        if request.path != "/send_sms":
+            return "404"
+        if self.auth_b64 is not None and request.auth_b64 != self.auth_b64:
+            return "401"
+        chance: float = self._rng.random()
+        if chance < self.throttle_rate:
+            return "429"
+        if chance < self.throttle_rate + self.error_rate:
+            return "500"
+        return "200"
+
+    def _make_response(self, code: str, close: bool, remaining: int) -> bytes:
+        self.responses[code] = self.responses.get(code, 0) + 1
+        if code == "200":
+            self._message_ids += 1
+            body: dict[str, str] = {
+                "status": "success",
+                "message_id": f"{self._message_ids:07}",
+            }
+        else:
+            body = {"error": REASONS[code]}
+        return HttpResponse(
+            "HTTP/1.1",
+            f"{code} {REASONS[code]}",
+            "*",
+            "*",
+            "true",
+            "*",
+            "application/json",
+            "close" if close else "keep-alive",
+            f"timeout={self.keep_alive_timeout}, max={remaining}",
+            json.dumps(body),
+        ).to_bytes()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> bytes | None:
+        try:
+            head: bytes = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), self.keep_alive_timeout
+            )
+        except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+            return None
+        length: int = 0
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            if name.strip().lower() == b"content-length":
+                length = int(value)
+        return head + await reader.readexactly(length)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        self.connections += 1
+        self._handlers.add(asyncio.current_task())
+        served: int = 0
+        try:
+            while True:
+                try:
+                    data: bytes | None = await self._read_request(reader)
+                except (ValueError, asyncio.LimitOverrunError):
+                    # Content-Length не число или заголовки длиннее MAX_HEADER_SIZE:
+                    # границу следующего запроса не определить
+                    self.requests += 1
+                    writer.write(self._make_response("400", True, 0))
+                    await writer.drain()
+                    return
+                if data is None:
+                    return
+                self.requests += 1
+                served += 1
+                if self._rng.random() < self.drop_rate:
+                    self.dropped += 1
+                    return
+                try:
+                    request: HttpRequest | None = HttpRequest.from_bytes(data)
+                except ValueError:
+                    request = None
+                code: str = "400" if request is None else self._choose_code(request)
+                close: bool = (
+                    request is None
+                    or served >= self.keep_alive_max
+                    or wants_close(request)
+                )
+                delay: float = self.latency.sample(self._rng)
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(
+                    self._make_response(code, close, self.keep_alive_max - served)
+                )
+                await writer.drain()
+                if close:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.discard(asyncio.current_task())
+            writer.close()
+
+    async def start(self) -> "MockGateway":
+        """
+        Запускает сервер в текущем цикле событий
+        """
+        self._server = await asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_HEADER_SIZE, backlog=1024
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self) -> None:
+        """
+        Останавливает сервер и закрывает открытые соединения
+        """
+        if self._server is not None:
+            self._server.close()
+            for handler in list(self._handlers):
+                handler.cancel()
+            await asyncio.gather(*self._handlers, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> "MockGateway":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    def start_in_thread(self) -> "MockGateway":
+        """
+        Запускает сервер в отдельном потоке со своим циклом событий
+        (для синхронных клиентов в тестах и бенчмарках).
+        Ошибка запуска (например, занятый порт) выбрасывается в вызывающем потоке
+        """
+        started: threading.Event = threading.Event()
+        errors: list[BaseException] = []
+
+        def run() -> None:
+            self._loop = asyncio.new_event_loop()
+            try:
+                self._loop.run_until_complete(self.start())
+            except BaseException as e:
+                errors.append(e)
+                self._loop.close()
+                return
+            finally:
+                started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.close())
+            # соединения, принятые перед остановкой, ещё могут подключаться
+            pending: set[asyncio.Task] = asyncio.all_tasks(self._loop)
+            if pending:
+                for task in pending:
+                    task.cancel()
+                self._loop.run_until_complete(
+                    asyncio.gather(*pending, return_exceptions=True)
+                )
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+        if errors:
+            self._thread.join()
+            self._thread = None
+            raise errors[0]
+        return self
+
+    def stop_thread(self) -> None:
+        """
+        Останавливает сервер, запущенный start_in_thread
+        """
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+
+def get_server_args() -> argparse.Namespace:
+    """
+    Разбирает аргументы командной строки тестового сервера
+    """
+    parser = argparse.ArgumentParser(description="Тестовый сервер отправки смс")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4010)
+    parser.add_argument(
+        "--latency",
+        type=Latency.parse,
+        default=Latency(),
+        help='распределение задержки "kind:mean[:spread]", например exponential:0.01',
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--throttle-rate", type=float, default=0.0)
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--keep-alive-max", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=None)
+    return parser.parse_args()
+
+
+async def serve(args: argparse.Namespace) -> None:
+    """
+    Запускает тестовый сервер и обслуживает запросы до прерывания
+    """
+    gateway: MockGateway = MockGateway(
+        args.host,
+        args.port,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        drop_rate=args.drop_rate,
+        keep_alive_max=args.keep_alive_max,
+        seed=args.seed,
+    )
+    async with gateway:
+        print(f"Mock SMS gateway listening on {args.host}:{gateway.port}")
+        await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(get_server_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,235 @@
+"""
+Модуль содержит журнал отправки (outbox) в SQLite в режиме WAL:
+каждое сообщение рассылки записывается в журнал до отправки,
+затем в нём сохраняются состояние, число попыток и message_id ответа сервера.
+После аварийного завершения повторный запуск с тем же журналом
+досылает незавершённые сообщения и продолжает чтение входных данных
+с места остановки, не отправляя повторно уже доставленные
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator
+
+from records import RecordFile
+from results import SendResult
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    idx INTEGER PRIMARY KEY,
+    sender TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    message TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    answer_code TEXT NOT NULL DEFAULT '',
+    message_id TEXT,
+    error TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+def get_message_id(body: str) -> str | None:
+    """
+    Извлекает message_id из JSON тела ответа сервера
+    """
+    try:
+        message_id = json.loads(body).get("message_id")
+    except (ValueError, AttributeError):
+        return None
+    return None if message_id is None else str(message_id)
+
+
+def get_state(result: SendResult) -> str:
+    """
+    Возвращает состояние сообщения в журнале по результату отправки
+    """
+    if result.ok:
+        return "sent"
+    return "duplicate" if result.duplicate else "failed"
+
+
+class Outbox:
+    """
+    Журнал отправки рассылки:
+    path - файл базы SQLite
+    source - идентификатор входных данных (например, путь к файлу);
+        журнал нельзя продолжить с другими входными данными
+    commit_every - после скольких изменений фиксировать транзакцию
+    commit_interval - не реже чем раз в сколько секунд фиксировать транзакцию
+    Изменения записываются на диск (fsync) пачками при фиксации транзакции,
+    поэтому после сбоя повторно могут быть отправлены только сообщения
+    из последней незафиксированной пачки (доставка "хотя бы один раз").
+    Методы безопасны для вызова из разных потоков
+    """
+
+    def __init__(
+        self,
+        path: str,
+        source: str = "",
+        commit_every: int = 1000,
+        commit_interval: float = 1.0,
+    ):
+        self.path = path
+        self.commit_every = commit_every
+        self.commit_interval = commit_interval
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._changes = 0
+        self._last_commit = time.monotonic()
+        # номер записи в порядке выдачи pending -> номер во входных данных
+        self._indexes: dict[int, int] = {}
+        self._issued = 0
+        stored_source: str | None = self._get_meta("source")
+        if stored_source is None:
+            self._set_meta("source", source)
+            self._db.commit()
+        elif stored_source != source:
+            raise ValueError(
+                f"Outbox {path} belongs to {stored_source!r}, not to {source!r}"
+            )
+        self._scanned = int(self._get_meta("scanned") or 0)
+        # место во входном файле сразу после _scanned записей
+        # (None - журнал прежней версии или входные данные из stdin)
+        position: str | None = self._get_meta("position")
+        self._position: tuple[int, int] | None = (
+            tuple(json.loads(position)) if position else None
+        )
+        self.resumed = self._scanned > 0
+
+    def _get_meta(self, key: str) -> str | None:
+        row: tuple | None = self._db.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _set_meta(self, key: str, value: str) -> None:
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value)
+        )
+
+    def _changed(self) -> None:
+        self._changes += 1
+        if (
+            self._changes >= self.commit_every
+            or time.monotonic() - self._last_commit >= self.commit_interval
+        ):
+            self._commit()
+
+    def _commit(self) -> None:
+        self._set_meta("scanned", str(self._scanned))
+        self._set_meta("position", json.dumps(self._position) if self._position else "")
+        self._db.commit()
+        self._changes = 0
+        self._last_commit = time.monotonic()
+
+    def _issue(self, idx: int) -> None:
+        self._indexes[self._issued] = idx
+        self._issued += 1
+
+    def pending(
+        self, records: Iterable[tuple[str, str, str]]
+    ) -> Iterator[tuple[str, str, str]]:
+        """
+        Выдаёт записи, которые нужно отправить: сначала незавершённые
+        из журнала, затем ещё не прочитанные записи входных данных
+        (уже обработанные при прошлом запуске пропускаются без обращения
+        к журналу), каждая новая запись заносится в журнал.
+        Для records.RecordFile журнал хранит смещение во входном файле,
+        и чтение продолжается с него без повторного разбора прочитанной
+        части; другие источники прочитанная часть пропускается записями.
+        Результаты отправки выданных записей передаются в record
+        :param records: все записи рассылки (отправитель, получатель, сообщение)
+        :return: генератор записей для отправки
+        """
+        with self._lock:
+            unfinished: list[tuple[int, str, str, str]] = self._db.execute(
+                "SELECT idx, sender, recipient, message FROM messages "
+                "WHERE state = 'queued' ORDER BY idx"
+            ).fetchall()
+        for idx, sender, recipient, message in unfinished:
+            with self._lock:
+                self._issue(idx)
+            yield sender, recipient, message
+        source: RecordFile | None = None
+        if isinstance(records, RecordFile) and records.seekable:
+            source = records
+        iterator: Iterator[tuple[str, str, str]]
+        if source is not None and (self._position or not self._scanned):
+            source.seek(self._position or (0, 0))
+            iterator = iter(source)
+        else:
+            if source is None:
+                self._position = None
+            iterator = iter(records)
+            for _ in range(self._scanned):
+                if next(iterator, None) is None:
+                    return
+        for record in iterator:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO messages (idx, sender, recipient, message) "
+                    "VALUES (?, ?, ?, ?)",
+                    (self._scanned, *record),
+                )
+                self._issue(self._scanned)
+                self._scanned += 1
+                if source is not None:
+                    self._position = source.position
+                self._changed()
+            yield record
+
+    def record(self, result: SendResult) -> SendResult:
+        """
+        Сохраняет итог отправки записи, выданной pending
+        :param result: результат, index которого - номер записи в порядке выдачи
+        :return: результат с index, равным номеру записи во входных данных
+        """
+        with self._lock:
+            idx: int = self._indexes.pop(result.index)
+            self._db.execute(
+                "UPDATE messages SET state = ?, attempts = ?, answer_code = ?, "
+                "message_id = ?, error = ? WHERE idx = ?",
+                (
+                    get_state(result),
+                    result.attempts,
+                    result.answer_code,
+                    get_message_id(result.body) if result.ok else None,
+                    result.error,
+                    idx,
+                ),
+            )
+            self._changed()
+        return result._replace(index=idx)
+
+    def counts(self) -> dict[str, int]:
+        """
+        Возвращает число сообщений журнала по состояниям
+        (queued, sent, failed, duplicate) с учётом незафиксированных изменений
+        """
+        with self._lock:
+            return dict(
+                self._db.execute(
+                    "SELECT state, COUNT(*) FROM messages GROUP BY state"
+                ).fetchall()
+            )
+
+    def close(self) -> None:
+        """
+        Фиксирует оставшиеся изменения и закрывает журнал
+        """
+        with self._lock:
+            self._commit()
+            self._db.close()
+
+    def __enter__(self) -> "Outbox":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
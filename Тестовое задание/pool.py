@@ -0,0 +1,223 @@
+"""
+Модуль содержит пул постоянных (keep-alive) HTTP/1.1 соединений
+с сервером, позволяющий отправлять множество запросов
+без повторного установления TCP соединения
+"""
+
+import socket
+import threading
+import time
+from collections import deque
+
+from classes import HttpResponse, HttpResponseView
+from http_reader import ResponseReader
+from metrics import Metrics
+from settings import connect
+
+
+def parse_keep_alive(value: str) -> dict[str, int]:
+    """
+    Разбирает значение заголовка Keep-Alive (например, "timeout=5, max=100")
+    :param value: значение заголовка
+    :return: словарь параметров с целочисленными значениями
+    """
+    params: dict[str, int] = {}
+    for part in value.split(","):
+        name, _, number = part.strip().partition("=")
+        if name and number.strip().isdigit():
+            params[name.lower()] = int(number)
+    return params
+
+
+class PooledConnection:
+    """
+    Соединение из пула, хранит сокет, читателя ответов с его буфером
+    и ограничения, полученные от сервера в заголовке Keep-Alive:
+    max_requests - сколько ещё запросов допускает сервер
+    idle_timeout - сколько секунд соединение может простаивать
+    """
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.reader = ResponseReader(sock)
+        self.requests_done = 0
+        self.max_requests: int | None = None
+        self.idle_timeout: float | None = None
+        self.last_used = time.monotonic()
+
+    def is_expired(self) -> bool:
+        """
+        Проверяет, закрыто ли соединение сервером
+        или исчерпаны ли лимиты Keep-Alive для него
+        """
+        if self.reader.eof:
+            return True
+        if self.max_requests is not None and self.requests_done >= self.max_requests:
+            return True
+        if self.idle_timeout is not None:
+            return time.monotonic() - self.last_used >= self.idle_timeout
+        return False
+
+    def update(self, response: HttpResponse | HttpResponseView) -> None:
+        """
+        Обновляет ограничения соединения по заголовку Keep-Alive ответа
+        """
+        self.requests_done += 1
+        self.last_used = time.monotonic()
+        params: dict[str, int] = parse_keep_alive(response.keep_alive)
+        if "max" in params:
+            self.max_requests = self.requests_done + params["max"]
+        if "timeout" in params:
+            self.idle_timeout = params["timeout"]
+
+    def close(self) -> None:
+        """
+        Закрывает сокет соединения
+        """
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def is_keep_alive(response: HttpResponse | HttpResponseView) -> bool:
+    """
+    Определяет, можно ли повторно использовать соединение после ответа:
+    в HTTP/1.1 соединение постоянное, если сервер не прислал Connection: close,
+    в HTTP/1.0 - только при явном Connection: keep-alive
+    """
+    connection: str = response.connection.strip().lower()
+    if response.protocol.upper() == "HTTP/1.0":
+        return connection == "keep-alive"
+    return connection != "close"
+
+
+class ConnectionPool:
+    """
+    Ограниченный пул постоянных соединений с сервером,
+    безопасный для использования из нескольких потоков:
+    host, port - адрес сервера
+    max_size - максимальное число одновременно открытых соединений
+    timeout - таймаут подключения и чтения в секундах
+    metrics - набор метрик для длительностей этапов запросов и счётчиков байт
+    """
+
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_size: int = 10,
+        timeout: float = 10.0,
+        metrics: Metrics | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.timeout = timeout
+        self.metrics = metrics
+        self.connections_opened = 0
+        self._idle: deque[PooledConnection] = deque()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _connect(self) -> PooledConnection:
+        started: float = time.perf_counter()
+        sock: socket.socket = connect(self.host, self.port, self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if self.metrics is not None:
+            self.metrics.observe_phases(connect=time.perf_counter() - started)
+        with self._lock:
+            self.connections_opened += 1
+        return PooledConnection(sock)
+
+    def acquire(self) -> tuple[PooledConnection, bool]:
+        """
+        Выдаёт свободное соединение из пула или открывает новое,
+        блокируется, если открыто max_size соединений
+        :return: соединение и признак того, что оно было использовано ранее
+        """
+        if self._closed:
+            raise RuntimeError("Connection pool is closed")
+        self._slots.acquire()
+        try:
+            with self._lock:
+                while self._idle:
+                    conn: PooledConnection = self._idle.pop()
+                    if not conn.is_expired():
+                        return conn, True
+                    conn.close()
+            return self._connect(), False
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(
+        self, conn: PooledConnection, response: HttpResponseView | None
+    ) -> None:
+        """
+        Возвращает соединение в пул, если сервер разрешил его повторное
+        использование, иначе закрывает его
+        :param conn: соединение
+        :param response: полученный ответ или None, если запрос не удался
+        """
+        reusable: bool = False
+        if response is not None:
+            conn.update(response)
+            reusable = is_keep_alive(response) and not conn.is_expired()
+        with self._lock:
+            if reusable and not self._closed:
+                self._idle.append(conn)
+            else:
+                conn.close()
+        self._slots.release()
+
+    def request(self, data: bytes) -> HttpResponseView:
+        """
+        Отправляет запрос по одному из соединений пула и возвращает ответ.
+        Если ранее использованное соединение было закрыто сервером,
+        запрос повторяется по другому соединению
+        :param data: байты HTTP запроса
+        :return: ленивое представление ответа сервера
+        """
+        while True:
+            conn, reused = self.acquire()
+            response: HttpResponseView | None = None
+            try:
+                sending: float = time.perf_counter()
+                conn.sock.sendall(data)
+                sent: float = time.perf_counter()
+                head: bytes = conn.reader.read_head()
+                first_byte: float = time.perf_counter()
+                raw: bytes = conn.reader.read_body(head)
+                read: float = time.perf_counter()
+                response = HttpResponseView(raw)
+                if self.metrics is not None:
+                    self.metrics.observe_phases(
+                        send=sent - sending,
+                        first_byte=first_byte - sent,
+                        read=read - first_byte,
+                        parse=time.perf_counter() - read,
+                    )
+                    self.metrics.observe_transfer(len(data), len(raw))
+                return response
+            except ConnectionError:
+                if not reused:
+                    raise
+            finally:
+                self.release(conn, response)
+
+    def close(self) -> None:
+        """
+        Закрывает все свободные соединения пула
+        """
+        with self._lock:
+            self._closed = True
+            while self._idle:
+                self._idle.pop().close()
+
+    def __enter__(self) -> "ConnectionPool":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,174 @@
+"""
+Модуль содержит ограничение скорости отправки (token bucket)
+и адаптивное ограничение числа одновременных запросов (AIMD),
+которые удерживают клиент на максимальной скорости,
+не вызывая ограничений со стороны сервера
+"""
+
+import asyncio
+import threading
+import time
+
+from results import SendResult
+
+
+def is_overload(result: SendResult) -> bool:
+    """
+    Проверяет, сигнализирует ли результат о перегрузке сервера:
+    ошибка соединения, ответ 429 или 5xx
+    """
+    if result.error:
+        return True
+    code: str = result.answer_code.split(" ", 1)[0]
+    return code == "429" or code.startswith("5")
+
+
+class TokenBucket:
+    """
+    Ограничитель скорости "корзина токенов":
+    rate - средняя скорость в сообщениях в секунду
+    burst - сколько сообщений можно отправить подряд без ожидания
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError("Rate limit must be positive")
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __getstate__(self) -> dict:
+        state: dict = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Забирает один токен (при необходимости в долг)
+        :return: сколько секунд нужно подождать перед отправкой
+        """
+        with self._lock:
+            now: float = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def wait(self) -> None:
+        """
+        Блокирует поток, пока не наступит очередь отправки
+        """
+        delay: float = self.reserve()
+        if delay:
+            time.sleep(delay)
+
+    async def acquire(self) -> None:
+        """
+        Ожидает (не блокируя цикл событий), пока не наступит очередь отправки
+        """
+        delay: float = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+
+class AimdController:
+    """
+    Адаптивный ограничитель числа одновременных запросов (AIMD):
+    при успешных ответах лимит растёт на increase за каждые limit ответов,
+    при 429/5xx, ошибках соединения или росте сглаженной задержки выше
+    latency_tolerance минимальной лимит умножается на decrease
+    (не чаще одного раза за время ответа сервера).
+    До первой перегрузки действует медленный старт: лимит растёт
+    на increase после каждого успешного ответа, то есть удваивается
+    за каждые limit ответов, и max_limit достигается за log2(max_limit)
+    окон, а не за ~max_limit² / 2 ответов:
+    min_limit, max_limit - границы лимита
+    initial - начальный лимит, по умолчанию равен min_limit
+    """
+
+    def __init__(
+        self,
+        min_limit: int = 1,
+        max_limit: int = 100,
+        initial: int | None = None,
+        increase: float = 1.0,
+        decrease: float = 0.5,
+        latency_tolerance: float = 2.0,
+    ):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(initial or min_limit)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_tolerance = latency_tolerance
+        self.base_latency: float | None = None
+        self.smoothed_latency: float | None = None
+        self.in_flight = 0
+        self.slow_start = True
+        self._last_decrease = 0.0
+        self._condition: asyncio.Condition | None = None
+
+    def on_result(self, result: SendResult) -> None:
+        """
+        Пересчитывает лимит по результату очередного запроса
+        """
+        now: float = time.monotonic()
+        overloaded: bool = is_overload(result)
+        if not overloaded and result.latency > 0:
+            if self.smoothed_latency is None:
+                self.smoothed_latency = result.latency
+            else:
+                self.smoothed_latency += (result.latency - self.smoothed_latency) * 0.1
+            if self.base_latency is None or result.latency < self.base_latency:
+                self.base_latency = result.latency
+            else:
+                # базовая задержка медленно "забывает" старые минимумы
+                self.base_latency += (result.latency - self.base_latency) * 0.01
+            overloaded = (
+                self.smoothed_latency > self.base_latency * self.latency_tolerance
+            )
+        if overloaded:
+            self.slow_start = False
+            if now - self._last_decrease >= (self.base_latency or result.latency):
+                self.limit = max(self.min_limit, self.limit * self.decrease)
+                self._last_decrease = now
+        elif self.slow_start:
+            self.limit = min(self.max_limit, self.limit + self.increase)
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+
+    def reset(self) -> None:
+        """
+        Подготавливает ограничитель к работе в новом цикле событий
+        """
+        self.in_flight = 0
+        self._condition = None
+
+    async def acquire(self) -> None:
+        """
+        Ожидает, пока число выполняемых запросов не станет меньше лимита
+        """
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, result: SendResult) -> None:
+        """
+        Освобождает место после завершения запроса и пересчитывает лимит
+        """
+        self.on_result(result)
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
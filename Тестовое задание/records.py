@@ -0,0 +1,183 @@
+"""
+Модуль содержит потоковое чтение записей для пакетной отправки СМС
+из CSV и JSONL файлов (или stdin) и потоковую запись результатов в JSONL
+"""
+
+import csv
+import json
+import sys
+from typing import IO, Iterable, Iterator
+
+from results import SendResult
+
+FIELDS = ("sender", "recipient", "message")
+
+
+def detect_format(path: str, fmt: str | None = None) -> str:
+    """
+    Определяет формат входных данных по явному указанию или расширению файла
+    :param path: путь к файлу или "-" для stdin
+    :param fmt: явно указанный формат ("csv" или "jsonl")
+    :return: формат
+    """
+    if fmt:
+        return fmt
+    if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+        return "jsonl"
+    return "csv"
+
+
+def read_csv_records(
+    stream: Iterable[str], start: int = 1
+) -> Iterator[tuple[str, str, str]]:
+    """
+    Построчно читает записи из CSV (sender,recipient,message),
+    строка заголовка с именами полей пропускается
+    :param stream: строки CSV
+    :param start: номер первой строки (для сообщений об ошибках)
+    """
+    for line_no, row in enumerate(csv.reader(stream), start=start):
+        if not row:
+            continue
+        if line_no == 1 and tuple(field.strip().lower() for field in row) == FIELDS:
+            continue
+        if len(row) != 3:
+            raise ValueError(f"Line {line_no}: expected 3 CSV fields, got {len(row)}")
+        yield row[0], row[1], row[2]
+
+
+def read_jsonl_records(
+    stream: Iterable[str], start: int = 1
+) -> Iterator[tuple[str, str, str]]:
+    """
+    Построчно читает записи из JSONL:
+    {"sender": ..., "recipient": ..., "message": ...}
+    :param stream: строки JSONL
+    :param start: номер первой строки (для сообщений об ошибках)
+    """
+    for line_no, line in enumerate(stream, start=start):
+        if not line.strip():
+            continue
+        try:
+            record: dict[str, str] = json.loads(line)
+            fields: tuple[str, ...] = tuple(str(record[name]) for name in FIELDS)
+        except (ValueError, KeyError, TypeError) as e:
+            raise ValueError(f"Line {line_no}: malformed JSONL record: {e}") from e
+        yield fields[0], fields[1], fields[2]
+
+
+class RecordFile:
+    """
+    Записи рассылки из файла или stdin ("-"), которые читаются лениво
+    и чтение которых можно продолжить с места остановки без повторного
+    разбора прочитанной части (см. outbox.Outbox.pending):
+    path - путь к файлу или "-" для stdin
+    fmt - формат ("csv" или "jsonl"), по умолчанию определяется по расширению
+    position - (смещение в байтах, номер строки) сразу после последней
+        выданной записи; seek задаёт место, с которого начнётся чтение
+    Каждая CSV запись (в том числе с переводами строк в кавычках)
+    занимает целое число строк, поэтому смещение всегда на границе строки
+    """
+
+    def __init__(self, path: str, fmt: str | None = None):
+        self.path = path
+        self.fmt = detect_format(path, fmt)
+        self.position: tuple[int, int] = (0, 0)
+        self._read: tuple[int, int] = self.position
+
+    @property
+    def seekable(self) -> bool:
+        """
+        Признак того, что чтение можно начать с произвольного места (не stdin)
+        """
+        return self.path != "-"
+
+    def seek(self, position: tuple[int, int]) -> None:
+        """
+        Задаёт место, с которого начнётся следующее чтение
+        :param position: значение position после выданной ранее записи
+        """
+        self.position = self._read = position
+
+    def _lines(self, stream: IO[bytes]) -> Iterator[str]:
+        offset, line_no = self.position
+        for line in stream:
+            offset += len(line)
+            line_no += 1
+            self._read = (offset, line_no)
+            yield line.decode("utf-8")
+
+    def __iter__(self) -> Iterator[tuple[str, str, str]]:
+        reader = read_jsonl_records if self.fmt == "jsonl" else read_csv_records
+        if not self.seekable:
+            yield from reader(sys.stdin)
+            return
+        with open(self.path, "rb") as stream:
+            stream.seek(self.position[0])
+            for record in reader(self._lines(stream), self.position[1] + 1):
+                self.position = self._read
+                yield record
+
+
+def read_records(path: str, fmt: str | None = None) -> Iterator[tuple[str, str, str]]:
+    """
+    Лениво читает записи из файла или stdin ("-"), не загружая их в память целиком
+    :param path: путь к файлу или "-" для stdin
+    :param fmt: формат ("csv" или "jsonl"), по умолчанию определяется по расширению
+    :return: генератор записей (отправитель, получатель, сообщение)
+    """
+    return iter(RecordFile(path, fmt))
+
+
+def result_to_json(result: SendResult) -> str:
+    """
+    Преобразует результат отправки в строку JSONL
+    """
+    return json.dumps(result._asdict(), ensure_ascii=False)
+
+
+class ResultWriter:
+    """
+    Построчно записывает результаты отправки в JSONL файл или stdout ("-")
+    и подсчитывает итоги (sent, failed, duplicates):
+    path - путь к файлу результатов
+    append - дописывать результаты в конец существующего файла
+        (при продолжении прерванной рассылки)
+    """
+
+    def __init__(self, path: str, append: bool = False):
+        self.path = path
+        self.sent = 0
+        self.failed = 0
+        self.duplicates = 0
+        self._stream: IO[str] = (
+            sys.stdout
+            if path == "-"
+            else open(path, "a" if append else "w", encoding="utf-8")
+        )
+
+    def write(self, result: SendResult) -> None:
+        """
+        Записывает один результат
+        """
+        if result.ok:
+            self.sent += 1
+        elif result.duplicate:
+            self.duplicates += 1
+        else:
+            self.failed += 1
+        self._stream.write(result_to_json(result) + "\n")
+
+    def close(self) -> None:
+        """
+        Сбрасывает буфер и закрывает файл результатов
+        """
+        self._stream.flush()
+        if self._stream is not sys.stdout:
+            self._stream.close()
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,124 @@
+"""
+Модуль содержит классы результатов отправки СМС:
+результат по одному сообщению и сводный отчёт по пакету
+"""
+
+import math
+from typing import NamedTuple
+
+DUPLICATE = "Duplicate message suppressed"
+
+
+class SendResult(NamedTuple):
+    """
+    Результат отправки одного сообщения:
+    index - порядковый номер сообщения в пакете
+    sender - отправитель
+    recipient - получатель
+    answer_code - код ответа сервера (пустой при ошибке)
+    error - текст ошибки (пустой при успешной отправке)
+    latency - время отправки и получения ответа в секундах
+    body - тело ответа сервера
+    attempts - количество выполненных попыток отправки
+    retryable - признак того, что ошибку имеет смысл повторить
+    segments - количество сегментов SMS сообщения (см. segments.get_segment_info)
+    """
+
+    index: int
+    sender: str
+    recipient: str
+    answer_code: str = ""
+    error: str = ""
+    latency: float = 0.0
+    body: str = ""
+    attempts: int = 1
+    retryable: bool = False
+    segments: int = 1
+
+    @property
+    def ok(self) -> bool:
+        """
+        Признак успешной отправки (ответ сервера с кодом 2xx)
+        """
+        return not self.error and self.answer_code.startswith("2")
+
+    @property
+    def duplicate(self) -> bool:
+        """
+        Признак повтора недавно отправленного сообщения, который не отправлялся
+        (см. dedup.IdempotencyCache)
+        """
+        return self.error == DUPLICATE
+
+
+class BulkReport(NamedTuple):
+    """
+    Сводный отчёт по пакетной отправке:
+    results - результаты по каждому сообщению в порядке входных данных
+    elapsed - общее время отправки пакета в секундах
+    """
+
+    results: list[SendResult]
+    elapsed: float
+
+    @property
+    def sent(self) -> int:
+        """
+        Количество успешно отправленных сообщений
+        """
+        return sum(1 for result in self.results if result.ok)
+
+    @property
+    def duplicates(self) -> int:
+        """
+        Количество подавленных повторов сообщений
+        """
+        return sum(1 for result in self.results if result.duplicate)
+
+    @property
+    def failed(self) -> int:
+        """
+        Количество сообщений, отправка которых завершилась неуспешно
+        """
+        return len(self.results) - self.sent - self.duplicates
+
+    @property
+    def segments(self) -> int:
+        """
+        Количество сегментов SMS успешно отправленных сообщений
+        """
+        return sum(result.segments for result in self.results if result.ok)
+
+    @property
+    def throughput(self) -> float:
+        """
+        Пропускная способность в сообщениях в секунду
+        """
+        if self.elapsed <= 0:
+            return 0.0
+        return len(self.results) / self.elapsed
+
+    def latency_percentile(self, percent: float) -> float:
+        """
+        Перцентиль времени отправки сообщений (метод ближайшего ранга)
+        :param percent: перцентиль от 0 до 100
+        :return: время в секундах
+        """
+        latencies: list[float] = sorted(result.latency for result in self.results)
+        if not latencies:
+            return 0.0
+        rank: int = max(1, math.ceil(percent / 100 * len(latencies)))
+        return latencies[rank - 1]
+
+    def summary(self) -> str:
+        """
+        Формирует строку с итогами отправки пакета
+        """
+        return (
+            f"Sent: {self.sent}, failed: {self.failed}, "
+            f"duplicates: {self.duplicates}, segments: {self.segments}, "
+            f"throughput: {self.throughput:.1f} msg/s, "
+            f"latency p50/p95/p99: {self.latency_percentile(50) * 1000:.1f}/"
+            f"{self.latency_percentile(95) * 1000:.1f}/"
+            f"{self.latency_percentile(99) * 1000:.1f} ms"
+        )
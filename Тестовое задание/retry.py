@@ -0,0 +1,95 @@
+"""
+Модуль содержит классификацию повторяемых ошибок отправки
+и политику повторов с экспоненциальной задержкой и случайным разбросом
+"""
+
+import random
+import time
+
+from results import SendResult
+
+RETRYABLE_CODES = ("429", "500", "502", "503", "504")
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """
+    Проверяет, имеет ли смысл повторить запрос после исключения:
+    отказ или разрыв соединения, преждевременный конец ответа, таймаут
+    """
+    return isinstance(error, (ConnectionError, EOFError, TimeoutError))
+
+
+def is_retryable_code(answer_code: str) -> bool:
+    """
+    Проверяет, является ли код ответа сервера временной ошибкой (429, 5xx)
+    """
+    return answer_code.split(" ", 1)[0] in RETRYABLE_CODES
+
+
+def is_retryable(result: SendResult) -> bool:
+    """
+    Проверяет, имеет ли смысл повторить отправку по результату:
+    повторяемая ошибка соединения или ответ 429/5xx
+    """
+    if result.error:
+        return result.retryable
+    return is_retryable_code(result.answer_code)
+
+
+class RetryPolicy:
+    """
+    Политика повторов отправки:
+    max_attempts - максимальное число попыток (1 - без повторов)
+    base_delay - задержка перед первым повтором в секундах,
+        каждая следующая вдвое больше
+    max_delay - максимальная задержка перед повтором
+    deadline - сколько секунд с первой попытки сообщение может повторяться
+    Задержка выбирается случайно от 0 до расчётного значения (full jitter),
+    чтобы повторы разных сообщений не приходили на сервер одновременно
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.1,
+        max_delay: float = 10.0,
+        deadline: float = 60.0,
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Вычисляет задержку перед следующей попыткой
+        :param attempt: номер завершившейся попытки, начиная с 1
+        :return: задержка в секундах
+        """
+        return random.uniform(
+            0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        )
+
+    def delay_for(
+        self, attempt: int, retryable: bool, first_started: float
+    ) -> float | None:
+        """
+        Определяет, нужно ли повторить отправку, и через сколько секунд
+        :param attempt: номер завершившейся попытки, начиная с 1
+        :param retryable: признак повторяемой ошибки
+        :param first_started: время первой попытки по time.monotonic()
+        :return: задержка перед повтором или None, если повторять не нужно
+        """
+        if attempt >= self.max_attempts or not retryable:
+            return None
+        delay: float = self.backoff(attempt)
+        if time.monotonic() + delay - first_started > self.deadline:
+            return None
+        return delay
+
+    def next_delay(self, result: SendResult, first_started: float) -> float | None:
+        """
+        Определяет задержку перед повтором по результату последней попытки
+        (attempts - её номер), см. delay_for
+        """
+        return self.delay_for(result.attempts, is_retryable(result), first_started)
@@ -0,0 +1,179 @@
+"""
+Модуль содержит подготовку сообщений к отправке: подсчёт сегментов SMS
+с учётом кодировки (GSM-7 - 160 символов, с разбиением - по 153;
+UCS-2 - 70 символов, с разбиением - по 67) и объединение сообщений
+с одинаковыми отправителем и текстом в запросы на несколько получателей
+"""
+
+from functools import lru_cache
+from itertools import islice
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, NamedTuple
+
+from results import DUPLICATE, SendResult
+
+# основная таблица GSM 03.38 (без символа перехода в расширенную таблицу)
+GSM7_BASIC = frozenset(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+
+# символы расширенной таблицы занимают по два септета
+GSM7_EXTENDED = frozenset("\f^{}\\[~]|€")
+
+GSM7 = GSM7_BASIC | GSM7_EXTENDED
+
+# (длина одного сегмента, длина части при разбиении) по кодировкам
+SEGMENT_LIMITS = {"gsm7": (160, 153), "ucs2": (70, 67)}
+
+
+class SegmentInfo(NamedTuple):
+    """
+    Размер сообщения SMS:
+    encoding - кодировка ("gsm7" или "ucs2")
+    length - длина в символах кодировки (септетах GSM-7 или 16-битных словах)
+    segments - количество сегментов
+    """
+
+    encoding: str
+    length: int
+    segments: int
+
+
+@lru_cache(maxsize=65536)
+def get_segment_info(message: str) -> SegmentInfo:
+    """
+    Определяет кодировку и количество сегментов сообщения.
+    Результат кэшируется, поэтому одинаковые тексты большой рассылки
+    обрабатываются один раз
+    :param message: текст сообщения
+    :return: кодировка, длина и количество сегментов
+    """
+    if GSM7.issuperset(message):
+        encoding: str = "gsm7"
+        length: int = len(message) + sum(message.count(char) for char in GSM7_EXTENDED)
+    else:
+        encoding = "ucs2"
+        # символы вне BMP занимают по два слова (суррогатная пара)
+        length = len(message.encode("utf-16-le")) // 2
+    single, part = SEGMENT_LIMITS[encoding]
+    segments: int = 1 if length <= single else -(-length // part)
+    return SegmentInfo(encoding, length, segments)
+
+
+def count_segments(messages: Iterable[str]) -> int:
+    """
+    Считает общее количество сегментов сообщений пакета
+    """
+    return sum(get_segment_info(message).segments for message in messages)
+
+
+class MessageGrouper:
+    """
+    Объединяет сообщения с одинаковыми отправителем и текстом
+    в запросы на несколько разных получателей (recipient - список номеров)
+    и разворачивает результаты запросов обратно по сообщениям:
+    max_recipients - максимальное число получателей в одном запросе
+        (1 - сообщения не объединяются)
+    lookahead - среди скольких подряд идущих записей искать одинаковые
+    Запросы нумеруются по порядку выдачи, а expand возвращает
+    результаты с номерами записей во входных данных и количеством сегментов
+    """
+
+    def __init__(self, max_recipients: int = 1, lookahead: int = 1000):
+        self.max_recipients = max_recipients
+        self.lookahead = lookahead
+        # номер запроса -> (номера записей, получатели, сегменты)
+        self._requests: dict[int, tuple[list[int], list[str], int]] = {}
+        self._issued = 0
+
+    def _issue(
+        self, sender: str, message: str, indexes: list[int], recipients: list[str]
+    ) -> tuple[str, str | list[str], str]:
+        self._requests[self._issued] = (
+            indexes,
+            recipients,
+            get_segment_info(message).segments,
+        )
+        self._issued += 1
+        return sender, recipients[0] if len(recipients) == 1 else recipients, message
+
+    def _group_part(
+        self, part: list[tuple[str, str, str]], start: int
+    ) -> Iterator[tuple[str, str | list[str], str]]:
+        if self.max_recipients <= 1:
+            for index, (sender, recipient, message) in enumerate(part, start):
+                yield self._issue(sender, message, [index], [recipient])
+            return
+        pending: dict[tuple[str, str], tuple[list[int], list[str]]] = {}
+        for index, (sender, recipient, message) in enumerate(part, start):
+            indexes, recipients = pending.setdefault((sender, message), ([], []))
+            if recipient in recipients:
+                # повтор сообщения тому же получателю уходит отдельным запросом,
+                # чтобы кэш идемпотентности мог его подавить
+                yield self._issue(sender, message, indexes, recipients)
+                indexes, recipients = pending[sender, message] = ([], [])
+            indexes.append(index)
+            recipients.append(recipient)
+            if len(recipients) >= self.max_recipients:
+                del pending[sender, message]
+                yield self._issue(sender, message, indexes, recipients)
+        for (sender, message), (indexes, recipients) in pending.items():
+            yield self._issue(sender, message, indexes, recipients)
+
+    def group(
+        self, records: Iterable[tuple[str, str, str]]
+    ) -> Iterator[tuple[str, str | list[str], str]]:
+        """
+        Выдаёт записи запросов (отправитель, получатель или список
+        получателей, сообщение), читая входные данные частями по lookahead
+        :param records: записи (отправитель, получатель, сообщение)
+        :return: генератор записей запросов
+        """
+        iterator: Iterator[tuple[str, str, str]] = iter(records)
+        start: int = 0
+        while part := list(islice(iterator, self.lookahead)):
+            yield from self._group_part(part, start)
+            start += len(part)
+
+    async def group_async(
+        self, records: AsyncIterable[tuple[str, str, str]]
+    ) -> AsyncIterator[tuple[str, str | list[str], str]]:
+        """
+        То же, что group, для асинхронного источника записей
+        """
+        part: list[tuple[str, str, str]] = []
+        start: int = 0
+        async for record in records:
+            part.append(record)
+            if len(part) >= self.lookahead:
+                for request in self._group_part(part, start):
+                    yield request
+                start += len(part)
+                part = []
+        for request in self._group_part(part, start):
+            yield request
+
+    def expand(self, result: SendResult) -> list[SendResult]:
+        """
+        Разворачивает результат запроса в результаты его сообщений.
+        Получатели запроса, которых нет в result.recipient (запрос отправлен
+        без них, см. dedup.IdempotencyCache.reserve), получают результат DUPLICATE
+        :param result: результат, index которого - номер запроса
+        :return: результаты с номерами записей во входных данных
+        """
+        indexes, recipients, segments = self._requests.pop(result.index)
+        sent: set[str] = (
+            set(result.recipient)
+            if isinstance(result.recipient, list)
+            else {result.recipient}
+        )
+        return [
+            (
+                result._replace(index=index, recipient=recipient, segments=segments)
+                if recipient in sent
+                else SendResult(
+                    index, result.sender, recipient, error=DUPLICATE, segments=segments
+                )
+            )
+            for index, recipient in zip(indexes, recipients)
+        ]
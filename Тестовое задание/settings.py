@@ -0,0 +1,347 @@
+"""
+Модуль содержит проверенные настройки клиента, полученные из conf.toml:
+параметры шлюзов отправки СМС (разобранный адрес, заранее закодированная
+авторизация), выбор шлюза по имени, перечитывание настроек после изменения
+файла и кэш разрешения DNS имён с временем жизни
+"""
+
+import base64
+import logging
+import socket
+import threading
+import time
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+import take_config as conf
+
+DEFAULT_SECTION = "test_sms_sender"
+
+DEFAULT_PORTS = {"http": 80}
+
+
+class GatewaySettings(NamedTuple):
+    """
+    Настройки шлюза отправки СМС:
+    name - имя шлюза (имя секции conf.toml)
+    url - исходный server_url
+    host - имя или адрес сервера (адрес IPv6 без квадратных скобок)
+    port - порт сервера
+    host_header - значение заголовка Host
+    send_path - путь запроса на отправку СМС
+    auth_b64 - user:password в base64 для заголовка Authorization
+    weight - доля запросов шлюза при балансировке (относительно других)
+    """
+
+    name: str
+    url: str
+    host: str
+    port: int
+    host_header: str
+    send_path: str
+    auth_b64: str
+    weight: float = 1.0
+
+
+def parse_gateway(name: str, section: dict) -> GatewaySettings:
+    """
+    Проверяет и разбирает секцию настроек шлюза
+    (server_url, user, password, необязательный weight)
+    :param name: имя секции
+    :param section: значения секции
+    :return: настройки шлюза
+    """
+    for key in ("server_url", "user", "password"):
+        if not isinstance(section.get(key), str) or not section[key]:
+            raise ValueError(f"[{name}]: {key} must be a non-empty string")
+    url: str = section["server_url"]
+    parts = urlsplit(url)
+    if parts.scheme not in DEFAULT_PORTS:
+        raise ValueError(f"[{name}]: unsupported server_url scheme in {url!r}")
+    if not parts.hostname:
+        raise ValueError(f"[{name}]: server_url {url!r} has no host")
+    try:
+        port: int = parts.port or DEFAULT_PORTS[parts.scheme]
+    except ValueError as e:
+        raise ValueError(f"[{name}]: invalid port in server_url {url!r}") from e
+    weight = section.get("weight", 1.0)
+    if not isinstance(weight, (int, float)) or weight <= 0:
+        raise ValueError(f"[{name}]: weight must be a positive number")
+    auth: bytes = f"{section['user']}:{section['password']}".encode()
+    return GatewaySettings(
+        name=name,
+        url=url,
+        host=parts.hostname,
+        port=port,
+        host_header=parts.netloc.rpartition("@")[2],
+        send_path=parts.path.rstrip("/") + "/send_sms",
+        auth_b64=base64.b64encode(auth).decode(),
+        weight=float(weight),
+    )
+
+
+class Settings:
+    """
+    Проверенные настройки клиента:
+    raw - исходная конфигурация (значения остальных секций)
+    gateways - настройки шлюзов по именам: секция [test_sms_sender]
+        и секции [gateways.<имя>]
+    gateway - выбранный шлюз: указанный явно, параметр gateway
+        секции [test_sms_sender] или сама секция [test_sms_sender]
+    path - файл, из которого загружены настройки (None - настройки
+        созданы из словаря)
+    """
+
+    def __init__(self, raw: dict, gateway: str | None = None):
+        self.raw = raw
+        self.path: str | None = None
+        self.gateways: dict[str, GatewaySettings] = {}
+        main_section: dict = raw.get(DEFAULT_SECTION, {})
+        if "server_url" in main_section:
+            self.gateways[DEFAULT_SECTION] = parse_gateway(
+                DEFAULT_SECTION, main_section
+            )
+        for name, section in raw.get("gateways", {}).items():
+            parsed: GatewaySettings = parse_gateway(f"gateways.{name}", section)
+            self.gateways[name] = parsed._replace(name=name)
+        if not self.gateways:
+            raise ValueError("No gateway is configured in conf.toml")
+        selected: str = (
+            gateway or main_section.get("gateway") or next(iter(self.gateways))
+        )
+        if selected not in self.gateways:
+            raise ValueError(f"Unknown gateway {selected!r}")
+        self.gateway: GatewaySettings = self.gateways[selected]
+
+    def section(self, name: str = DEFAULT_SECTION) -> dict:
+        """
+        Возвращает значения секции конфигурации (пустой словарь, если её нет)
+        """
+        return self.raw.get(name, {})
+
+
+_settings_cache: tuple[dict, str | None, Settings] | None = None
+
+
+def get_settings(config: "dict | Settings", gateway: str | None = None) -> Settings:
+    """
+    Возвращает настройки для конфигурации. Для одного и того же словаря
+    конфигурации (read_conf возвращает один объект, пока файл не изменился)
+    настройки проверяются и разбираются один раз
+    :param config: конфигурация из conf.toml или готовые настройки
+    :param gateway: имя шлюза
+    :return: настройки
+    """
+    global _settings_cache
+    if isinstance(config, Settings):
+        return config
+    cached = _settings_cache
+    if cached is not None and cached[0] is config and cached[1] == gateway:
+        return cached[2]
+    settings: Settings = Settings(config, gateway)
+    _settings_cache = (config, gateway, settings)
+    return settings
+
+
+def load_settings(path: str = "conf.toml", gateway: str | None = None) -> Settings:
+    """
+    Загружает настройки из файла. Повторный вызов обходится в одну проверку
+    времени изменения файла, а после изменения файла настройки перечитываются,
+    поэтому долго работающие отправщики могут вызывать функцию периодически
+    :param path: путь к conf.toml
+    :param gateway: имя шлюза
+    :return: настройки
+    """
+    settings: Settings = get_settings(conf.read_conf(path), gateway)
+    settings.path = path
+    return settings
+
+
+class SettingsReloader:
+    """
+    Перечитывание настроек долго работающими отправщиками:
+    path - путь к conf.toml
+    gateway - имя выбранного шлюза
+    interval - не чаще чем раз в сколько секунд проверять файл
+    settings - текущие настройки
+    Если изменённый файл содержит ошибку, остаются прежние настройки
+    """
+
+    def __init__(self, path: str, gateway: str | None = None, interval: float = 1.0):
+        self.path = path
+        self.gateway = gateway
+        self.interval = interval
+        self.settings: Settings = load_settings(path, gateway)
+        self._next_check = time.monotonic() + interval
+
+    def poll(self) -> Settings | None:
+        """
+        Проверяет, не изменился ли файл настроек (если прошло interval секунд)
+        :return: новые настройки или None, если они не изменились
+        """
+        now: float = time.monotonic()
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.interval
+        try:
+            settings: Settings = load_settings(self.path, self.gateway)
+        except (OSError, ValueError) as e:
+            logging.warning("Settings are not reloaded: %s", e)
+            return None
+        # пока файл не изменился, read_conf возвращает тот же словарь
+        if settings.raw is self.settings.raw:
+            return None
+        self.settings = settings
+        return settings
+
+
+class DnsCache:
+    """
+    Кэш разрешения имён серверов, чтобы не выполнять DNS запрос
+    на каждое новое соединение:
+    ttl - сколько секунд хранить результат
+    """
+
+    def __init__(self, ttl: float = 60.0):
+        self.ttl = ttl
+        self._entries: dict[
+            tuple[str, int], tuple[float, list[tuple[socket.AddressFamily, tuple]]]
+        ] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int) -> list[tuple[socket.AddressFamily, tuple]]:
+        """
+        Разрешает имя сервера (при необходимости выполняя DNS запрос)
+        :param host: имя или адрес сервера
+        :param port: порт сервера
+        :return: все адреса сервера в порядке getaddrinfo:
+            семейство адресов и адрес для socket.connect
+        """
+        key: tuple[str, int] = (host, port)
+        now: float = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        addresses: list[tuple[socket.AddressFamily, tuple]] = [
+            (family, sockaddr)
+            for family, _, _, _, sockaddr in socket.getaddrinfo(
+                host, port, type=socket.SOCK_STREAM
+            )
+        ]
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    async def resolve_async(
+        self, host: str, port: int
+    ) -> list[tuple[socket.AddressFamily, tuple]]:
+        """
+        То же, что resolve, для цикла событий: DNS запрос выполняется
+        через loop.getaddrinfo и не блокирует цикл
+        """
+        import asyncio
+
+        key: tuple[str, int] = (host, port)
+        now: float = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        addresses: list[tuple[socket.AddressFamily, tuple]] = [
+            (family, sockaddr)
+            for family, _, _, _, sockaddr in await loop.getaddrinfo(
+                host, port, type=socket.SOCK_STREAM
+            )
+        ]
+        with self._lock:
+            self._entries[key] = (now + self.ttl, addresses)
+        return addresses
+
+    def invalidate(self, host: str, port: int) -> None:
+        """
+        Удаляет адрес сервера из кэша (после ошибки подключения),
+        чтобы следующее подключение заново выполнило DNS запрос
+        """
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+    def clear(self) -> None:
+        """
+        Очищает кэш (например, после ошибки подключения)
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+DNS_CACHE = DnsCache()
+
+
+def resolve_address(host: str, port: int) -> list[tuple[socket.AddressFamily, tuple]]:
+    """
+    Разрешает имя сервера через общий кэш процесса, см. DnsCache.resolve
+    """
+    return DNS_CACHE.resolve(host, port)
+
+
+async def resolve_address_async(
+    host: str, port: int
+) -> list[tuple[socket.AddressFamily, tuple]]:
+    """
+    Разрешает имя сервера через общий кэш процесса, см. DnsCache.resolve_async
+    """
+    return await DNS_CACHE.resolve_async(host, port)
+
+
+def connect(host: str, port: int, timeout: float | None = None) -> socket.socket:
+    """
+    Подключается к серверу по адресам из общего кэша по очереди, как
+    socket.create_connection (например, localhost - сначала ::1, затем
+    127.0.0.1), с полным адресом сокета (для IPv6 - с flowinfo и scope_id);
+    если не удалось подключиться ни по одному адресу, имя удаляется из кэша
+    :param host: имя или адрес сервера
+    :param port: порт сервера
+    :param timeout: таймаут подключения и операций сокета в секундах
+    :return: подключённый сокет
+    """
+    error: OSError | None = None
+    for family, sockaddr in resolve_address(host, port):
+        sock: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+        sock.settimeout(timeout)
+        try:
+            sock.connect(sockaddr)
+        except OSError as e:
+            sock.close()
+            error = e
+            continue
+        return sock
+    DNS_CACHE.invalidate(host, port)
+    raise error or OSError(f"getaddrinfo returned no addresses for {host!r}")
+
+
+async def connect_async(host: str, port: int) -> socket.socket:
+    """
+    То же, что connect, для цикла событий: имя разрешается
+    через loop.getaddrinfo, а подключение не блокирует цикл
+    :return: подключённый неблокирующий сокет (для asyncio.open_connection)
+    """
+    import asyncio
+
+    loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+    error: OSError | None = None
+    for family, sockaddr in await resolve_address_async(host, port):
+        sock: socket.socket = socket.socket(family, socket.SOCK_STREAM)
+        sock.setblocking(False)
+        try:
+            await loop.sock_connect(sock, sockaddr)
+        except OSError as e:
+            sock.close()
+            error = e
+            continue
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+    DNS_CACHE.invalidate(host, port)
+    raise error or OSError(f"getaddrinfo returned no addresses for {host!r}")
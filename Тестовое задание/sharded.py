@@ -0,0 +1,110 @@
+"""
+Модуль содержит многопроцессную отправку СМС: пакет делится на части,
+каждая часть отправляется в отдельном процессе своим асинхронным клиентом
+со своими соединениями, результаты объединяются в порядке входных данных
+"""
+
+import asyncio
+import copy
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from async_sender import AsyncSender
+from metrics import Metrics
+from rate_limit import TokenBucket
+from results import BulkReport, SendResult
+
+_worker_sender: AsyncSender | None = None
+
+
+def _init_worker(sender: AsyncSender) -> None:
+    global _worker_sender
+    if sender.dedup is not None:
+        # при fork кэш наследуется вместе с открытым файлом родителя
+        sender.dedup.detach()
+    _worker_sender = sender
+
+
+def _send_shard(
+    start: int, records: list[tuple[str, str, str]]
+) -> tuple[list[SendResult], Metrics | None]:
+    if _worker_sender.metrics is not None:
+        # метрики части передаются в основной процесс и там объединяются
+        _worker_sender.metrics = Metrics()
+    report: BulkReport = asyncio.run(_worker_sender.send(records))
+    return [
+        result._replace(index=result.index + start) for result in report.results
+    ], _worker_sender.metrics
+
+
+def split_shards(size: int, shards: int) -> list[tuple[int, int]]:
+    """
+    Делит диапазон [0, size) на не более чем shards почти равных частей
+    :return: список границ частей (начало, конец)
+    """
+    shards = max(1, min(shards, size))
+    step, rest = divmod(size, shards)
+    bounds: list[tuple[int, int]] = []
+    start: int = 0
+    for shard in range(shards):
+        end: int = start + step + (1 if shard < rest else 0)
+        bounds.append((start, end))
+        start = end
+    return bounds
+
+
+class ShardedSender:
+    """
+    Многопроцессный отправщик СМС, обходящий ограничение GIL
+    на формирование запросов и разбор ответов:
+    sender - асинхронный отправщик, копия которого работает в каждом процессе
+        (concurrency отправщика - число одновременных запросов на процесс)
+    processes - число процессов
+    Ограничение скорости отправщика делится между процессами поровну,
+    метрики процессов собираются в metrics отправщика
+    """
+
+    def __init__(self, sender: AsyncSender, processes: int):
+        self.processes = processes
+        self.metrics = sender.metrics
+        if sender.rate_limiter is not None:
+            sender = copy.copy(sender)
+            sender.rate_limiter = TokenBucket(
+                sender.rate_limiter.rate / processes,
+                max(1, sender.rate_limiter.burst // processes),
+            )
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes, initializer=_init_worker, initargs=(sender,)
+        )
+
+    def send(self, records: list[tuple[str, str, str]], offset: int = 0) -> BulkReport:
+        """
+        Делит пакет на processes частей и отправляет их параллельно
+        :param records: записи (отправитель, получатель, сообщение)
+        :param offset: номер первой записи пакета (для нумерации результатов)
+        :return: отчёт с результатами в порядке входных данных
+        """
+        started: float = time.perf_counter()
+        futures = [
+            self._executor.submit(_send_shard, offset + start, records[start:end])
+            for start, end in split_shards(len(records), self.processes)
+        ]
+        results: list[SendResult] = []
+        for future in futures:
+            shard_results, shard_metrics = future.result()
+            results.extend(shard_results)
+            if self.metrics is not None:
+                self.metrics.merge(shard_metrics)
+        return BulkReport(results, time.perf_counter() - started)
+
+    def close(self) -> None:
+        """
+        Завершает процессы
+        """
+        self._executor.shutdown()
+
+    def __enter__(self) -> "ShardedSender":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -3,18 +3,84 @@
 TOML файла и аргументов командной строки
 """
 
-import tomllib
+import os
+import sys
+import marshal
 import argparse
 
+_conf_cache: dict[str, tuple[tuple[int, int], dict]] = {}
+
+
+def get_compiled_path(path: str) -> str:
+    """
+    Возвращает путь к разобранной конфигурации, сохранённой в формате marshal
+    (в каталоге __pycache__ рядом с файлом, как у скомпилированных модулей)
+    """
+    directory, name = os.path.split(path)
+    return os.path.join(directory, "__pycache__", f"{name}.marshal")
+
+
+def load_compiled(path: str, version: tuple[int, int]) -> dict | None:
+    """
+    Загружает разобранную конфигурацию, если она сохранена
+    для той же версии файла (время изменения и размер)
+    """
+    try:
+        with open(get_compiled_path(path), "rb") as compiled:
+            stored_version, config = marshal.load(compiled)
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return config if tuple(stored_version) == version else None
+
+
+def save_compiled(path: str, version: tuple[int, int], config: dict) -> None:
+    """
+    Сохраняет разобранную конфигурацию для следующих запусков
+    (если запись байт-кода не отключена, см. PYTHONDONTWRITEBYTECODE).
+    Конфигурация содержит логины и пароли шлюзов, поэтому файл создаётся
+    с правами 0600 (чтение и запись только владельцем) независимо от umask.
+    Ошибки записи (каталог только для чтения) и значения,
+    которые marshal не поддерживает (даты TOML), не мешают работе
+    """
+    if sys.dont_write_bytecode:
+        return
+    compiled_path: str = get_compiled_path(path)
+    tmp_path: str = f"{compiled_path}.{os.getpid()}.tmp"
+    try:
+        data: bytes = marshal.dumps((version, config))
+        os.makedirs(os.path.dirname(compiled_path), exist_ok=True)
+        fd: int = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with open(fd, "wb") as compiled:
+            compiled.write(data)
+        os.replace(tmp_path, compiled_path)
+    except (OSError, ValueError):
+        return
+
 
 def read_conf(conf_file: str) -> dict:
     """
-    Считывает TOML файл
+    Считывает TOML файл. Разобранная конфигурация кэшируется:
+    пока время изменения и размер файла не изменились, возвращается
+    тот же объект (его не следует изменять), иначе файл перечитывается.
+    Между запусками конфигурация хранится в __pycache__ в формате marshal,
+    который загружается быстрее, чем импорт tomllib и разбор TOML
     :param conf_file:
     :return:
     """
-    with open(conf_file, "rb") as conf:
-        config = tomllib.load(conf)
+    path: str = os.path.abspath(conf_file)
+    stat: os.stat_result = os.stat(path)
+    version: tuple[int, int] = (stat.st_mtime_ns, stat.st_size)
+    cached = _conf_cache.get(path)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    config: dict | None = load_compiled(path, version)
+    if config is None:
+        import tomllib
+
+        with open(conf_file, "rb") as conf:
+            config = tomllib.load(conf)
+        save_compiled(path, version, config)
+    _conf_cache[path] = (version, config)
     return config
 
 
@@ -33,3 +99,65 @@ def get_script_args(
     for name_arg, args_descrpt in zip(name_args, args_descrptns):
         parser.add_argument(name_arg, type=str, help=args_descrpt)
     return parser.parse_args()
+
+
+def is_bulk_mode(argv: list[str] | None = None) -> bool:
+    """
+    Проверяет, запущен ли скрипт в режиме пакетной отправки (--input)
+    :param argv: аргументы командной строки, по умолчанию sys.argv[1:]
+    :return: True, если указан входной файл
+    """
+    argv = sys.argv[1:] if argv is None else argv
+    return any(arg in ("-i", "--input") or arg.startswith("--input=") for arg in argv)
+
+
+def get_bulk_args(
+    parser_descr: str = "", argv: list[str] | None = None
+) -> argparse.Namespace:
+    """
+    Считывает аргументы командной строки режима пакетной отправки
+    :param parser_descr: описание программы
+    :param argv: аргументы командной строки, по умолчанию sys.argv[1:]
+    :return: входной файл, формат, файл результатов и параметры отправки
+    """
+    parser = argparse.ArgumentParser(description=parser_descr)
+    parser.add_argument(
+        "-i", "--input", required=True, help="Файл с записями или - для stdin"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=("csv", "jsonl"),
+        help="Формат входных данных, по умолчанию определяется по расширению",
+    )
+    parser.add_argument(
+        "-o", "--output", default="-", help="Файл результатов (JSONL) или - для stdout"
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=100,
+        help="Число одновременных запросов",
+    )
+    parser.add_argument(
+        "-t", "--timeout", type=float, default=10.0, help="Таймаут запроса в секундах"
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        type=int,
+        default=1,
+        help="Число процессов (concurrency задаётся на каждый процесс)",
+    )
+    parser.add_argument(
+        "-g",
+        "--gateway",
+        help="Имя шлюза из conf.toml, по умолчанию параметр gateway или "
+        "секция [test_sms_sender]",
+    )
+    parser.add_argument(
+        "--outbox",
+        help="Файл журнала отправки (SQLite) для продолжения прерванной рассылки",
+    )
+    return parser.parse_args(argv)
@@ -1,13 +1,53 @@
 """Модуль содержит функции для тестирования
 выполненного задания"""
+
+import asyncio
+import json
+import logging
+import random
+import socket
+import socketserver
+import subprocess
 import sys
+import threading
+import time
 from unittest.mock import patch, MagicMock
-from classes import HttpRequest
-from classes import HttpResponse
+import pytest
+from classes import HttpRequest, HttpRequestTemplate
+from classes import HttpResponse, HttpResponseView
+import take_config
 from take_config import read_conf
-from take_config import get_script_args
-from main import make_request_to_serv
-
+from take_config import get_script_args, is_bulk_mode
+from main import (
+    make_async_sender,
+    make_request_to_serv,
+    run_bulk,
+    send_bulk,
+    send_bulk_async,
+    send_sharded,
+    start_logging,
+)
+from pool import parse_keep_alive
+from http_reader import ResponseReader
+from batch import MessageBatch
+from records import FIELDS, RecordFile, read_records
+from outbox import Outbox
+from settings import DNS_CACHE, DnsCache, Settings, load_settings, parse_gateway
+from settings import connect, connect_async
+from balancer import LoadBalancer
+from dedup import DELIVERED, IN_FLIGHT, NEW, IdempotencyCache, get_idempotency_key
+import sharded
+from sharded import split_shards
+from rate_limit import AimdController, TokenBucket
+from results import SendResult
+from segments import MessageGrouper, count_segments, get_segment_info
+from retry import RetryPolicy
+from log_setup import BatchFlushMixin, setup_logging, stop_logging
+from metrics import Histogram, Metrics, MetricsReporter
+from mock_server import Latency, MockGateway
+from async_sender import AsyncSender
+from bench import BenchResult, compare_with_baseline, load_results
+from bench import SCRIPT_DIR, import_time_report, run_benchmarks, save_results
 
 
 def test_http_request_creation():
@@ -181,6 +221,23 @@ def test_get_script_args():
     assert args.message == "message"
 
 
+def _fake_recv_into(chunks):
+    """Возвращает заглушку socket.recv_into, выдающую данные по частям."""
+    chunks = list(chunks)
+
+    def recv_into(buffer):
+        if not chunks:
+            return 0
+        chunk = chunks.pop(0)
+        size = min(len(chunk), len(buffer))
+        buffer[:size] = chunk[:size]
+        if size < len(chunk):
+            chunks.insert(0, chunk[size:])
+        return size
+
+    return recv_into
+
+
 @patch("socket.socket")
 @patch("main.conf.get_script_args")
 def test_make_request_to_serv_success(mock_get_script_args, mock_socket):
@@ -188,11 +245,13 @@ def test_make_request_to_serv_success(mock_get_script_args, mock_socket):
     mock_get_script_args.return_value = MagicMock(
         sender="12345", recipient="67890", message="Hello"
     )
-    mock_socket.return_value.recv.return_value = (
-        b"HTTP/1.1 200 OK\r\n"
-        b"Content-Type: application/json\r\n"
-        b"\r\n"
-        b'{"status": "success", "message_id": "12345"}'
+    mock_socket.return_value.recv_into.side_effect = _fake_recv_into(
+        [
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: application/json\r\n"
+            b"\r\n"
+            b'{"status": "success", "message_id": "12345"}'
+        ]
     )
     with patch("logging.info") as mock_logging:
         make_request_to_serv()
@@ -212,3 +271,1288 @@ def test_make_request_to_serv_connection_refused(mock_get_script_args, mock_sock
         mock_logging.assert_called_with(
             "Error: The connection was not established because the server rejected the request"
         )
+
+
+class _KeepAliveHandler(socketserver.StreamRequestHandler):
+    """Обработчик тестового сервера, отвечающий по keep-alive.
+
+    Первые ответы берутся из statuses, остальные - 200 OK."""
+
+    connections: list = []
+    statuses: list = []
+
+    def handle(self):
+        self.connections.append(self.client_address)
+        while True:
+            headers = b""
+            while not headers.endswith(b"\r\n\r\n"):
+                line = self.rfile.readline()
+                if not line:
+                    return
+                headers += line
+            length = 0
+            for line in headers.split(b"\r\n"):
+                if line.lower().startswith(b"content-length:"):
+                    length = int(line.split(b":")[1])
+            self.rfile.read(length)
+            status = self.statuses.pop(0) if self.statuses else b"200 OK"
+            body = b'{"status": "success", "message_id": "1"}'
+            self.wfile.write(
+                b"HTTP/1.1 " + status + b"\r\n"
+                b"Content-Type: application/json\r\n"
+                + f"Content-Length: {len(body)}\r\n".encode()
+                + b"Connection: keep-alive\r\n"
+                b"Keep-Alive: timeout=5, max=100\r\n"
+                b"\r\n" + body
+            )
+
+
+@pytest.fixture
+def keep_alive_server():
+    """Запускает локальный тестовый сервер и возвращает его конфигурацию."""
+    _KeepAliveHandler.connections = []
+    _KeepAliveHandler.statuses = []
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    config = {
+        "test_sms_sender": {
+            "server_url": f"http://127.0.0.1:{server.server_address[1]}",
+            "user": "admin",
+            "password": "admin",
+        }
+    }
+    yield config
+    server.shutdown()
+    server.server_close()
+
+
+def test_send_bulk_reuses_connections(keep_alive_server):
+    """Проверка пакетной отправки через пул keep-alive соединений."""
+    records = [("12345", f"7900000{i:04}", "Hello") for i in range(50)]
+    report = send_bulk(records, keep_alive_server, pool_size=3)
+    assert [result.index for result in report.results] == list(range(50))
+    assert report.sent == 50
+    assert report.failed == 0
+    assert report.throughput > 0
+    assert len(_KeepAliveHandler.connections) <= 3
+
+
+def test_parse_keep_alive():
+    """Проверка разбора заголовка Keep-Alive."""
+    assert parse_keep_alive("timeout=5, max=100") == {"timeout": 5, "max": 100}
+    assert parse_keep_alive("") == {}
+
+
+def test_send_bulk_async(keep_alive_server):
+    """Проверка конкурентной отправки асинхронным клиентом."""
+    records = [("12345", f"7900000{i:04}", "Hello") for i in range(100)]
+    report = send_bulk_async(records, keep_alive_server, concurrency=5)
+    assert [result.index for result in report.results] == list(range(100))
+    assert report.sent == 100
+    assert len(_KeepAliveHandler.connections) <= 5
+
+
+def test_send_bulk_async_timeout():
+    """Проверка таймаута запроса в асинхронном клиенте."""
+    server = socket.create_server(("127.0.0.1", 0))
+    config = {
+        "test_sms_sender": {
+            "server_url": f"http://127.0.0.1:{server.getsockname()[1]}",
+            "user": "admin",
+            "password": "admin",
+        }
+    }
+    try:
+        report = send_bulk_async([("1", "2", "Hello")], config, timeout=0.2)
+    finally:
+        server.close()
+    assert report.failed == 1
+    assert report.results[0].error == "TimeoutError"
+
+
+def test_response_reader_segmented_and_pipelined():
+    """Проверка чтения ответов, разбитых на сегменты и идущих подряд."""
+    body = b'{"error": "' + b"x" * 5000 + b'"}'
+    first = (
+        b"HTTP/1.1 400 Bad Request\r\n"
+        + f"Content-Length: {len(body)}\r\n".encode()
+        + b"\r\n"
+        + body
+    )
+    second = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}"
+    stream = first + second
+    sock = MagicMock()
+    sock.recv_into.side_effect = _fake_recv_into(
+        [stream[i : i + 700] for i in range(0, len(stream), 700)]
+    )
+    reader = ResponseReader(sock, buffer_size=1024)
+    assert reader.read_response() == first
+    assert reader.read_response() == second
+
+
+def test_response_reader_chunked():
+    """Проверка чтения ответа с Transfer-Encoding: chunked."""
+    sock = MagicMock()
+    sock.recv_into.side_effect = _fake_recv_into(
+        [
+            b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n",
+            b"5\r\nHello\r\n7;ext=1\r\n, world\r\n0\r\n\r\n",
+        ]
+    )
+    response = HttpResponse.from_bytes(ResponseReader(sock).read_response())
+    assert response.body_bytes == b"Hello, world"
+
+
+def test_http_request_from_bytes_header_matching():
+    """Проверка, что значения заголовков не путаются с именами других."""
+    request_bytes = (
+        b"POST /send_sms HTTP/1.1\r\n"
+        b"X-Forwarded-For: host.example\r\n"
+        b"content-type: application/json\r\n"
+        b"HOST: example.com\r\n"
+        b"Authorization: Basic dXNlcjpwYXNz\r\n"
+        b"\r\n"
+        b'{"sender": "1", "recipient": "2", "message": "host: other"}'
+    )
+    request = HttpRequest.from_bytes(request_bytes)
+    assert request.host == "example.com"
+    assert request.content_type == "application/json"
+    assert request.extra_headers == {"X-Forwarded-For": "host.example"}
+    assert b"X-Forwarded-For: host.example\r\n" in request.to_bytes()
+
+
+def test_http_response_from_bytes_full_reason_and_body():
+    """Проверка полного кода ответа и многострочного тела."""
+    response = HttpResponse.from_bytes(
+        b"HTTP/1.1 400 Bad Request\r\n"
+        b"Date: Mon, 23 Oct 2023 12:34:56 GMT\r\n"
+        b"\r\n"
+        b'{"error":\r\n"Invalid"}'
+    )
+    assert response.answer_code == "400 Bad Request"
+    assert response.body_bytes == b'{"error":\r\n"Invalid"}'
+    assert response.extra_headers == {"Date": "Mon, 23 Oct 2023 12:34:56 GMT"}
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        b"HTTP/1.1 200 OK\r\nContent-Type: application/json",
+        b"garbage\r\n\r\n",
+        b"HTTP/1.1 200 OK\r\nBroken header\r\n\r\n",
+        b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\n{}",
+    ],
+)
+def test_http_response_from_bytes_malformed(data):
+    """Проверка ошибок при разборе некорректного ответа."""
+    with pytest.raises(ValueError):
+        HttpResponse.from_bytes(data)
+
+
+@pytest.mark.parametrize("message", ["Hello", 'Привет, "мир"\n', ""])
+def test_http_request_template_matches_request(message):
+    """Проверка совпадения шаблона запроса с HttpRequest.to_bytes."""
+    template = HttpRequestTemplate(
+        "dXNlcjpwYXNz", "example.com", "/send", "HTTP/1.1", "application/json"
+    )
+    request = HttpRequest(
+        auth_b64="dXNlcjpwYXNz",
+        host="example.com",
+        sender="12345",
+        recipient="67890",
+        message=message,
+        path="/send",
+        protocol="HTTP/1.1",
+        content_type="application/json",
+    )
+    assert template.to_bytes("12345", "67890", message) == request.to_bytes()
+    buffer = bytearray(b"prefix")
+    written = template.write_into(buffer, "12345", "67890", message)
+    assert buffer == b"prefix" + request.to_bytes()
+    assert written == len(request.to_bytes())
+
+
+def test_http_classes_are_slotted_and_interned():
+    """Проверка отсутствия __dict__ и интернирования значений заголовков."""
+    data = b"HTTP/1.1 200 OK\r\nConnection: keep-alive\r\n\r\n{}"
+    first = HttpResponse.from_bytes(data)
+    second = HttpResponse.from_bytes(data)
+    assert not hasattr(first, "__dict__")
+    assert first.connection is second.connection
+    assert first.extra_headers is second.extra_headers
+
+
+def test_message_batch_columns():
+    """Проверка колоночного пакета сообщений."""
+    records = [("1", "2", "Hello"), ("3", "4", 'Привет, "мир"')]
+    batch = MessageBatch(records)
+    template = HttpRequestTemplate(
+        "dXNlcjpwYXNz", "example.com", "/send", "HTTP/1.1", "application/json"
+    )
+    assert len(batch) == 2
+    assert list(batch) == records
+    assert [b"".join(chunks) for chunks in batch.iter_requests(template)] == [
+        template.to_bytes(*record) for record in records
+    ]
+
+
+def test_read_records_csv_and_jsonl(tmp_path):
+    """Проверка потокового чтения записей из CSV и JSONL."""
+    csv_file = tmp_path / "records.csv"
+    csv_file.write_text('sender,recipient,message\n1,2,"Hello, world"\n3,4,Hi\n')
+    jsonl_file = tmp_path / "records.jsonl"
+    jsonl_file.write_text(
+        '{"sender": "1", "recipient": "2", "message": "Hello, world"}\n\n'
+        '{"sender": "3", "recipient": "4", "message": "Hi"}\n'
+    )
+    expected = [("1", "2", "Hello, world"), ("3", "4", "Hi")]
+    assert list(read_records(str(csv_file))) == expected
+    assert list(read_records(str(jsonl_file))) == expected
+    jsonl_file.write_text('{"sender": "1"}\n')
+    with pytest.raises(ValueError, match="Line 1"):
+        list(read_records(str(jsonl_file)))
+
+
+def test_run_bulk(keep_alive_server, tmp_path):
+    """Проверка пакетного режима командной строки."""
+    input_file = tmp_path / "records.csv"
+    input_file.write_text("".join(f"1,{i},Hello\n" for i in range(30)))
+    output_file = tmp_path / "results.jsonl"
+    sys.argv = ["main.py", "--input", str(input_file), "-o", str(output_file)]
+    assert is_bulk_mode()
+    with patch("main.conf.read_conf", return_value=keep_alive_server):
+        run_bulk()
+    lines = output_file.read_text().splitlines()
+    assert len(lines) == 30
+    assert sorted(json.loads(line)["index"] for line in lines) == list(range(30))
+    assert all(json.loads(line)["answer_code"] == "200 OK" for line in lines)
+
+
+def test_run_bulk_reports_bad_config(tmp_path, capsys):
+    """Проверка ошибки настройки пакетного режима и остановки потоков."""
+    config = {
+        "test_sms_sender": {
+            "server_url": "http://127.0.0.1:4010",
+            "user": "admin",
+            "password": "admin",
+            "rate_limit": "fast",
+        },
+        "logging": {"file": str(tmp_path / "server.log")},
+        "metrics": {"interval": 60},
+    }
+    threads = set(threading.enumerate())
+    sys.argv = ["main.py", "--input", str(tmp_path / "records.csv")]
+    with patch("main.conf.read_conf", return_value=config):
+        run_bulk()
+    assert "Найдена ошибка" in capsys.readouterr().err
+    assert set(threading.enumerate()) <= threads
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_outbox_resumes_from_input_offset(tmp_path, fmt):
+    """Проверка продолжения чтения входных данных со смещения из журнала."""
+    input_file = tmp_path / f"records.{fmt}"
+    records = [("1", str(i), "Привет") for i in range(10)]
+    if fmt == "csv":
+        lines = [",".join(record) + "\n" for record in records]
+        header = "sender,recipient,message\n"
+    else:
+        lines = [json.dumps(dict(zip(FIELDS, record))) + "\n" for record in records]
+        header = ""
+    input_file.write_text(header + "".join(lines), encoding="utf-8")
+    outbox_file = str(tmp_path / "outbox.db")
+    with Outbox(outbox_file, str(input_file)) as outbox:
+        pending = outbox.pending(RecordFile(str(input_file)))
+        assert [next(pending)[1] for _ in range(4)] == ["0", "1", "2", "3"]
+    # прочитанная часть больше не разбирается: её можно испортить
+    data = input_file.read_bytes()
+    consumed = len(data) - len("".join(lines[4:]).encode())
+    input_file.write_bytes(b"#" * (consumed - 1) + b"\n" + data[consumed:])
+    with Outbox(outbox_file, str(input_file)) as outbox:
+        resumed = list(outbox.pending(RecordFile(str(input_file))))
+    assert resumed == records
+
+
+def test_split_shards():
+    """Проверка деления пакета на части."""
+    assert split_shards(10, 3) == [(0, 4), (4, 7), (7, 10)]
+    assert split_shards(2, 4) == [(0, 1), (1, 2)]
+    assert split_shards(0, 4) == [(0, 0)]
+
+
+def test_send_sharded(keep_alive_server):
+    """Проверка многопроцессной отправки с объединением результатов."""
+    records = [("1", str(i), "Hello") for i in range(40)]
+    report = send_sharded(records, keep_alive_server, processes=2, concurrency=4)
+    assert [result.index for result in report.results] == list(range(40))
+    assert [result.recipient for result in report.results] == [
+        str(i) for i in range(40)
+    ]
+    assert report.sent == 40
+    assert report.latency_percentile(50) <= report.latency_percentile(99)
+
+
+def test_token_bucket():
+    """Проверка ограничителя скорости."""
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+
+
+def test_aimd_controller():
+    """Проверка адаптивного ограничения конкурентности."""
+    controller = AimdController(min_limit=1, max_limit=8, initial=4)
+    success = SendResult(0, "1", "2", answer_code="200 OK", latency=0.01)
+    for _ in range(20):
+        controller.on_result(success)
+    assert controller.limit > 4
+    limit = controller.limit
+    controller.on_result(
+        SendResult(0, "1", "2", answer_code="429 Too Many Requests", latency=0.01)
+    )
+    assert controller.limit == pytest.approx(limit / 2)
+    controller.on_result(SendResult(0, "1", "2", error="Connection refused"))
+    assert controller.limit == pytest.approx(limit / 2)
+
+
+def test_aimd_controller_slow_start():
+    """Проверка медленного старта: лимит удваивается до первой перегрузки."""
+    controller = AimdController(min_limit=1, max_limit=100)
+    success = SendResult(0, "1", "2", answer_code="200 OK", latency=0.01)
+    for _ in range(99):
+        controller.on_result(success)
+    assert controller.limit == 100
+    controller.on_result(SendResult(0, "1", "2", answer_code="503 Unavailable"))
+    assert (controller.limit, controller.slow_start) == (50, False)
+    controller.on_result(success)
+    assert controller.limit == pytest.approx(50.02)
+
+
+def test_send_bulk_adaptive_concurrency(keep_alive_server):
+    """Проверка ограничения числа запросов в многопоточной отправке."""
+    keep_alive_server["test_sms_sender"]["adaptive_concurrency"] = True
+    with patch.object(AimdController, "on_result", autospec=True) as on_result:
+        report = send_bulk([("1", str(i), "Hi") for i in range(10)], keep_alive_server)
+    assert report.sent == 10
+    assert on_result.call_count == 10
+
+
+def test_send_bulk_async_rate_limited(keep_alive_server):
+    """Проверка соблюдения ограничения скорости асинхронным клиентом."""
+    keep_alive_server["test_sms_sender"].update(rate_limit=100, burst=1)
+    records = [("1", str(i), "Hello") for i in range(21)]
+    report = send_bulk_async(records, keep_alive_server, concurrency=5)
+    assert report.sent == 21
+    assert report.elapsed >= 0.19
+
+
+def test_retry_policy():
+    """Проверка политики повторов."""
+    policy = RetryPolicy(max_attempts=3, base_delay=0.1, deadline=60)
+    now = time.monotonic()
+    unavailable = SendResult(0, "1", "2", answer_code="503 Service Unavailable")
+    assert 0 <= policy.next_delay(unavailable, now) <= 0.1
+    assert 0 <= policy.next_delay(unavailable._replace(attempts=2), now) <= 0.2
+    assert policy.next_delay(unavailable._replace(attempts=3), now) is None
+    bad_request = SendResult(0, "1", "2", answer_code="400 Bad Request")
+    assert policy.next_delay(bad_request, now) is None
+    refused = SendResult(0, "1", "2", error="refused", retryable=True)
+    assert policy.next_delay(refused, now) is not None
+    assert policy.next_delay(refused, now - 61) is None
+
+
+@pytest.mark.parametrize("send", [send_bulk, send_bulk_async])
+def test_send_retries_temporary_errors(keep_alive_server, send):
+    """Проверка повторной отправки после ответов 429 и 503."""
+    keep_alive_server["test_sms_sender"].update(retry_base_delay=0.01)
+    _KeepAliveHandler.statuses = [b"503 Service Unavailable", b"429 Too Many Requests"]
+    report = send([("1", "2", "Hello")], keep_alive_server)
+    assert report.sent == 1
+    assert report.results[0].attempts == 3
+
+
+def test_setup_logging_jsonl_with_sampling(tmp_path):
+    """Проверка логирования через очередь в JSONL с выборкой успешных записей."""
+    log_file = tmp_path / "server.log"
+    with patch.object(logging.getLogger(), "handlers", []):
+        listener = setup_logging(
+            str(log_file), fmt="jsonl", success_sample_rate=0, lean_records=True
+        )
+        assert listener is not None
+        assert logging.logThreads is False
+        logging.info("Server response: %s", "200 OK", extra={"success": True})
+        logging.error("Server response: %s", "500 Error", extra={"recipient": "2"})
+        stop_logging(listener)
+        assert logging.getLogger().handlers == []
+        # глобальные флаги logging восстановлены
+        assert logging.logThreads is True and logging._srcfile is not None
+    records = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert len(records) == 1
+    assert records[0]["level"] == "ERROR"
+    assert records[0]["message"] == "Server response: 500 Error"
+    assert records[0]["recipient"] == "2"
+
+
+def test_setup_logging_flushes_on_timer(tmp_path):
+    """Проверка сброса буфера лога по таймеру, когда новых записей нет."""
+    log_file = tmp_path / "server.log"
+    with patch.object(logging.getLogger(), "handlers", []), patch.object(
+        BatchFlushMixin, "flush_interval", 0.05
+    ):
+        listener = setup_logging(str(log_file))
+        try:
+            for index in range(3):
+                logging.info("Message %s", index)
+            deadline = time.monotonic() + 2
+            while log_file.read_text().count("Message") < 3:
+                assert time.monotonic() < deadline
+                time.sleep(0.01)
+        finally:
+            stop_logging(listener)
+
+
+def test_metrics_histogram_and_prometheus(tmp_path):
+    """Проверка перцентилей гистограммы и выгрузки метрик в формате Prometheus."""
+    histogram = Histogram()
+    for _ in range(99):
+        histogram.observe(0.001)
+    histogram.observe(1.0)
+    # 0.001 в корзине (0.0008, 0.0016]: 50-я из 99 записей в ней
+    assert histogram.percentile(50) == pytest.approx(0.0008 + 0.0008 * 50 / 99)
+    assert 1.0 <= histogram.percentile(100) <= 2.0
+    metrics = Metrics()
+    metrics.observe_response("200 OK", 0.001)
+    metrics.observe_transfer(100, 50)
+    metrics.observe_error(ConnectionResetError())
+    merged = Metrics()
+    merged.merge(metrics)
+    merged.merge(metrics)
+    path = tmp_path / "sms.prom"
+    merged.write_prometheus(str(path))
+    text = path.read_text()
+    assert 'sms_request_seconds_count{code="200"} 2' in text
+    assert "sms_bytes_sent_total 200" in text
+    assert 'sms_errors_total{type="ConnectionResetError"} 2' in text
+    assert "200: 2 p50/p95/p99=" in merged.summary_line()
+
+
+def test_metrics_reporter_stop_survives_write_error(tmp_path, caplog):
+    """Проверка остановки выгрузки метрик при ошибке записи файла."""
+    reporter = MetricsReporter(Metrics(), 60, str(tmp_path / "missing" / "sms.prom"))
+    reporter.start().stop()
+    assert "cannot write" in caplog.text
+
+
+@pytest.mark.parametrize("send", [send_bulk, send_bulk_async])
+def test_send_bulk_metrics(keep_alive_server, send):
+    """Проверка записи метрик этапов запроса при пакетной отправке."""
+    metrics = Metrics()
+    records = [("12345", f"7900000{i:04}", "Hello") for i in range(20)]
+    report = send(records, keep_alive_server, metrics=metrics)
+    assert report.sent == 20
+    assert metrics.responses["200"].count == 20
+    for phase in ("serialize", "send", "first_byte", "read", "parse"):
+        assert metrics.phases[phase].count == 20
+    assert 1 <= metrics.phases["connect"].count <= 20
+    assert metrics.bytes_sent > 0
+    assert metrics.bytes_received > 0
+    assert metrics.errors == {}
+
+
+def test_mock_gateway_async_with_errors_and_drops():
+    """Проверка тестового сервера: задержки, 429/500 и разрывы соединения."""
+
+    async def run():
+        gateway = MockGateway(
+            auth_b64="YWRtaW46YWRtaW4=",
+            latency=Latency("uniform", 0.002, 0.001),
+            error_rate=0.1,
+            throttle_rate=0.1,
+            drop_rate=0.05,
+            seed=1,
+        )
+        async with gateway:
+            sender = AsyncSender(
+                "127.0.0.1",
+                gateway.port,
+                "YWRtaW46YWRtaW4=",
+                f"127.0.0.1:{gateway.port}",
+                concurrency=20,
+                retry_policy=RetryPolicy(max_attempts=10, base_delay=0.001),
+            )
+            report = await sender.send([("1", f"{i}", "Hi") for i in range(200)])
+        return gateway, report
+
+    gateway, report = asyncio.run(run())
+    assert report.sent == 200
+    assert gateway.responses["200"] == 200
+    assert gateway.responses["429"] > 0
+    assert gateway.responses["500"] > 0
+    assert gateway.dropped > 0
+    assert gateway.connections < gateway.requests
+    assert Latency.parse("lognormal:0.02:0.5").sample(random.Random(1)) > 0
+
+
+@pytest.mark.parametrize(
+    "request_head",
+    [
+        b"POST /send_sms HTTP/1.1\r\nContent-Length: abc\r\n\r\n",
+        b"POST /send_sms HTTP/1.1\r\nX-Long: " + b"a" * 70_000 + b"\r\n\r\n",
+    ],
+    ids=["content_length", "header_size"],
+)
+def test_mock_gateway_rejects_malformed_head(request_head):
+    """Проверка ответа 400 на неверный Content-Length и слишком длинные заголовки."""
+    gateway = MockGateway().start_in_thread()
+    try:
+        with socket.create_connection(("127.0.0.1", gateway.port), timeout=5) as sock:
+            sock.sendall(request_head)
+            response = b""
+            while chunk := sock.recv(65536):
+                response += chunk
+    finally:
+        gateway.stop_thread()
+    assert response.startswith(b"HTTP/1.1 400 ")
+    assert b"Connection: close" in response
+    assert gateway.responses == {"400": 1}
+
+
+def test_mock_gateway_in_thread_reports_start_error():
+    """Проверка ошибки запуска тестового сервера в отдельном потоке."""
+    with socket.create_server(("127.0.0.1", 0)) as busy:
+        with pytest.raises(OSError):
+            MockGateway(port=busy.getsockname()[1]).start_in_thread()
+
+
+def test_mock_gateway_in_thread_rejects_bad_auth():
+    """Проверка тестового сервера в отдельном потоке с синхронным клиентом."""
+    gateway = MockGateway(auth_b64="other", keep_alive_max=3).start_in_thread()
+    try:
+        config = {
+            "test_sms_sender": {
+                "server_url": f"http://127.0.0.1:{gateway.port}",
+                "user": "admin",
+                "password": "admin",
+            }
+        }
+        report = send_bulk([("1", "2", "Hi")] * 10, config, pool_size=1)
+    finally:
+        gateway.stop_thread()
+    assert [result.answer_code for result in report.results] == [
+        "401 Unauthorized"
+    ] * 10
+    assert gateway.connections == 4
+
+
+def test_bench_end_to_end_and_baseline(tmp_path):
+    """Проверка сквозного бенчмарка, записи результатов и сравнения с базой."""
+    results = run_benchmarks(["end_to_end"], scale=0.02)
+    cases = {result.case: result for result in results}
+    assert cases["pooled"].unit == "msg/s"
+    assert cases["concurrent"].value > 0
+    assert cases["sequential p99"].unit == "ms"
+    path = tmp_path / "baseline.json"
+    save_results(results, str(path))
+    assert load_results(str(path)) == results
+    baseline = [
+        BenchResult("parsing", "fast", 100.0, "ops/s"),
+        BenchResult("end_to_end", "p99", 10.0, "ms"),
+    ]
+    current = [
+        BenchResult("parsing", "fast", 95.0, "ops/s"),
+        BenchResult("end_to_end", "p99", 12.0, "ms"),
+        BenchResult("end_to_end", "new", 1.0, "ms"),
+    ]
+    regressions = compare_with_baseline(current, baseline, tolerance=0.1)
+    assert len(regressions) == 1
+    assert regressions[0].startswith("end_to_end/p99")
+
+
+def test_run_bulk_resumes_from_outbox(keep_alive_server, tmp_path):
+    """Проверка продолжения прерванной рассылки по журналу отправки."""
+    input_file = tmp_path / "records.csv"
+    input_file.write_text("".join(f"1,{i},Hello\n" for i in range(30)))
+    outbox_file = str(tmp_path / "outbox.db")
+    outbox = Outbox(outbox_file, str(input_file), commit_every=1)
+    pending = outbox.pending(read_records(str(input_file)))
+    issued = [next(pending) for _ in range(10)]
+    for index, (sender, recipient, _) in enumerate(issued[:7]):
+        body = f'{{"status": "success", "message_id": "id{index}"}}'
+        result = SendResult(index, sender, recipient, answer_code="200 OK", body=body)
+        assert outbox.record(result).index == index
+    # процесс "аварийно завершился": 3 сообщения отправлялись, 20 не прочитаны
+    output_file = tmp_path / "results.jsonl"
+    output_file.write_text("previous run\n")
+    sys.argv = ["main.py", "-i", str(input_file), "-o", str(output_file)]
+    sys.argv += ["--outbox", outbox_file]
+    with patch("main.conf.read_conf", return_value=keep_alive_server):
+        run_bulk()
+    lines = output_file.read_text().splitlines()
+    assert lines[0] == "previous run"
+    indexes = sorted(json.loads(line)["index"] for line in lines[1:])
+    assert indexes == list(range(7, 30))
+    with Outbox(outbox_file, str(input_file)) as resumed:
+        assert resumed.counts() == {"sent": 30}
+        assert list(resumed.pending(read_records(str(input_file)))) == []
+    with pytest.raises(ValueError):
+        Outbox(outbox_file, "other.csv")
+
+
+@pytest.mark.parametrize(
+    "url, host, port, host_header, path",
+    [
+        ("http://localhost:4010", "localhost", 4010, "localhost:4010", "/"),
+        ("http://sms.example.com", "sms.example.com", 80, "sms.example.com", "/"),
+        ("http://[::1]:8080/api/v1/", "::1", 8080, "[::1]:8080", "/api/v1"),
+    ],
+)
+def test_settings_parse_server_url(url, host, port, host_header, path):
+    """Проверка разбора server_url и кодирования авторизации."""
+    gateway = Settings(
+        {"test_sms_sender": {"server_url": url, "user": "admin", "password": "admin"}}
+    ).gateway
+    assert (gateway.host, gateway.port) == (host, port)
+    assert gateway.host_header == host_header
+    assert gateway.send_path == path.rstrip("/") + "/send_sms"
+    assert gateway.auth_b64 == "YWRtaW46YWRtaW4="
+
+
+@pytest.mark.parametrize(
+    "section",
+    [
+        {"server_url": "example.com", "user": "u", "password": "p"},
+        {"server_url": "http://example.com:port", "user": "u", "password": "p"},
+        {"server_url": "http://example.com", "user": "u"},
+    ],
+)
+def test_settings_validation(section):
+    """Проверка сообщений о неверных настройках шлюза."""
+    with pytest.raises(ValueError):
+        Settings({"test_sms_sender": section})
+
+
+def test_load_settings_named_gateways_and_reload(tmp_path):
+    """Проверка выбора шлюза по имени, кэширования и перечитывания настроек."""
+    config_file = tmp_path / "conf.toml"
+    config_file.write_text(
+        "[test_sms_sender]\n"
+        "gateway = 'backup'\n"
+        "[gateways.primary]\n"
+        "server_url = 'http://10.0.0.1:4010'\nuser = 'a'\npassword = 'b'\n"
+        "[gateways.backup]\n"
+        "server_url = 'http://10.0.0.2:4010'\nuser = 'a'\npassword = 'b'\n"
+    )
+    settings = load_settings(str(config_file))
+    assert settings.gateway.name == "backup"
+    assert load_settings(str(config_file)) is settings
+    assert load_settings(str(config_file), "primary").gateway.host == "10.0.0.1"
+    config_file.write_text(
+        "[test_sms_sender]\n"
+        "server_url = 'http://10.0.0.3:4010'\nuser = 'a'\npassword = 'b'\n"
+    )
+    assert load_settings(str(config_file)).gateway.host == "10.0.0.3"
+    with pytest.raises(ValueError):
+        load_settings(str(config_file), "primary")
+
+
+def test_dns_cache_ttl():
+    """Проверка кэширования разрешения имён."""
+    cache = DnsCache(ttl=60)
+    with patch("socket.getaddrinfo") as getaddrinfo:
+        getaddrinfo.return_value = [(socket.AF_INET, 1, 6, "", ("10.0.0.1", 80))]
+        assert cache.resolve("sms.example.com", 80) == [
+            (socket.AF_INET, ("10.0.0.1", 80))
+        ]
+        cache.resolve("sms.example.com", 80)
+        assert getaddrinfo.call_count == 1
+        cache.ttl = 0
+        cache.clear()
+        cache.resolve("sms.example.com", 80)
+        cache.resolve("sms.example.com", 80)
+        assert getaddrinfo.call_count == 3
+
+
+def make_gateway_section(port, weight=1.0):
+    """Возвращает секцию шлюза, обращающегося к локальному порту."""
+    return {
+        "server_url": f"http://127.0.0.1:{port}",
+        "user": "admin",
+        "password": "admin",
+        "weight": weight,
+    }
+
+
+def get_free_port():
+    """Возвращает номер порта, на котором никто не слушает."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_load_balancer_weights_and_latency():
+    """Проверка выбора шлюза с учётом веса и задержки."""
+    heavy = parse_gateway("heavy", make_gateway_section(1, weight=3))
+    light = parse_gateway("light", make_gateway_section(2))
+    balancer = LoadBalancer([heavy, light])
+    chosen = [balancer.acquire().name for _ in range(8)]
+    assert chosen.count("heavy") == 6
+    assert chosen.count("light") == 2
+    ok = SendResult(0, "1", "2", answer_code="200 OK", latency=0.001)
+    balancer = LoadBalancer([heavy._replace(weight=1.0), light], strategy="latency")
+    slow, fast = balancer.endpoints
+    for endpoint, latency in ((slow, 0.1), (fast, 0.001)):
+        balancer.release(balancer.acquire(), ok)
+        endpoint.latency = latency
+    assert {balancer.acquire().name for _ in range(5)} == {"light"}
+    with pytest.raises(ValueError):
+        LoadBalancer([heavy], strategy="random")
+
+
+def test_load_balancer_ejects_and_reinstates():
+    """Проверка исключения шлюза после ошибок и возврата после проверки."""
+    gateway = MockGateway().start_in_thread()
+    try:
+        first = parse_gateway("first", make_gateway_section(gateway.port))
+        second = parse_gateway("second", make_gateway_section(gateway.port))
+        balancer = LoadBalancer([first, second], eject_after=2, eject_time=60)
+        failed = SendResult(0, "1", "2", error="ConnectionRefusedError")
+        for _ in range(2):
+            endpoint = balancer.acquire()
+            while endpoint.name != "first":
+                balancer.release(endpoint, failed._replace(error="", answer_code="200"))
+                endpoint = balancer.acquire()
+            balancer.release(endpoint, failed)
+        assert balancer.endpoints[0].is_ejected(time.monotonic())
+        assert {balancer.acquire().name for _ in range(4)} == {"second"}
+        balancer.check_health()
+    finally:
+        gateway.stop_thread()
+    assert not balancer.endpoints[0].is_ejected(time.monotonic())
+    assert balancer.endpoints[0].failures == 1
+
+
+@pytest.mark.parametrize("send", [send_bulk, send_bulk_async])
+def test_send_bulk_fails_over_to_healthy_gateway(send):
+    """Проверка балансировки пакетной отправки и обхода недоступного шлюза."""
+    gateway = MockGateway().start_in_thread()
+    try:
+        config = {
+            "test_sms_sender": {
+                "balance": ["primary", "dead"],
+                "eject_after": 2,
+                "retry_attempts": 5,
+                "retry_base_delay": 0.001,
+            },
+            "gateways": {
+                "primary": make_gateway_section(gateway.port),
+                "dead": make_gateway_section(get_free_port()),
+            },
+        }
+        records = [("12345", f"7900000{i:04}", "Hello") for i in range(100)]
+        report = send(records, config)
+    finally:
+        gateway.stop_thread()
+    assert report.sent == 100
+    assert gateway.responses["200"] == 100
+    assert 0 < sum(result.attempts - 1 for result in report.results) < 100
+
+
+def test_read_conf_compiled_cache(tmp_path):
+    """Проверка сохранения разобранной конфигурации между запусками."""
+    config_file = tmp_path / "conf.toml"
+    config_file.write_text("[test_sms_sender]\nserver_url = 'http://a:1'\n")
+    with patch.object(sys, "dont_write_bytecode", False):
+        config = read_conf(str(config_file))
+    compiled = tmp_path / "__pycache__" / "conf.toml.marshal"
+    # в кэше есть логины и пароли: файл доступен только владельцу
+    assert compiled.stat().st_mode & 0o777 == 0o600
+    take_config._conf_cache.clear()
+    with patch("tomllib.load", side_effect=AssertionError):
+        assert read_conf(str(config_file)) == config
+    config_file.write_text("[test_sms_sender]\nserver_url = 'http://bb:2'\n")
+    assert read_conf(str(config_file))["test_sms_sender"]["server_url"] == (
+        "http://bb:2"
+    )
+
+
+def test_single_send_startup_is_lean():
+    """Проверка, что разовая отправка не загружает модули пакетного режима."""
+    loaded = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, main; print(sorted({'asyncio', 'sqlite3', 'tomllib',"
+            " 'multiprocessing', 'log_setup'} & set(sys.modules)))",
+        ],
+        cwd=SCRIPT_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert loaded.strip() == "[]"
+    config = {
+        "test_sms_sender": {"server_url": "http://a:1", "user": "u", "password": "p"},
+        "logging": {"enabled": False},
+    }
+    assert start_logging(config) is None
+
+
+def test_bench_startup():
+    """Проверка бенчмарка времени запуска и отчёта об импортах."""
+    results = run_benchmarks(["startup"], scale=0.01)
+    cases = {result.case: result for result in results}
+    assert cases["import main"].unit == "ms"
+    assert cases["single --help"].value > cases["interpreter"].value > 0
+    assert "main" in [name for name, _, _ in import_time_report(top=100)]
+
+
+def deliver(cache, key):
+    """Отправляет сообщение с ключом через кэш и подтверждает доставку."""
+    state = cache.check(key)
+    if state == NEW:
+        cache.confirm(key)
+    return state
+
+
+def test_idempotency_cache_window_size_and_disk(tmp_path):
+    """Проверка кэша идемпотентности: окно, вытеснение и сохранение на диск."""
+    path = str(tmp_path / "dedup.bin")
+    keys = [get_idempotency_key(f"body {i}".encode()) for i in range(4)]
+    with patch("dedup.time.time", return_value=1000.0):
+        with IdempotencyCache(window=60, max_size=3, path=path) as cache:
+            assert [deliver(cache, key) for key in keys[:2]] == [NEW, NEW]
+            assert deliver(cache, keys[0]) == DELIVERED
+            cache.forget(keys[1])
+            assert deliver(cache, keys[1]) == NEW
+            # отправляемое сообщение не считается доставленным
+            assert cache.check(keys[2]) == NEW
+            assert cache.check(keys[2]) == IN_FLIGHT
+            cache.forget(keys[2])
+            assert cache.check(keys[2]) == NEW
+            assert (cache.hits, cache.misses) == (1, 5)
+    with patch("dedup.time.time", return_value=1030.0):
+        with IdempotencyCache(window=60, max_size=3, path=path) as cache:
+            assert len(cache) == 2
+            assert deliver(cache, keys[1]) == DELIVERED
+            assert [deliver(cache, key) for key in keys[2:]] == [NEW, NEW]
+            assert deliver(cache, keys[0]) == NEW
+            assert len(cache) == 3
+            assert deliver(cache, keys[1]) == NEW
+    with patch("dedup.time.time", return_value=1080.0):
+        with IdempotencyCache(window=60, max_size=3, path=path) as cache:
+            assert len(cache) == 3
+    with patch("dedup.time.time", return_value=1200.0):
+        with IdempotencyCache(window=60, path=path) as cache:
+            assert len(cache) == 0
+
+
+def test_sharded_worker_cache_is_memory_only(tmp_path):
+    """Проверка того, что процесс-обработчик не пишет в файл кэша."""
+    path = tmp_path / "dedup.bin"
+    cache = IdempotencyCache(path=str(path))
+    parent_file = cache._file
+    # так процесс получает кэш при fork: вместе с открытым файлом
+    sender = AsyncSender("127.0.0.1", 1, "", "127.0.0.1:1", dedup=cache)
+    with patch.object(sharded, "_worker_sender", None):
+        sharded._init_worker(sender)
+        assert sharded._worker_sender.dedup is cache
+    key = get_idempotency_key(b"body")
+    assert deliver(cache, key) == NEW
+    assert deliver(cache, key) == DELIVERED
+    assert (cache.path, cache._file) == (None, None)
+    assert path.read_bytes() == b""
+    parent_file.close()
+
+
+def test_idempotency_key_header():
+    """Проверка заголовка Idempotency-Key в запросе и шаблоне."""
+    request = HttpRequest(
+        "YWRtaW46YWRtaW4=",
+        "localhost",
+        "1",
+        "2",
+        "Hi",
+        "/send_sms",
+        "HTTP/1.1",
+        "application/json",
+    )
+    key = get_idempotency_key(request.body_bytes)
+    template = HttpRequestTemplate(
+        "YWRtaW46YWRtaW4=", "localhost", "/send_sms", "HTTP/1.1", "application/json"
+    )
+    data = request.to_bytes(key)
+    assert data == template.to_bytes("1", "2", "Hi", key)
+    assert HttpRequest.from_bytes(data).extra_headers == {"Idempotency-Key": key}
+    assert request.to_bytes() == template.to_bytes("1", "2", "Hi")
+
+
+@pytest.mark.parametrize(
+    "send, options",
+    [
+        (send_bulk, {"pool_size": 1}),
+        (send_bulk, {"pool_size": 4}),
+        (send_bulk_async, {"concurrency": 1}),
+        (send_bulk_async, {"concurrency": 4}),
+    ],
+)
+@pytest.mark.parametrize("error_rate", [0.0, 1.0])
+def test_send_bulk_suppresses_duplicates(send, options, error_rate):
+    """Проверка подавления повторов при пакетной отправке."""
+    gateway = MockGateway(error_rate=error_rate).start_in_thread()
+    try:
+        config = {
+            "test_sms_sender": {
+                "server_url": f"http://127.0.0.1:{gateway.port}",
+                "user": "admin",
+                "password": "admin",
+                "retry_attempts": 1,
+            },
+            "dedup": {"window": 60},
+        }
+        records = [("12345", f"7900000{i % 5:04}", "Hello") for i in range(10)]
+        report = send(records, config, **options)
+    finally:
+        gateway.stop_thread()
+    if error_rate:
+        # неуспешно отправленные сообщения не считаются отправленными,
+        # и копии, ожидавшие их завершения, тоже отправляются
+        assert gateway.requests == 10
+        assert (report.failed, report.duplicates) == (10, 0)
+    else:
+        assert gateway.requests == 5
+        assert (report.sent, report.duplicates, report.failed) == (5, 5, 0)
+        assert sorted(r.recipient for r in report.results if r.duplicate) == [
+            f"7900000{i:04}" for i in range(5)
+        ]
+
+
+@pytest.mark.parametrize(
+    "message, encoding, length, segments",
+    [
+        ("a" * 160, "gsm7", 160, 1),
+        ("a" * 161, "gsm7", 161, 2),
+        ("a" * 307, "gsm7", 307, 3),
+        ("[" * 80, "gsm7", 160, 1),
+        ("€" + "a" * 159, "gsm7", 161, 2),
+        ("я" * 70, "ucs2", 70, 1),
+        ("я" * 71, "ucs2", 71, 2),
+        ("a" * 100 + "я", "ucs2", 101, 2),
+        ("😀" * 35, "ucs2", 70, 1),
+    ],
+)
+def test_segment_info(message, encoding, length, segments):
+    """Проверка подсчёта сегментов SMS с учётом кодировки."""
+    assert get_segment_info(message) == (encoding, length, segments)
+
+
+def test_request_body_utf8():
+    """Проверка тела запроса в UTF-8 и запроса на несколько получателей."""
+    request = HttpRequest(
+        "YWRtaW46YWRtaW4=",
+        "localhost",
+        "1",
+        ["2", "3"],
+        "Привет",
+        "/send_sms",
+        "HTTP/1.1",
+        "application/json",
+    )
+    assert (
+        request.body_bytes
+        == json.dumps(
+            {"sender": "1", "recipient": ["2", "3"], "message": "Привет"},
+            ensure_ascii=False,
+        ).encode()
+    )
+    assert b"\\u" not in request.body_bytes
+    template = HttpRequestTemplate(
+        "YWRtaW46YWRtaW4=", "localhost", "/send_sms", "HTTP/1.1", "application/json"
+    )
+    assert template.to_bytes("1", ["2", "3"], "Привет") == request.to_bytes()
+    assert HttpRequest.from_bytes(request.to_bytes()).body_bytes == request.body_bytes
+    assert MessageBatch([("1", "2", "Привет")]).body_bytes(0) == (
+        HttpRequestTemplate.body_bytes("1", "2", "Привет")
+    )
+
+
+def test_message_grouper():
+    """Проверка объединения получателей и разворачивания результатов."""
+    records = [("1", str(i), "Hi" if i % 2 else "Привет" * 20) for i in range(7)]
+    grouper = MessageGrouper(max_recipients=2, lookahead=4)
+    requests = list(grouper.group(records))
+    assert requests == [
+        ("1", ["0", "2"], "Привет" * 20),
+        ("1", ["1", "3"], "Hi"),
+        ("1", ["4", "6"], "Привет" * 20),
+        ("1", "5", "Hi"),
+    ]
+    results = [
+        message_result
+        for index, (sender, recipient, _) in enumerate(requests)
+        for message_result in grouper.expand(SendResult(index, sender, recipient))
+    ]
+    assert sorted((r.index, r.recipient, r.segments) for r in results) == [
+        (i, str(i), 1 if i % 2 else 2) for i in range(7)
+    ]
+    assert count_segments(message for _, _, message in records) == 11
+    # получатель не повторяется внутри одного запроса
+    assert list(MessageGrouper(max_recipients=3).group([("1", "2", "Hi")] * 2)) == [
+        ("1", "2", "Hi"),
+        ("1", "2", "Hi"),
+    ]
+
+
+@pytest.mark.parametrize("send", [send_bulk, send_bulk_async])
+def test_send_bulk_groups_recipients(send):
+    """Проверка отправки одного сообщения нескольким получателям одним запросом."""
+    gateway = MockGateway().start_in_thread()
+    try:
+        config = {
+            "test_sms_sender": {
+                "server_url": f"http://127.0.0.1:{gateway.port}",
+                "user": "admin",
+                "password": "admin",
+                "max_recipients": 3,
+            }
+        }
+        records = [
+            ("12345", f"7900000{i:04}", "Hello" if i % 2 else "Привет" * 20)
+            for i in range(10)
+        ]
+        report = send(records, config)
+    finally:
+        gateway.stop_thread()
+    assert gateway.requests == 4
+    assert [(r.index, r.recipient) for r in report.results] == [
+        (i, f"7900000{i:04}") for i in range(10)
+    ]
+    assert report.sent == 10
+    assert report.segments == 15
+
+
+@pytest.mark.parametrize(
+    "wrap",
+    [bytes, bytearray, lambda data: memoryview(b"prefix" + data)[6:]],
+    ids=["bytes", "bytearray", "memoryview"],
+)
+def test_http_response_view_is_lazy(wrap):
+    """Проверка ленивого разбора заголовков и JSON тела ответа."""
+    data = (
+        b"HTTP/1.1 200 OK\r\n"
+        b"content-type: application/json\r\n"
+        b"X-Keep-Alive-Hint: none\r\n"
+        b"Keep-Alive: timeout=5\r\n"
+        b"Keep-Alive: max=100\r\n"
+        b"\r\n"
+        b'{"status": "success", "message_id": 12345, "padding": "' + b"x" * 5000 + b'"}'
+    )
+    buffer = wrap(data)
+    view = HttpResponseView(buffer)
+    assert (view.protocol, view.answer_code) == ("HTTP/1.1", "200 OK")
+    assert view._headers is None and view._json is None
+    assert view.keep_alive == "timeout=5, max=100"
+    assert view.header("Content-Type") == "application/json"
+    assert view.connection == ""
+    # тело не копируется: представление ссылается на исходный буфер
+    assert view.body_view.obj is getattr(buffer, "obj", buffer)
+    assert (view.status, view.message_id, view.error) == ("success", "12345", None)
+    full = view.to_response()
+    assert (full.keep_alive, full.body_bytes) == (view.keep_alive, view.body_bytes)
+    assert HttpResponseView(b"HTTP/1.1 500 Error\r\n\r\nnot json").error is None
+
+
+@pytest.mark.parametrize(
+    "data", [b"HTTP/1.1 200 OK\r\nContent-Type: x", b"garbage\r\n\r\n"]
+)
+def test_http_response_view_malformed(data):
+    """Проверка ошибок при разборе строки статуса."""
+    with pytest.raises(ValueError):
+        HttpResponseView(data)
+
+
+def test_send_bulk_retries_do_not_hold_pool_threads():
+    """Проверка, что ожидание повтора не занимает поток пула."""
+    gateway = MockGateway(error_rate=1.0).start_in_thread()
+    try:
+        config = {
+            "test_sms_sender": {
+                "server_url": f"http://127.0.0.1:{gateway.port}",
+                "user": "admin",
+                "password": "admin",
+                "retry_attempts": 2,
+                "retry_base_delay": 0.3,
+            }
+        }
+        with patch("retry.random.uniform", lambda low, high: high):
+            report = send_bulk([("1", str(i), "Hi") for i in range(3)], config, 1)
+    finally:
+        gateway.stop_thread()
+    assert gateway.requests == 6
+    assert [result.attempts for result in report.results] == [2, 2, 2]
+    # три повтора ждут одновременно, а не по очереди в единственном потоке
+    assert report.elapsed < 0.6
+
+
+@pytest.mark.parametrize("send", [send_bulk, send_bulk_async])
+def test_send_bulk_suppresses_duplicates_in_groups(send):
+    """Проверка подавления повторов при объединении получателей."""
+    gateway = MockGateway().start_in_thread()
+    try:
+        config = {
+            "test_sms_sender": {
+                "server_url": f"http://127.0.0.1:{gateway.port}",
+                "user": "admin",
+                "password": "admin",
+                "max_recipients": 10,
+            },
+            "dedup": {"window": 60},
+        }
+        records = [("s", "r1", "hi"), ("s", "r1", "hi"), ("s", "r2", "hi")]
+        report = send(records, config)
+    finally:
+        gateway.stop_thread()
+    assert gateway.requests == 2
+    assert [(r.recipient, r.ok, r.duplicate) for r in report.results] == [
+        ("r1", True, False),
+        ("r1", False, True),
+        ("r2", True, False),
+    ]
+
+
+def test_idempotency_cache_reserve_per_recipient():
+    """Проверка ключей по каждому получателю запроса."""
+    key = get_idempotency_key(HttpRequestTemplate.body_bytes("s", "r1", "hi"))
+    with IdempotencyCache() as cache:
+        assert cache.reserve(("s", "r1", "hi")) == (("s", "r1", "hi"), [key])
+        # копия ещё отправляется: запрос откладывается целиком
+        assert cache.reserve(("s", ["r2", "r1"], "hi")) is None
+        cache.finish([key], True)
+        record, keys = cache.reserve(("s", ["r2", "r1"], "hi"))
+        assert record == ("s", "r2", "hi") and len(keys) == 1
+        cache.finish(keys, False)
+        assert cache.reserve(("s", ["r1"], "hi")) == (("s", ["r1"], "hi"), [])
+        assert (cache.hits, cache.misses) == (2, 2)
+
+
+def test_async_sender_reloads_settings(tmp_path):
+    """Проверка применения изменённого conf.toml работающим отправщиком."""
+    first = MockGateway().start_in_thread()
+    second = MockGateway().start_in_thread()
+    path = tmp_path / "conf.toml"
+
+    def write_conf(port, comment):
+        path.write_text(
+            "[test_sms_sender]\n"
+            f"server_url = 'http://127.0.0.1:{port}'\n"
+            "user = 'admin'\n"
+            "password = 'admin'\n"
+            "reload_interval = 0.01\n"
+            f"# {comment}\n"
+        )
+
+    try:
+        write_conf(first.port, "first")
+        sender = make_async_sender(load_settings(str(path)), concurrency=2)
+        assert asyncio.run(sender.send([("1", "2", "Hi")] * 3)).sent == 3
+        write_conf(second.port, "second gateway")
+        time.sleep(0.02)
+        assert asyncio.run(sender.send([("1", "2", "Hi")] * 3)).sent == 3
+    finally:
+        first.stop_thread()
+        second.stop_thread()
+    assert (first.requests, second.requests) == (3, 3)
+
+
+@pytest.mark.parametrize(
+    "open_socket",
+    [
+        lambda port: connect("localhost", port, 1.0),
+        lambda port: asyncio.run(connect_async("localhost", port)),
+    ],
+)
+def test_connect_forgets_address_after_error(open_socket):
+    """Проверка удаления адреса из кэша DNS после ошибки подключения."""
+    port = get_free_port()
+    with pytest.raises(OSError):
+        open_socket(port)
+    assert ("localhost", port) not in DNS_CACHE._entries
+
+
+def test_async_sender_survives_bad_records():
+    """Проверка работы обработчика после ошибки в обработке записи."""
+
+    async def run():
+        async with MockGateway() as gateway:
+            sender = AsyncSender(
+                "127.0.0.1",
+                gateway.port,
+                "YWRtaW46YWRtaW4=",
+                f"127.0.0.1:{gateway.port}",
+                concurrency=1,
+                controller=AimdController(max_limit=1),
+                dedup=IdempotencyCache(),
+            )
+            # ключ идемпотентности нельзя вычислить для номера не строкой
+            records = [("1", "2", "Hi"), ("1", 3, "Hi"), ("1", "4", "Hi")]
+            return await asyncio.wait_for(sender.send(records), 5)
+
+    report = asyncio.run(run())
+    assert [result.ok for result in report.results] == [True, False, True]
+    assert "int" in report.results[1].error
+
+
+def test_async_sender_closes_connection_on_timeout():
+    """Проверка закрытия нового соединения при таймауте чтения ответа."""
+    writers = []
+    open_connection = asyncio.open_connection
+
+    async def track(*args, **kwargs):
+        conn = await open_connection(*args, **kwargs)
+        writers.append(conn[1])
+        return conn
+
+    async def run():
+        async with MockGateway(latency=Latency("constant", 1.0)) as gateway:
+            sender = AsyncSender(
+                "127.0.0.1",
+                gateway.port,
+                "YWRtaW46YWRtaW4=",
+                f"127.0.0.1:{gateway.port}",
+                concurrency=2,
+                timeout=0.05,
+            )
+            with patch("asyncio.open_connection", track):
+                return await sender.send([("1", "2", "Hi")] * 2)
+
+    report = asyncio.run(run())
+    assert [result.error for result in report.results] == ["TimeoutError"] * 2
+    assert len(writers) == 2
+    assert all(writer.is_closing() for writer in writers)
+
+
+@pytest.mark.parametrize(
+    "open_socket",
+    [
+        lambda port: connect("sms.example.com", port, 1.0),
+        lambda port: asyncio.run(connect_async("sms.example.com", port)),
+    ],
+)
+def test_connect_tries_every_address(keep_alive_server, open_socket):
+    """Проверка подключения по следующему адресу, если первый недоступен."""
+    port = int(keep_alive_server["test_sms_sender"]["server_url"].rsplit(":", 1)[1])
+    # как localhost на хосте с IPv6: первый адрес (::1) сервер не слушает
+    addresses = [
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", get_free_port())),
+        (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("127.0.0.1", port)),
+    ]
+    with patch("socket.getaddrinfo", return_value=addresses):
+        sock = open_socket(port)
+    try:
+        assert sock.getpeername() == ("127.0.0.1", port)
+    finally:
+        sock.close()
+        DNS_CACHE.invalidate("sms.example.com", port)